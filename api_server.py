@@ -1,9 +1,13 @@
 import os
 import sys
-import json
+import atexit
+import threading
+import uuid
 from datetime import datetime
 from flask import Flask, jsonify, request, send_from_directory
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+from werkzeug.utils import secure_filename
 
 # 添加项目根目录到Python路径
 project_root = os.path.dirname(os.path.abspath(__file__))
@@ -11,86 +15,658 @@ sys.path.insert(0, project_root)
 
 from modules.config_manager import ConfigManager
 from modules.price_fetcher import PriceFetcher
-from modules.data_processor import DataProcessor
+from modules.data_processor import DataProcessor, fund_asset, is_fund_code, FUND_ASSET_PREFIX
 from modules.logger import logger_instance
 from modules.exchange_rate_manager import ExchangeRateManager
+from modules.conversion_validation import ConversionValidator, DEFAULT_RATES, MAX_SAMPLES, MAX_BENCHMARK_SIZE
 from modules.display import DisplayFormatter
+from modules.email_notifier import EmailNotifier
+from modules.quote_models import FundError, records_to_dict, format_timestamp
+from modules import json_codec
+from modules.compression import CachedPayload, compress, is_compressible, negotiate_encoding, MIN_COMPRESS_SIZE
+from modules.static_assets import StaticAssetStore
+from modules.history_store import HistoryStore
+from modules.columnar_history import ColumnarHistory, RECORD_FORMAT, RECORD_FIELDS
+from modules.retention import RetentionEngine, RetentionPolicy
+from modules.history_export import EXPORT_MIMETYPES, export_stream
+from modules.history_import import HistoryImporter, ImportJobs, IMPORT_FORMATS, detect_format, normalize_asset
+from modules.rate_governor import RateGovernor
+from modules.subscriptions import UserWatchlists
+from modules.market_feed import FeedConsumer, FeedReader, DEFAULT_STALE_AFTER
+
+
+IMPORT_DIR = os.path.join('data', 'imports')
+
+
+class InvalidArgument(ValueError):
+    pass
+
+
+def parse_time_arg(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise InvalidArgument(f'时间参数格式错误: {value}，应为时间戳或 ISO 8601 格式')
+
+
+class FastJSONProvider(JSONProvider):
+    mimetype = 'application/json'
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return json_codec.dumps(obj).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return json_codec.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(json_codec.dumps(obj), mimetype=self.mimetype)
 
 
 class MarketAPIServer:
     def __init__(self, host=None, port=None):
         self.app = Flask(__name__)
-        self.app.config['JSON_AS_ASCII'] = False
+        self.app.json = FastJSONProvider(self.app)
         CORS(self.app)
         
+        self.snapshot_cache = json_codec.SnapshotCache()
+        
         @self.app.after_request
-        def add_headers(response):
-            if request.path.endswith('.js'):
-                response.headers['Content-Type'] = 'application/javascript'
-            elif request.path.endswith('.json'):
-                response.headers['Content-Type'] = 'application/manifest+json'
+        def compress_response(response):
+            if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                    or 'Content-Encoding' in response.headers or not is_compressible(response.mimetype)):
+                return response
+            
+            data = response.get_data()
+            if len(data) < MIN_COMPRESS_SIZE:
+                return response
+            
+            response.vary.add('Accept-Encoding')
+            encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+            if encoding:
+                response.set_data(compress(data, encoding))
+                response.headers['Content-Encoding'] = encoding
             return response
         
         self.host = host or os.getenv('HOST', '0.0.0.0')
         self.port = port or int(os.getenv('PORT', '5000'))
+        self.logger = logger_instance
+        
+        self._components = {}
+        self._components_lock = threading.RLock()
         
-        self._setup_directories()
-        self._init_components()
         self._setup_routes()
     
     def _setup_directories(self):
-        directories = ['logs', 'data', 'config', 'frontend', 'mobile-app']
-        for directory in directories:
-            if not os.path.exists(directory):
-                os.makedirs(directory)
+        for directory in ('logs', 'data', 'config'):
+            os.makedirs(directory, exist_ok=True)
     
-    def _init_components(self):
+    def _component(self, name, factory):
+        component = self._components.get(name)
+        if component is None:
+            with self._components_lock:
+                component = self._components.get(name)
+                if component is None:
+                    component = factory()
+                    self._components[name] = component
+        return component
+    
+    def _create_config_manager(self):
         config_path = os.path.join('config', 'config.ini')
         fund_list_path = os.path.join('config', 'fund_list.txt')
         email_list_path = os.path.join('config', 'email_list.txt')
+        config_manager = ConfigManager(config_path, fund_list_path, email_list_path, self.logger)
+        config_manager.subscribe(self._on_config_change)
+        config_manager.start_file_watcher()
+        return config_manager
+    
+    def _on_config_change(self, snapshot, changed):
+        # 各组件在创建时读取配置，新版本发布后通知所有已创建且支持热更新的组件
+        for name, component in list(self._components.items()):
+            apply_config = getattr(component, 'apply_config', None)
+            if apply_config is None:
+                continue
+            try:
+                apply_config(snapshot, changed)
+            except Exception as e:
+                self.logger.log_error(f'组件 {name} 应用新配置失败: {str(e)}')
+    
+    def _create_history_store(self):
+        db_path = self.config.get('storage', 'history_db', fallback=os.path.join('data', 'market_history.db'))
+        store = HistoryStore(db_path, self.logger)
+        self.logger.attach_store(store)
+        return store
+    
+    def _create_columnar_history(self):
+        directory = self.config.get('storage', 'columnar_dir', fallback=os.path.join('data', 'columns'))
+        if not directory:
+            return None
+        return ColumnarHistory(directory, self.logger)
+    
+    def _create_data_processor(self):
+        store = self.history_store
+        columnar = self._component('columnar_history', self._create_columnar_history)
+        retention = RetentionEngine(store, RetentionPolicy.from_config(self.config), columnar, self.logger)
+        data_processor = DataProcessor(self.logger, store, columnar, retention)
+        history_file = os.path.join('data', 'price_history.json')
         
-        self.config_manager = ConfigManager(config_path, fund_list_path, email_list_path, logger_instance)
-        self.config = self.config_manager.get_config()
+        if not store.is_empty():
+            data_processor.load_history_from_store()
+            if columnar and columnar.is_empty():
+                columnar.rebuild_from_store(store)
+        elif os.path.exists(history_file):
+            data_processor.load_history_from_file(history_file)
+            data_processor.sync_history_to_store()
         
-        self.price_fetcher = PriceFetcher(self.config)
-        self.data_processor = DataProcessor(logger_instance)
+        # 启用独立采集进程时由它负责降采样，否则在后台线程执行，不占用请求线程
+        if not self.config.getboolean('collector', 'enabled', fallback=False):
+            retention.start()
+        return data_processor
+    
+    def _create_exchange_rate_manager(self):
+        exchange_rate_manager = ExchangeRateManager.from_config(self.config, self.logger, self.history_store,
+                                                                self.rate_governor)
+        DisplayFormatter.set_exchange_rate_manager(exchange_rate_manager)
+        return exchange_rate_manager
+    
+    @property
+    def config_manager(self) -> ConfigManager:
+        return self._component('config_manager', self._create_config_manager)
+    
+    @property
+    def config(self):
+        return self.config_manager.get_config()
+    
+    @property
+    def price_fetcher(self) -> PriceFetcher:
+        return self._component('price_fetcher', lambda: PriceFetcher(self.config, self.rate_governor))
+    
+    @property
+    def email_notifier(self) -> EmailNotifier:
+        return self._component('email_notifier', lambda: EmailNotifier(self.config, self.logger))
+    
+    @property
+    def rate_governor(self) -> RateGovernor:
+        return self._component('rate_governor', lambda: RateGovernor.from_config(self.config, self.logger))
+    
+    def _create_market_feed(self):
+        reader = None
+        if self.config.getboolean('collector', 'enabled', fallback=False):
+            reader = FeedReader(
+                self.config.get('collector', 'feed_dir', fallback=None) or None,
+                self.config.getfloat('collector', 'stale_after', fallback=DEFAULT_STALE_AFTER)
+            )
+        return FeedConsumer(reader, self.data_processor, self.logger)
+    
+    @property
+    def market_feed(self) -> FeedConsumer:
+        return self._component('market_feed', self._create_market_feed)
+    
+    def _metal_quotes(self):
+        # 启用独立采集进程后只读取它发布的快照；采集进程停止心跳时退回到本进程直接抓取
+        published = self.market_feed.latest('metals')
+        if published is not None:
+            return published
+        return self.data_processor.process_gold_silver_data(self.price_fetcher.fetch_gold_silver_prices())
+    
+    def _fund_quotes(self, fund_codes):
+        published = self.market_feed.latest('funds')
+        if published is None:
+            return self.data_processor.process_fund_data(self.price_fetcher.fetch_multiple_funds(fund_codes))
         
-        history_file = os.path.join('data', 'price_history.json')
-        if os.path.exists(history_file):
-            self.data_processor.load_history_from_file(history_file)
+        missing = [code for code in fund_codes if code not in published]
+        if missing:
+            # 上游抓取只在采集进程中进行，快照里没有的基金交给它补抓，本次先返回占位
+            self.market_feed.request(missing)
+        return {code: published.get(code) or FundError(code, '基金数据采集中，请稍后刷新') for code in fund_codes}
+    
+    @property
+    def watchlists(self) -> UserWatchlists:
+        return self._component('watchlists', lambda: UserWatchlists.from_config(self.config, self.logger))
+    
+    def poll_fund_codes(self):
+        # 需要轮询的基金 = 全局列表与所有用户自选的并集，同一基金无论多少人关注只请求一次
+        return sorted(self.config_manager.fund_codes | set(self.watchlists.poll_codes()))
+    
+    @property
+    def history_store(self) -> HistoryStore:
+        return self._component('history_store', self._create_history_store)
+    
+    @property
+    def data_processor(self) -> DataProcessor:
+        return self._component('data_processor', self._create_data_processor)
+    
+    @property
+    def exchange_rate_manager(self) -> ExchangeRateManager:
+        return self._component('exchange_rate_manager', self._create_exchange_rate_manager)
+    
+    @property
+    def import_jobs(self) -> ImportJobs:
+        return self._component('import_jobs', lambda: ImportJobs(os.path.join(IMPORT_DIR, 'jobs'), self.logger))
+    
+    def _run_import(self, path, input_format, asset, progress):
+        try:
+            data_processor = self.data_processor
+            importer = HistoryImporter(self.history_store, self.logger, data_processor.columnar)
+            stats = importer.import_file(path, input_format, asset, progress=progress,
+                                         checkpoint_dir=os.path.join(IMPORT_DIR, 'checkpoints'))
+            if data_processor.retention:
+                data_processor.retention.run()
+            data_processor.load_history_from_store()
+            return stats
+        finally:
+            os.remove(path)
+    
+    @property
+    def static_assets(self) -> StaticAssetStore:
+        return self._component('static_assets', lambda: StaticAssetStore('frontend', self.logger).load())
+    
+    def preload(self):
+        # 在 fork 之前加载只读状态，子进程通过写时复制共享；网络会话在 fork 之后按需创建
+        self.config_manager
+        self.data_processor
+        self.exchange_rate_manager
+        self.static_assets
+        self.price_fetcher
+        self.logger.log_info('应用状态预加载完成')
+    
+    def after_fork(self):
+        self._components_lock = threading.RLock()
+        config_manager = self._components.get('config_manager')
+        if config_manager:
+            config_manager.after_fork()
+        rate_governor = self._components.get('rate_governor')
+        if rate_governor:
+            rate_governor.after_fork()
+        price_fetcher = self._components.get('price_fetcher')
+        if price_fetcher:
+            price_fetcher.reset_session()
+        exchange_rate_manager = self._components.get('exchange_rate_manager')
+        if exchange_rate_manager:
+            exchange_rate_manager.after_fork()
+        watchlists = self._components.get('watchlists')
+        if watchlists:
+            watchlists.after_fork()
+        import_jobs = self._components.get('import_jobs')
+        if import_jobs:
+            import_jobs.after_fork()
+        market_feed = self._components.get('market_feed')
+        if market_feed:
+            market_feed.after_fork()
+        history_store = self._components.get('history_store')
+        if history_store:
+            history_store.after_fork()
+        columnar_history = self._components.get('columnar_history')
+        if columnar_history:
+            columnar_history.after_fork()
+        data_processor = self._components.get('data_processor')
+        if data_processor and data_processor.retention:
+            data_processor.retention.after_fork()
+        self.snapshot_cache = json_codec.SnapshotCache()
+    
+    def shutdown(self):
+        data_processor = self._components.get('data_processor')
+        if data_processor and data_processor.retention:
+            data_processor.retention.stop()
+        if 'import_jobs' in self._components:
+            self.import_jobs.shutdown()
+        if 'price_fetcher' in self._components:
+            self.price_fetcher.close()
+        if 'history_store' in self._components:
+            self.history_store.close()
+    
+    def _request_user(self):
+        return request.headers.get('X-User-Id') or request.args.get('user')
+    
+    def _history_range_args(self, args):
+        start = parse_time_arg(args.get('from'))
+        end = parse_time_arg(args.get('to'))
+        limit = args.get('limit', type=int)
+        return start, end, limit
+    
+    def _binary_series_response(self, asset, start, end, limit):
+        columnar = self.data_processor.columnar
+        if not columnar or not columnar.has_series(asset):
+            return jsonify({
+                'success': False,
+                'error': '该资产没有列式历史数据',
+                'timestamp': datetime.now().isoformat()
+            }), 404
         
-        self.exchange_rate_manager = ExchangeRateManager(logger_instance)
-        DisplayFormatter.set_exchange_rate_manager(self.exchange_rate_manager)
+        view = columnar.series(asset).slice(start, end, limit)
+        response = self.app.response_class(view.tobytes(), mimetype='application/octet-stream')
+        response.headers['X-Record-Format'] = RECORD_FORMAT
+        response.headers['X-Record-Fields'] = ','.join(RECORD_FIELDS)
+        return response
+    
+    def _columns_result(self, asset, value_key, start, end, limit):
+        columns = self.data_processor.query_columns(asset, start, end, limit)
+        columns[value_key] = columns.pop('value')
+        return {
+            'success': True,
+            'data': columns,
+            'timestamp': datetime.now().isoformat()
+        }, 200
+    
+    def _converted_history_result(self, asset_type, currency, output_format, start, end, limit):
+        if output_format not in ('json', 'columns'):
+            return {
+                'success': False,
+                'error': '货币换算仅支持 json 或 columns 格式',
+                'timestamp': datetime.now().isoformat()
+            }, 400
         
-        self.logger = logger_instance
+        if start is not None or end is not None or limit:
+            columns = self.data_processor.query_columns(asset_type, start, end, limit)
+        else:
+            columns = self.data_processor.history_columns(asset_type)
+        # 每个点按其时间对应的历史汇率换算，整条序列一次完成
+        try:
+            columns['price'], columns['fx_rate'] = self.exchange_rate_manager.convert_series(
+                columns['timestamp'], columns.pop('value'), currency[:-len('_gram')]
+            )
+        except ValueError as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }, 400
+        
+        if output_format == 'columns':
+            data = columns
+        else:
+            data = [
+                {'price': price, 'fx_rate': fx_rate, 'change_percent': change_percent, 'timestamp': format_timestamp(ts)}
+                for ts, price, fx_rate, change_percent in zip(columns['timestamp'], columns['price'],
+                                                              columns['fx_rate'], columns['change_percent'])
+            ]
+        return {
+            'success': True,
+            'data': data,
+            'currency': currency,
+            'timestamp': datetime.now().isoformat()
+        }, 200
+    
+    # 以下 *_result 方法返回 (响应体, 状态码)，Flask 路由与 ASGI 原生路由共用同一份逻辑；
+    # 响应体为 CachedPayload 时直接输出预编码的快照
+    def history_result(self, asset_type, args):
+        if asset_type not in ('gold', 'silver', 'funds'):
+            return {
+                'success': False,
+                'error': '无效的资源类型'
+            }, 400
+        
+        currency = args.get('currency') or 'usd_oz'
+        if currency != 'usd_oz' and (not currency.endswith('_gram') or asset_type == 'funds'):
+            return {
+                'success': False,
+                'error': f'不支持的货币单位: {currency}',
+                'timestamp': datetime.now().isoformat()
+            }, 400
+        
+        try:
+            self.market_feed.sync()
+            start, end, limit = self._history_range_args(args)
+            output_format = args.get('format', 'json')
+            if currency != 'usd_oz':
+                return self._converted_history_result(asset_type, currency, output_format, start, end, limit)
+            if asset_type != 'funds' and output_format == 'columns':
+                return self._columns_result(asset_type, 'price', start, end, limit)
+            
+            if start is not None or end is not None or limit:
+                return {
+                    'success': True,
+                    'data': self.data_processor.query_history(asset_type, start, end, limit),
+                    'timestamp': datetime.now().isoformat()
+                }, 200
+        except InvalidArgument as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }, 400
+        
+        return self._snapshot_payload(
+            ('history', asset_type),
+            self.data_processor.history_version(asset_type),
+            lambda: self.data_processor.history_to_dict(asset_type)
+        ), 200
+    
+    def fund_history_result(self, fund_code, args):
+        try:
+            self.market_feed.sync()
+            start, end, limit = self._history_range_args(args)
+            if args.get('format', 'json') == 'columns':
+                return self._columns_result(fund_asset(fund_code), 'estimated_value', start, end, limit)
+            
+            if start is not None or end is not None or limit:
+                return {
+                    'success': True,
+                    'data': self.data_processor.query_fund_history(fund_code, start, end, limit),
+                    'timestamp': datetime.now().isoformat()
+                }, 200
+        except InvalidArgument as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }, 400
+        
+        return self._snapshot_payload(
+            ('fund-history', fund_code),
+            self.data_processor.history_version(fund_asset(fund_code)),
+            lambda: self.data_processor.fund_history_to_dict(fund_code)
+        ), 200
+    
+    def fund_codes_result(self):
+        return {
+            'success': True,
+            'data': self.config_manager.get_fund_codes(),
+            'timestamp': datetime.now().isoformat()
+        }, 200
+    
+    def alert_config_result(self):
+        config = {
+            'gold_threshold': self.config.getfloat('gold', 'price_threshold_gold'),
+            'silver_threshold': self.config.getfloat('gold', 'price_threshold_silver'),
+            'fund_threshold': self.config.getfloat('fund', 'change_percent_threshold'),
+            'enable_gold_monitor': self.config.getboolean('gold', 'enable_monitor'),
+            'enable_fund_monitor': self.config.getboolean('fund', 'enable_monitor'),
+            'alert_cooldown': self.config.getint('gold', 'alert_cooldown_minutes'),
+            'recipients': self.config_manager.get_email_list()
+        }
+        return {
+            'success': True,
+            'data': config,
+            'timestamp': datetime.now().isoformat()
+        }, 200
+    
+    def alert_history_result(self, args):
+        hours = args.get('hours', 24, type=int)
+        history = self.logger.get_alert_history(hours)
+        return {
+            'success': True,
+            'data': history,
+            'count': len(history),
+            'timestamp': datetime.now().isoformat()
+        }, 200
+    
+    def exchange_rate_result(self, args):
+        force_refresh = args.get('refresh', 'false').lower() == 'true'
+        base = args.get('base', 'USD').upper()
+        quote = args.get('quote', 'CNY').upper()
+        try:
+            rate = self.exchange_rate_manager.cross_rate(base, quote, force_refresh)
+        except ValueError as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }, 400
+        rate_info = self.exchange_rate_manager.get_rate_info()
+        
+        return {
+            'success': True,
+            'data': {
+                'pair': f'{base}/{quote}',
+                'rate': rate,
+                'info': rate_info
+            },
+            'timestamp': datetime.now().isoformat()
+        }, 200
+    
+    def exchange_rates_result(self, args):
+        base = args.get('base', 'USD').upper()
+        rates = self.exchange_rate_manager.get_rates()
+        if base not in rates:
+            return {
+                'success': False,
+                'error': f'不支持的货币: {base}',
+                'timestamp': datetime.now().isoformat()
+            }, 400
+        
+        base_rate = rates[base]
+        return {
+            'success': True,
+            'data': {
+                'base': base,
+                'rates': {code: rate / base_rate for code, rate in rates.items()},
+                'info': self.exchange_rate_manager.get_rate_info()
+            },
+            'timestamp': datetime.now().isoformat()
+        }, 200
+    
+    def convert_result(self, args):
+        price = args.get('price', type=float)
+        direction = args.get('direction', 'usd_oz_to_cny_gram')
+        
+        if price is None:
+            return {
+                'success': False,
+                'error': '缺少价格参数',
+                'timestamp': datetime.now().isoformat()
+            }, 400
+        
+        base = args.get('from')
+        quote = args.get('to')
+        if base or quote:
+            base, quote = (base or 'USD').upper(), (quote or 'CNY').upper()
+            try:
+                result = self.exchange_rate_manager.convert_amount(price, base, quote)
+            except ValueError as e:
+                return {
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }, 400
+            return {
+                'success': True,
+                'data': {
+                    'input': price,
+                    'output': result,
+                    'pair': f'{base}/{quote}',
+                    'rate': self.exchange_rate_manager.cross_rate(base, quote)
+                },
+                'timestamp': datetime.now().isoformat()
+            }, 200
+        
+        if direction == 'usd_oz_to_cny_gram':
+            result = self.exchange_rate_manager.convert_usd_oz_to_cny_gram(price)
+        elif direction == 'cny_gram_to_usd_oz':
+            result = self.exchange_rate_manager.convert_cny_gram_to_usd_oz(price)
+        else:
+            return {
+                'success': False,
+                'error': f'不支持的转换方向: {direction}',
+                'timestamp': datetime.now().isoformat()
+            }, 400
+        
+        rate_info = self.exchange_rate_manager.get_rate_info()
+        
+        return {
+            'success': True,
+            'data': {
+                'input': price,
+                'output': result,
+                'direction': direction,
+                'exchange_rate': rate_info
+            },
+            'timestamp': datetime.now().isoformat()
+        }, 200
+    
+    def _result_response(self, result):
+        payload, status = result
+        if isinstance(payload, CachedPayload):
+            return self._payload_response(payload)
+        return jsonify(payload), status
+    
+    def _payload_response(self, payload: CachedPayload):
+        body, encoding = payload.select(request.headers.get('Accept-Encoding'))
+        response = self.app.response_class(body, mimetype=payload.mimetype)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if payload.compressible:
+            response.vary.add('Accept-Encoding')
+        return response
+    
+    def _snapshot_payload(self, key, version, build) -> CachedPayload:
+        return self.snapshot_cache.get(key, version, lambda: CachedPayload(
+            json_codec.encode_envelope(json_codec.dumps(build()), success=True, timestamp=datetime.now().isoformat()),
+            'application/json'
+        ))
+    
+    def _static_response(self, filename):
+        asset = self.static_assets.get(filename)
+        if asset is None:
+            return send_from_directory('frontend', filename)
+        
+        body, encoding = asset.payload.select(request.headers.get('Accept-Encoding'))
+        etag = f'{asset.etag}-{encoding}' if encoding else asset.etag
+        
+        if request.if_none_match.contains(etag):
+            response = self.app.response_class(status=304)
+        else:
+            response = self.app.response_class(body, mimetype=asset.payload.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = asset.cache_control
+        if asset.payload.compressible:
+            response.vary.add('Accept-Encoding')
+        return response
     
     def _setup_routes(self):
         @self.app.route('/')
         def index():
-            return send_from_directory('frontend', 'index.html')
+            return self._static_response('index.html')
         
         @self.app.route('/<path:filename>')
         def serve_static(filename):
-            return send_from_directory('frontend', filename)
+            return self._static_response(filename)
         
         @self.app.route('/manifest.json')
         def serve_manifest():
-            manifest_path = os.path.join('frontend', 'manifest.json')
-            return send_from_directory('frontend', 'manifest.json')
+            return self._static_response('manifest.json')
         
         @self.app.route('/sw.js')
         def serve_sw():
-            return send_from_directory('frontend', 'sw.js')
+            return self._static_response('sw.js')
         
         # Market Data APIs
         @self.app.route('/api/market/precious-metals')
         def get_precious_metals():
             try:
-                raw_data = self.price_fetcher.fetch_gold_silver_prices()
-                processed = self.data_processor.process_gold_silver_data(raw_data)
+                processed = self._metal_quotes()
                 return jsonify({
                     'success': True,
-                    'data': processed,
+                    'data': records_to_dict(processed),
                     'timestamp': datetime.now().isoformat()
                 })
             except Exception as e:
@@ -103,7 +679,11 @@ class MarketAPIServer:
         @self.app.route('/api/market/funds')
         def get_funds():
             try:
-                fund_codes = self.config_manager.get_fund_codes()
+                user_id = self._request_user()
+                if user_id:
+                    fund_codes = self.watchlists.get(user_id)
+                else:
+                    fund_codes = self.config_manager.get_fund_codes()
                 if not fund_codes:
                     return jsonify({
                         'success': True,
@@ -112,12 +692,26 @@ class MarketAPIServer:
                         'timestamp': datetime.now().isoformat()
                     })
                 
-                raw_data = self.price_fetcher.fetch_multiple_funds(fund_codes)
-                processed = self.data_processor.process_fund_data(raw_data)
+                processed = self._fund_quotes(fund_codes)
                 
                 return jsonify({
                     'success': True,
-                    'data': processed,
+                    'data': records_to_dict(processed),
+                    'timestamp': datetime.now().isoformat()
+                })
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 500
+        
+        @self.app.route('/api/market/schedule')
+        def get_market_schedule():
+            try:
+                return jsonify({
+                    'success': True,
+                    'data': self.price_fetcher.scheduler.status(),
                     'timestamp': datetime.now().isoformat()
                 })
             except Exception as e:
@@ -130,25 +724,81 @@ class MarketAPIServer:
         @self.app.route('/api/market/history/<asset_type>')
         def get_history(asset_type):
             try:
-                history = self.data_processor.price_history
+                if (asset_type in ('gold', 'silver') and request.args.get('format') == 'binary'
+                        and (request.args.get('currency') or 'usd_oz') == 'usd_oz'):
+                    self.market_feed.sync()
+                    return self._binary_series_response(asset_type, *self._history_range_args(request.args))
+                return self._result_response(self.history_result(asset_type, request.args))
+            except InvalidArgument as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 400
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 500
+        
+        @self.app.route('/api/market/fund-history/<fund_code>')
+        def get_fund_history(fund_code):
+            try:
+                if request.args.get('format') == 'binary':
+                    self.market_feed.sync()
+                    return self._binary_series_response(fund_asset(fund_code), *self._history_range_args(request.args))
+                return self._result_response(self.fund_history_result(fund_code, request.args))
+            except InvalidArgument as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 400
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 500
+        
+        @self.app.route('/api/export/<asset>')
+        def export_history(asset):
+            try:
+                output_format = request.args.get('format', 'csv')
+                if output_format not in EXPORT_MIMETYPES:
+                    return jsonify({
+                        'success': False,
+                        'error': '导出格式仅支持 csv 或 ndjson',
+                        'timestamp': datetime.now().isoformat()
+                    }), 400
                 
-                if asset_type == 'gold':
-                    data = history.get('gold', [])
-                elif asset_type == 'silver':
-                    data = history.get('silver', [])
-                elif asset_type == 'funds':
-                    data = history.get('funds', {})
+                store = self.history_store
+                if asset == 'funds':
+                    assets = store.list_assets(FUND_ASSET_PREFIX)
+                elif asset in ('gold', 'silver'):
+                    assets = [asset]
+                elif is_fund_code(asset):
+                    assets = [fund_asset(asset)]
                 else:
                     return jsonify({
                         'success': False,
-                        'error': '无效的资源类型'
+                        'error': f'未知的资产: {asset}，应为 gold、silver、funds 或 6 位基金代码',
+                        'timestamp': datetime.now().isoformat()
                     }), 400
                 
+                start, end, _ = self._history_range_args(request.args)
+                stream = export_stream(store, assets, output_format, start, end)
+                response = self.app.response_class(stream, mimetype=EXPORT_MIMETYPES[output_format])
+                filename = secure_filename(f'{asset}_history.{output_format}')
+                response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+                return response
+            except InvalidArgument as e:
                 return jsonify({
-                    'success': True,
-                    'data': data,
+                    'success': False,
+                    'error': str(e),
                     'timestamp': datetime.now().isoformat()
-                })
+                }), 400
             except Exception as e:
                 return jsonify({
                     'success': False,
@@ -156,15 +806,63 @@ class MarketAPIServer:
                     'timestamp': datetime.now().isoformat()
                 }), 500
         
-        @self.app.route('/api/market/fund-history/<fund_code>')
-        def get_fund_history(fund_code):
+        @self.app.route('/api/history/import', methods=['POST'])
+        def import_history():
             try:
-                history = self.data_processor.price_history
-                fund_history = history.get('funds', {}).get(fund_code, [])
+                upload = request.files.get('file')
+                if upload is None or not upload.filename:
+                    return jsonify({
+                        'success': False,
+                        'error': '请上传 CSV 或 NDJSON 文件',
+                        'timestamp': datetime.now().isoformat()
+                    }), 400
+                
+                input_format = request.form.get('format') or detect_format(upload.filename)
+                if input_format not in IMPORT_FORMATS.values():
+                    raise ValueError(f'不支持的导入格式: {input_format}')
+                asset = request.form.get('asset') or None
+                if asset:
+                    normalize_asset(asset)
+                
+                # 每次上传保存为独立文件，并发上传同名文件互不覆盖；断点按文件内容哈希识别
+                os.makedirs(IMPORT_DIR, exist_ok=True)
+                path = os.path.join(IMPORT_DIR, f'{uuid.uuid4().hex}_{secure_filename(upload.filename) or "upload"}')
+                upload.save(path)
                 
+                job = self.import_jobs.submit(
+                    upload.filename, lambda progress: self._run_import(path, input_format, asset, progress)
+                )
+                return jsonify({
+                    'success': True,
+                    'data': job,
+                    'timestamp': datetime.now().isoformat()
+                }), 202
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 400
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 500
+        
+        @self.app.route('/api/history/import/<job_id>')
+        def get_import_job(job_id):
+            try:
+                job = self.import_jobs.get(job_id)
+                if job is None:
+                    return jsonify({
+                        'success': False,
+                        'error': '导入任务不存在',
+                        'timestamp': datetime.now().isoformat()
+                    }), 404
                 return jsonify({
                     'success': True,
-                    'data': fund_history,
+                    'data': job,
                     'timestamp': datetime.now().isoformat()
                 })
             except Exception as e:
@@ -177,13 +875,12 @@ class MarketAPIServer:
         @self.app.route('/api/market/fund/<fund_code>')
         def get_single_fund(fund_code):
             try:
-                raw_data = self.price_fetcher.fetch_multiple_funds([fund_code])
-                processed = self.data_processor.process_fund_data(raw_data)
+                processed = self._fund_quotes([fund_code])
                 
                 if fund_code in processed:
                     return jsonify({
                         'success': True,
-                        'data': processed[fund_code],
+                        'data': processed[fund_code].to_dict(),
                         'timestamp': datetime.now().isoformat()
                     })
                 else:
@@ -203,12 +900,7 @@ class MarketAPIServer:
         @self.app.route('/api/config/funds')
         def get_fund_codes():
             try:
-                fund_codes = self.config_manager.get_fund_codes()
-                return jsonify({
-                    'success': True,
-                    'data': fund_codes,
-                    'timestamp': datetime.now().isoformat()
-                })
+                return self._result_response(self.fund_codes_result())
             except Exception as e:
                 return jsonify({
                     'success': False,
@@ -227,6 +919,12 @@ class MarketAPIServer:
                         'success': False,
                         'error': '基金代码不能为空'
                     }), 400
+                if not is_fund_code(fund_code):
+                    return jsonify({
+                        'success': False,
+                        'error': f'基金代码格式不正确: {fund_code}，应为 6 位数字',
+                        'timestamp': datetime.now().isoformat()
+                    }), 400
                 
                 success = self.config_manager.add_fund_code(fund_code)
                 
@@ -249,15 +947,78 @@ class MarketAPIServer:
                     'timestamp': datetime.now().isoformat()
                 }), 500
         
+        @self.app.route('/api/config/funds/batch', methods=['POST'])
+        def update_fund_codes():
+            try:
+                data = request.get_json() or {}
+                added, removed = self.config_manager.update_fund_codes(data.get('add') or [], data.get('remove') or [])
+                return jsonify({
+                    'success': True,
+                    'data': {
+                        'added': added,
+                        'removed': removed,
+                        'count': len(self.config_manager.fund_codes)
+                    },
+                    'timestamp': datetime.now().isoformat()
+                })
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 400
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 500
+        
         @self.app.route('/api/config/funds/<fund_code>', methods=['DELETE'])
         def delete_fund_code(fund_code):
             try:
-                # 暂未实现删除功能，返回成功消息
+                if fund_code not in self.config_manager.fund_codes:
+                    return jsonify({
+                        'success': False,
+                        'error': f'基金代码 {fund_code} 不存在',
+                        'timestamp': datetime.now().isoformat()
+                    }), 404
+                
+                success = self.config_manager.remove_fund_code(fund_code)
+                
+                if success:
+                    return jsonify({
+                        'success': True,
+                        'message': f'基金代码 {fund_code} 删除成功',
+                        'timestamp': datetime.now().isoformat()
+                    })
+                else:
+                    return jsonify({
+                        'success': False,
+                        'error': '基金代码删除失败',
+                        'timestamp': datetime.now().isoformat()
+                    }), 500
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 500
+        
+        @self.app.route('/api/watchlist')
+        def get_watchlist():
+            try:
                 return jsonify({
                     'success': True,
-                    'message': f'基金代码 {fund_code} 删除功能待实现',
+                    'data': self.watchlists.get(self._request_user()),
                     'timestamp': datetime.now().isoformat()
                 })
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 400
             except Exception as e:
                 return jsonify({
                     'success': False,
@@ -265,24 +1026,56 @@ class MarketAPIServer:
                     'timestamp': datetime.now().isoformat()
                 }), 500
         
-        # Alert Configuration APIs
-        @self.app.route('/api/alert/config')
-        def get_alert_config():
+        @self.app.route('/api/watchlist', methods=['POST'])
+        def update_watchlist():
             try:
-                config = {
-                    'gold_threshold': self.config.getfloat('gold', 'price_threshold_gold'),
-                    'silver_threshold': self.config.getfloat('gold', 'price_threshold_silver'),
-                    'fund_threshold': self.config.getfloat('fund', 'change_percent_threshold'),
-                    'enable_gold_monitor': self.config.getboolean('gold', 'enable_monitor'),
-                    'enable_fund_monitor': self.config.getboolean('fund', 'enable_monitor'),
-                    'alert_cooldown': self.config.getint('gold', 'alert_cooldown_minutes'),
-                    'recipients': self.config_manager.get_email_list()
-                }
+                user_id = self._request_user()
+                data = request.get_json() or {}
+                added, removed = self.watchlists.update(user_id, data.get('add') or [], data.get('remove') or [])
                 return jsonify({
                     'success': True,
-                    'data': config,
+                    'data': {
+                        'added': added,
+                        'removed': removed,
+                        'codes': self.watchlists.get(user_id)
+                    },
                     'timestamp': datetime.now().isoformat()
                 })
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 400
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 500
+        
+        @self.app.route('/api/watchlist/stats')
+        def get_watchlist_stats():
+            try:
+                stats = self.watchlists.stats()
+                stats['poll_set_size'] = len(self.poll_fund_codes())
+                return jsonify({
+                    'success': True,
+                    'data': stats,
+                    'timestamp': datetime.now().isoformat()
+                })
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 500
+        
+        # Alert Configuration APIs
+        @self.app.route('/api/alert/config')
+        def get_alert_config():
+            try:
+                return self._result_response(self.alert_config_result())
             except Exception as e:
                 return jsonify({
                     'success': False,
@@ -302,25 +1095,26 @@ class MarketAPIServer:
                 enable_fund_monitor = data.get('enable_fund_monitor')
                 alert_cooldown = data.get('alert_cooldown')
                 
+                updates = {'gold': {}, 'fund': {}}
                 if gold_threshold is not None:
-                    self.config.set('gold', 'price_threshold_gold', str(float(gold_threshold)))
+                    updates['gold']['price_threshold_gold'] = float(gold_threshold)
                 if silver_threshold is not None:
-                    self.config.set('gold', 'price_threshold_silver', str(float(silver_threshold)))
+                    updates['gold']['price_threshold_silver'] = float(silver_threshold)
                 if fund_threshold is not None:
-                    self.config.set('fund', 'change_percent_threshold', str(float(fund_threshold)))
+                    updates['fund']['change_percent_threshold'] = float(fund_threshold)
                 if enable_gold_monitor is not None:
-                    self.config.set('gold', 'enable_monitor', str(bool(enable_gold_monitor)))
+                    updates['gold']['enable_monitor'] = bool(enable_gold_monitor)
                 if enable_fund_monitor is not None:
-                    self.config.set('fund', 'enable_monitor', str(bool(enable_fund_monitor)))
+                    updates['fund']['enable_monitor'] = bool(enable_fund_monitor)
                 if alert_cooldown is not None:
-                    self.config.set('gold', 'alert_cooldown_minutes', str(int(alert_cooldown)))
+                    updates['gold']['alert_cooldown_minutes'] = int(alert_cooldown)
                 
-                with open(os.path.join('config', 'config.ini'), 'w', encoding='utf-8') as f:
-                    self.config.write(f)
+                snapshot = self.config_manager.update_settings(updates)
                 
                 return jsonify({
                     'success': True,
                     'message': '预警配置更新成功',
+                    'version': snapshot.version,
                     'timestamp': datetime.now().isoformat()
                 })
             except Exception as e:
@@ -363,6 +1157,33 @@ class MarketAPIServer:
                     'timestamp': datetime.now().isoformat()
                 }), 500
         
+        @self.app.route('/api/alert/recipients/batch', methods=['POST'])
+        def update_recipients():
+            try:
+                data = request.get_json() or {}
+                added, removed = self.config_manager.update_email_addresses(data.get('add') or [], data.get('remove') or [])
+                return jsonify({
+                    'success': True,
+                    'data': {
+                        'added': added,
+                        'removed': removed,
+                        'count': len(self.config_manager.email_addresses)
+                    },
+                    'timestamp': datetime.now().isoformat()
+                })
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 400
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 500
+        
         @self.app.route('/api/alert/recipients/<email>', methods=['DELETE'])
         def delete_recipient(email):
             try:
@@ -390,8 +1211,6 @@ class MarketAPIServer:
         @self.app.route('/api/alert/test-email', methods=['POST'])
         def send_test_email():
             try:
-                from modules.email_notifier import EmailNotifier
-                
                 data = request.get_json()
                 recipient = data.get('recipient', '').strip()
                 
@@ -401,8 +1220,7 @@ class MarketAPIServer:
                         'error': '收件人邮箱不能为空'
                     }), 400
                 
-                email_notifier = EmailNotifier(self.config, self.logger)
-                result = email_notifier.send_test_email(recipient)
+                result = self.email_notifier.send_test_email(recipient)
                 
                 if result:
                     return jsonify({
@@ -426,15 +1244,7 @@ class MarketAPIServer:
         @self.app.route('/api/alert/history')
         def get_alert_history():
             try:
-                hours = request.args.get('hours', 24, type=int)
-                history = self.logger.get_alert_history(hours)
-                
-                return jsonify({
-                    'success': True,
-                    'data': history,
-                    'count': len(history),
-                    'timestamp': datetime.now().isoformat()
-                })
+                return self._result_response(self.alert_history_result(request.args))
             except Exception as e:
                 return jsonify({
                     'success': False,
@@ -446,18 +1256,18 @@ class MarketAPIServer:
         @self.app.route('/api/exchange/rate')
         def get_exchange_rate():
             try:
-                force_refresh = request.args.get('refresh', 'false').lower() == 'true'
-                rate = self.exchange_rate_manager.get_rate(force_refresh)
-                rate_info = self.exchange_rate_manager.get_rate_info()
-                
+                return self._result_response(self.exchange_rate_result(request.args))
+            except Exception as e:
                 return jsonify({
-                    'success': True,
-                    'data': {
-                        'rate': rate,
-                        'info': rate_info
-                    },
+                    'success': False,
+                    'error': str(e),
                     'timestamp': datetime.now().isoformat()
-                })
+                }), 500
+        
+        @self.app.route('/api/exchange/rates')
+        def get_exchange_rates():
+            try:
+                return self._result_response(self.exchange_rates_result(request.args))
             except Exception as e:
                 return jsonify({
                     'success': False,
@@ -493,36 +1303,50 @@ class MarketAPIServer:
         @self.app.route('/api/exchange/convert')
         def convert_currency():
             try:
-                price = request.args.get('price', type=float)
-                direction = request.args.get('direction', 'usd_oz_to_cny_gram')
-                
-                if price is None:
+                return self._result_response(self.convert_result(request.args))
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 500
+        
+        @self.app.route('/api/exchange/convert', methods=['POST'])
+        def convert_currency_batch():
+            try:
+                payload = request.get_json(silent=True) or {}
+                prices = payload.get('prices')
+                directions = payload.get('directions', payload.get('direction', 'usd_oz_to_cny_gram'))
+                if not isinstance(prices, list):
                     return jsonify({
                         'success': False,
-                        'error': '缺少价格参数',
+                        'error': '请求体需要包含价格列表 prices',
                         'timestamp': datetime.now().isoformat()
                     }), 400
-                
-                if direction == 'usd_oz_to_cny_gram':
-                    result = self.exchange_rate_manager.convert_usd_oz_to_cny_gram(price)
-                elif direction == 'cny_gram_to_usd_oz':
-                    result = self.exchange_rate_manager.convert_cny_gram_to_usd_oz(price)
-                else:
+                if not isinstance(directions, (str, list)):
                     return jsonify({
                         'success': False,
-                        'error': f'不支持的转换方向: {direction}',
+                        'error': 'directions 必须是字符串或与 prices 等长的列表',
                         'timestamp': datetime.now().isoformat()
                     }), 400
                 
-                rate_info = self.exchange_rate_manager.get_rate_info()
+                try:
+                    results = self.exchange_rate_manager.convert_many(prices, directions,
+                                                                     currency=str(payload.get('currency', 'CNY')))
+                except (TypeError, ValueError) as e:
+                    return jsonify({
+                        'success': False,
+                        'error': str(e),
+                        'timestamp': datetime.now().isoformat()
+                    }), 400
                 
                 return jsonify({
                     'success': True,
                     'data': {
-                        'input': price,
-                        'output': result,
-                        'direction': direction,
-                        'exchange_rate': rate_info
+                        'input': prices,
+                        'output': results,
+                        'direction': directions,
+                        'exchange_rate': self.exchange_rate_manager.get_rate_info()
                     },
                     'timestamp': datetime.now().isoformat()
                 })
@@ -536,15 +1360,22 @@ class MarketAPIServer:
         @self.app.route('/api/exchange/validate')
         def validate_exchange_rate():
             try:
-                test_cases = {
-                    'test_1': (2000.0, 7.2, 1.0),
-                    'test_2': (1950.0, 7.3, 1.0),
-                    'test_3': (2050.0, 7.1, 1.0),
-                    'test_4': (1900.0, 7.25, 1.0),
-                    'test_5': (2100.0, 7.15, 1.0)
-                }
+                samples = request.args.get('samples', 500, type=int)
+                benchmark_size = request.args.get('benchmark', 0, type=int)
+                if not 1 <= samples <= MAX_SAMPLES or not 0 <= benchmark_size <= MAX_BENCHMARK_SIZE:
+                    return jsonify({
+                        'success': False,
+                        'error': f'samples 范围为 1-{MAX_SAMPLES}，benchmark 范围为 0-{MAX_BENCHMARK_SIZE}',
+                        'timestamp': datetime.now().isoformat()
+                    }), 400
                 
-                results = self.exchange_rate_manager.validate_conversion(test_cases)
+                # 固定汇率之外再加上当前汇率，校验线上正在使用的换算
+                current_rate = self.exchange_rate_manager.get_rate()
+                validator = ConversionValidator(sorted(set(DEFAULT_RATES) | {current_rate}), samples,
+                                                request.args.get('seed', 0, type=int))
+                results = validator.run()
+                if benchmark_size:
+                    results['benchmark'] = validator.benchmark(benchmark_size, current_rate)
                 
                 return jsonify({
                     'success': True,
@@ -559,6 +1390,21 @@ class MarketAPIServer:
                 }), 500
         
         # System APIs
+        @self.app.route('/api/upstream/budget')
+        def get_upstream_budget():
+            try:
+                return jsonify({
+                    'success': True,
+                    'data': self.rate_governor.usage(),
+                    'timestamp': datetime.now().isoformat()
+                })
+            except Exception as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e),
+                    'timestamp': datetime.now().isoformat()
+                }), 500
+        
         @self.app.route('/api/health')
         def health_check():
             return jsonify({
@@ -583,16 +1429,30 @@ class MarketAPIServer:
         except KeyboardInterrupt:
             self.logger.log_info('API服务器已停止')
         finally:
-            self.price_fetcher.close()
-            self.data_processor.save_history_to_file(os.path.join('data', 'price_history.json'))
+            self.shutdown()
+
+
+def create_app(host=None, port=None, preload=None) -> Flask:
+    server = MarketAPIServer(host, port)
+    server._setup_directories()
+    
+    if preload is None:
+        preload = os.getenv('APP_PRELOAD', 'false').lower() == 'true'
+    if preload:
+        server.preload()
+    
+    os.register_at_fork(after_in_child=server.after_fork)
+    atexit.register(server.shutdown)
+    server.app.extensions['market_api_server'] = server
+    return server.app
 
 
 def main():
-    server = MarketAPIServer(host='0.0.0.0', port=5000)
-    server.run()
+    # 复用模块级 app，避免再建一个服务器并重复注册 at-fork / atexit 回调
+    app.extensions['market_api_server'].run()
 
 
-app = MarketAPIServer().app
+app = create_app()
 
 
 if __name__ == '__main__':
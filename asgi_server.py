@@ -0,0 +1,266 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+from werkzeug.utils import get_content_type
+
+from api_server import app as flask_app
+from modules import json_codec
+from modules.asgi_bridge import AsyncCoalescer, WsgiBridge, header_value, query_args, query_param, send_response
+from modules.compression import CachedPayload, MIN_COMPRESS_SIZE, compress, negotiate_encoding
+from modules.quote_models import records_to_dict
+
+
+DEFAULT_BRIDGE_THREADS = 32
+DEFAULT_UPSTREAM_THREADS = 8
+
+FUND_PREFIX = '/api/market/fund/'
+HISTORY_PREFIX = '/api/market/history/'
+FUND_HISTORY_PREFIX = '/api/market/fund-history/'
+STATIC_ROUTES = {'/': 'index.html', '/manifest.json': 'manifest.json', '/sw.js': 'sw.js'}
+
+
+class MarketASGIApp:
+    def __init__(self, server, bridge_threads: Optional[int] = None, upstream_threads: Optional[int] = None):
+        self.server = server
+        self.bridge_threads = bridge_threads
+        self.upstream_threads = upstream_threads
+        self.upstream_executor = None
+        self.bridge_executor = None
+        self.bridge = None
+        self.coalescer = AsyncCoalescer()
+        self.routes = {
+            '/api/health': self.health,
+            '/api/market/precious-metals': self.precious_metals,
+            '/api/market/funds': self.funds,
+            '/api/config/funds': self.fund_codes,
+            '/api/alert/config': self.alert_config,
+            '/api/alert/history': self.alert_history,
+            '/api/exchange/rate': self.exchange_rate,
+            '/api/exchange/rates': self.exchange_rates,
+            '/api/exchange/convert': self.convert,
+        }
+        self.prefix_routes = {
+            FUND_PREFIX: self.single_fund,
+            HISTORY_PREFIX: self.history,
+            FUND_HISTORY_PREFIX: self.fund_history,
+        }
+
+    def start(self):
+        if self.bridge is not None:
+            return
+        # 线程数在启动时才读取配置，导入模块时不触发配置加载
+        config = self.server.config
+        bridge_threads = self.bridge_threads or config.getint('asgi', 'bridge_threads', fallback=DEFAULT_BRIDGE_THREADS)
+        upstream_threads = self.upstream_threads or config.getint('asgi', 'upstream_threads', fallback=DEFAULT_UPSTREAM_THREADS)
+        # 上游抓取与其余 Flask 路由使用各自的线程池，慢上游不会占满普通接口的线程
+        self.upstream_executor = ThreadPoolExecutor(upstream_threads, thread_name_prefix='upstream')
+        self.bridge_executor = ThreadPoolExecutor(bridge_threads, thread_name_prefix='wsgi')
+        self.bridge = WsgiBridge(self.server.app.wsgi_app, self.bridge_executor)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        # 未启用 lifespan 的服务器在首个请求时初始化
+        self.start()
+
+        handler = None
+        if scope['method'] == 'GET':
+            path = scope['path']
+            handler = self.routes.get(path)
+            if handler is None:
+                handler = self.prefix_handler(path)
+            if handler is None and not path.startswith('/api/'):
+                handler = self.static
+
+        if handler is None or await handler(scope, send) is False:
+            await self.bridge(scope, receive, send)
+
+    def prefix_handler(self, path: str):
+        for prefix, handler in self.prefix_routes.items():
+            name = path[len(prefix):]
+            if path.startswith(prefix) and name and '/' not in name:
+                return handler
+        return None
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                # 静态资源在启动阶段加载好，之后在事件循环里直接返回内存中的内容
+                await asyncio.get_running_loop().run_in_executor(self.bridge_executor, lambda: self.server.static_assets)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.bridge is not None:
+                    self.upstream_executor.shutdown(wait=False)
+                    self.bridge_executor.shutdown(wait=False)
+                self.server.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def json_response(self, scope, send, payload, status: int = 200):
+        body = json_codec.dumps(payload)
+        headers = [(b'content-type', b'application/json'), (b'access-control-allow-origin', b'*')]
+        if status == 200 and len(body) >= MIN_COMPRESS_SIZE:
+            headers.append((b'vary', b'Accept-Encoding'))
+            encoding = negotiate_encoding(header_value(scope, b'accept-encoding'))
+            if encoding:
+                body = compress(body, encoding)
+                headers.append((b'content-encoding', encoding.encode('latin-1')))
+        await send_response(send, status, body, headers)
+
+    async def payload_response(self, scope, send, payload: CachedPayload):
+        body, encoding = payload.select(header_value(scope, b'accept-encoding'))
+        headers = [
+            (b'content-type', get_content_type(payload.mimetype, 'utf-8').encode('latin-1')),
+            (b'access-control-allow-origin', b'*'),
+        ]
+        if encoding:
+            headers.append((b'content-encoding', encoding.encode('latin-1')))
+        if payload.compressible:
+            headers.append((b'vary', b'Accept-Encoding'))
+        await send_response(send, 200, body, headers)
+
+    async def error_response(self, scope, send, error, status: int):
+        await self.json_response(scope, send, {
+            'success': False,
+            'error': str(error),
+            'timestamp': datetime.now().isoformat()
+        }, status)
+
+    async def result_response(self, scope, send, build, executor=None):
+        # 文件、数据库与汇率读取都在线程池中完成，事件循环只负责编码和发送
+        try:
+            payload, status = await asyncio.get_running_loop().run_in_executor(executor or self.bridge_executor, build)
+        except Exception as e:
+            return await self.error_response(scope, send, e, 500)
+        if isinstance(payload, CachedPayload):
+            return await self.payload_response(scope, send, payload)
+        await self.json_response(scope, send, payload, status)
+
+    async def data_response(self, scope, send, key, build):
+        try:
+            # 同一资源的并发请求只占用一个线程，其余请求在事件循环上等待同一个结果
+            data = await self.coalescer.do(key, build, self.upstream_executor)
+        except Exception as e:
+            return await self.error_response(scope, send, e, 500)
+        await self.json_response(scope, send, {
+            'success': True,
+            'data': data,
+            'timestamp': datetime.now().isoformat()
+        })
+
+    async def health(self, scope, send):
+        await self.json_response(scope, send, {
+            'status': 'healthy',
+            'timestamp': datetime.now().isoformat()
+        })
+
+    async def precious_metals(self, scope, send):
+        await self.data_response(scope, send, 'metals', lambda: records_to_dict(self.server._metal_quotes()))
+
+    async def funds(self, scope, send):
+        user_id = header_value(scope, b'x-user-id') or query_param(scope, 'user')
+        loop = asyncio.get_running_loop()
+        try:
+            if user_id:
+                fund_codes = await loop.run_in_executor(self.bridge_executor, self.server.watchlists.get, user_id)
+                key = ('funds', user_id)
+            else:
+                fund_codes = await loop.run_in_executor(self.bridge_executor, self.server.config_manager.get_fund_codes)
+                key = ('funds', tuple(sorted(fund_codes)))
+        except ValueError as e:
+            return await self.error_response(scope, send, e, 400)
+        except Exception as e:
+            return await self.error_response(scope, send, e, 500)
+        if not fund_codes:
+            # 与 Flask 路由保持一致的空列表响应，交给桥接层处理
+            return False
+        await self.data_response(scope, send, key, lambda: records_to_dict(self.server._fund_quotes(fund_codes)))
+
+    async def single_fund(self, scope, send):
+        fund_code = scope['path'][len(FUND_PREFIX):]
+        try:
+            processed = await self.coalescer.do(
+                ('fund', fund_code), lambda: self.server._fund_quotes([fund_code]), self.upstream_executor
+            )
+        except Exception as e:
+            return await self.error_response(scope, send, e, 500)
+
+        if fund_code not in processed:
+            return await self.error_response(scope, send, '基金数据获取失败', 404)
+        await self.json_response(scope, send, {
+            'success': True,
+            'data': processed[fund_code].to_dict(),
+            'timestamp': datetime.now().isoformat()
+        })
+
+    async def history(self, scope, send):
+        args = query_args(scope)
+        if args.get('format') == 'binary':
+            # 二进制格式需要自定义响应头，仍由 Flask 路由处理
+            return False
+        asset_type = scope['path'][len(HISTORY_PREFIX):]
+        await self.result_response(scope, send, lambda: self.server.history_result(asset_type, args))
+
+    async def fund_history(self, scope, send):
+        args = query_args(scope)
+        if args.get('format') == 'binary':
+            return False
+        fund_code = scope['path'][len(FUND_HISTORY_PREFIX):]
+        await self.result_response(scope, send, lambda: self.server.fund_history_result(fund_code, args))
+
+    async def fund_codes(self, scope, send):
+        await self.result_response(scope, send, self.server.fund_codes_result)
+
+    async def alert_config(self, scope, send):
+        await self.result_response(scope, send, self.server.alert_config_result)
+
+    async def alert_history(self, scope, send):
+        args = query_args(scope)
+        await self.result_response(scope, send, lambda: self.server.alert_history_result(args))
+
+    async def exchange_rate(self, scope, send):
+        args = query_args(scope)
+        # 汇率可能需要回源刷新，使用上游线程池
+        await self.result_response(scope, send, lambda: self.server.exchange_rate_result(args), self.upstream_executor)
+
+    async def exchange_rates(self, scope, send):
+        args = query_args(scope)
+        await self.result_response(scope, send, lambda: self.server.exchange_rates_result(args), self.upstream_executor)
+
+    async def convert(self, scope, send):
+        args = query_args(scope)
+        await self.result_response(scope, send, lambda: self.server.convert_result(args), self.upstream_executor)
+
+    async def static(self, scope, send):
+        path = scope['path']
+        asset = self.server.static_assets.get(STATIC_ROUTES.get(path, path.lstrip('/')))
+        if asset is None:
+            return False
+
+        body, encoding = asset.payload.select(header_value(scope, b'accept-encoding'))
+        etag = f'{asset.etag}-{encoding}' if encoding else asset.etag
+        quoted = f'"{etag}"'
+        headers = [
+            (b'etag', quoted.encode('latin-1')),
+            (b'cache-control', asset.cache_control.encode('latin-1')),
+            (b'access-control-allow-origin', b'*'),
+        ]
+        if asset.payload.compressible:
+            headers.append((b'vary', b'Accept-Encoding'))
+
+        if_none_match = header_value(scope, b'if-none-match') or ''
+        if quoted in if_none_match or if_none_match.strip() == '*':
+            return await send_response(send, 304, b'', headers)
+
+        headers.append((b'content-type', get_content_type(asset.payload.mimetype, 'utf-8').encode('latin-1')))
+        if encoding:
+            headers.append((b'content-encoding', encoding.encode('latin-1')))
+        await send_response(send, 200, body, headers)
+
+
+app = MarketASGIApp(flask_app.extensions['market_api_server'])
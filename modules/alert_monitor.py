@@ -1,63 +1,93 @@
-from typing import Dict, List
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Union
 from datetime import datetime, timedelta
 
+from modules.quote_models import MetalQuote, FundQuote, FundError
+
+
+ALERT_SECTIONS = frozenset(('gold', 'fund'))
+
+
+@dataclass(frozen=True)
+class AlertSettings:
+    gold_threshold: float
+    silver_threshold: float
+    fund_change_threshold: float
+    alert_cooldown_minutes: int
+    enable_gold_monitor: bool
+    enable_fund_monitor: bool
+
+    @classmethod
+    def from_config(cls, config) -> 'AlertSettings':
+        return cls(
+            config.getfloat('gold', 'price_threshold_gold'),
+            config.getfloat('gold', 'price_threshold_silver'),
+            config.getfloat('fund', 'change_percent_threshold'),
+            config.getint('gold', 'alert_cooldown_minutes'),
+            config.getboolean('gold', 'enable_monitor'),
+            config.getboolean('fund', 'enable_monitor')
+        )
+
 
 class AlertMonitor:
     def __init__(self, config, logger):
-        self.config = config
         self.logger = logger
-        
-        self.gold_threshold = config.getfloat('gold', 'price_threshold_gold')
-        self.silver_threshold = config.getfloat('gold', 'price_threshold_silver')
-        self.fund_change_threshold = config.getfloat('fund', 'change_percent_threshold')
-        self.alert_cooldown_minutes = config.getint('gold', 'alert_cooldown_minutes')
-        
         self.alert_history = {}
-        self.enable_gold_monitor = config.getboolean('gold', 'enable_monitor')
-        self.enable_fund_monitor = config.getboolean('fund', 'enable_monitor')
+        self.apply_config(config)
+    
+    def apply_config(self, config, changed: Optional[Set[str]] = None):
+        # 可直接注册为 ConfigManager 的订阅者，阈值整体替换，检查过程中不会读到新旧混合的配置
+        if changed is not None and not changed & ALERT_SECTIONS:
+            return
+        self.settings = AlertSettings.from_config(config)
+        self.config = config
     
-    def check_gold_silver_alerts(self, gold_data: Dict, silver_data: Dict) -> List[Dict]:
+    def check_gold_silver_alerts(self, gold_data: Optional[MetalQuote], silver_data: Optional[MetalQuote]) -> List[Dict]:
         alerts = []
+        settings = self.settings
         
-        if not self.enable_gold_monitor:
+        if not settings.enable_gold_monitor:
             return alerts
         
         if gold_data:
-            gold_alert = self._check_price_alert('gold', '黄金', gold_data['current_price'], self.gold_threshold)
+            gold_alert = self._check_price_alert('gold', '黄金', gold_data.price, settings.gold_threshold, settings)
             if gold_alert:
                 alerts.append(gold_alert)
         
         if silver_data:
-            silver_alert = self._check_price_alert('silver', '白银', silver_data['current_price'], self.silver_threshold)
+            silver_alert = self._check_price_alert('silver', '白银', silver_data.price, settings.silver_threshold, settings)
             if silver_alert:
                 alerts.append(silver_alert)
         
         return alerts
     
-    def check_fund_alerts(self, fund_data: Dict[str, Dict]) -> List[Dict]:
+    def check_fund_alerts(self, fund_data: Dict[str, Union[FundQuote, FundError]]) -> List[Dict]:
         alerts = []
+        settings = self.settings
         
-        if not self.enable_fund_monitor:
+        if not settings.enable_fund_monitor:
             return alerts
         
+        threshold = settings.fund_change_threshold
         for fund_code, data in fund_data.items():
-            if 'error' in data:
+            if isinstance(data, FundError):
                 continue
             
-            change_percent = data['change_percent']
+            change_percent = data.change_percent
             
-            if change_percent >= self.fund_change_threshold or change_percent <= -self.fund_change_threshold:
-                alert = self._check_fund_alert(fund_code, data)
+            if change_percent >= threshold or change_percent <= -threshold:
+                alert = self._check_fund_alert(fund_code, data, settings)
                 if alert:
                     alerts.append(alert)
         
         return alerts
     
-    def _check_price_alert(self, asset_type: str, asset_name: str, current_price: float, threshold: float) -> Dict:
+    def _check_price_alert(self, asset_type: str, asset_name: str, current_price: float, threshold: float,
+                           settings: AlertSettings) -> Dict:
         alert_key = f'{asset_type}_price'
         
         if current_price <= threshold:
-            if self._is_in_cooldown(alert_key):
+            if self._is_in_cooldown(alert_key, settings.alert_cooldown_minutes):
                 return None
             
             alert = {
@@ -78,38 +108,38 @@ class AlertMonitor:
         
         return None
     
-    def _check_fund_alert(self, fund_code: str, fund_data: Dict) -> Dict:
+    def _check_fund_alert(self, fund_code: str, fund_data: FundQuote, settings: AlertSettings) -> Dict:
         alert_key = f'fund_{fund_code}'
         
-        change_percent = fund_data['change_percent']
+        change_percent = fund_data.change_percent
         
-        if self._is_in_cooldown(alert_key):
+        if self._is_in_cooldown(alert_key, settings.alert_cooldown_minutes):
             return None
         
         direction = '上涨' if change_percent > 0 else '下跌'
         alert = {
             'type': 'fund_change',
             'fund_code': fund_code,
-            'fund_name': fund_data['name'],
-            'current_value': fund_data['estimated_value'],
+            'fund_name': fund_data.name,
+            'current_value': fund_data.estimated_value,
             'change_percent': change_percent,
-            'threshold': self.fund_change_threshold,
+            'threshold': settings.fund_change_threshold,
             'alert_time': datetime.now().isoformat(),
-            'message': f'基金涨跌幅预警：{fund_data["name"]}({fund_code}) {direction} {abs(change_percent):.2f}%，超过阈值 {self.fund_change_threshold}%'
+            'message': f'基金涨跌幅预警：{fund_data.name}({fund_code}) {direction} {abs(change_percent):.2f}%，超过阈值 {settings.fund_change_threshold}%'
         }
         
         self._record_alert(alert_key)
-        self.logger.log_alert_triggered('基金涨跌幅预警', fund_data['name'],
-                                       f'{direction} {abs(change_percent):.2f}%, 当前净值 {fund_data["estimated_value"]:.4f}')
+        self.logger.log_alert_triggered('基金涨跌幅预警', fund_data.name,
+                                       f'{direction} {abs(change_percent):.2f}%, 当前净值 {fund_data.estimated_value:.4f}')
         
         return alert
     
-    def _is_in_cooldown(self, alert_key: str) -> bool:
+    def _is_in_cooldown(self, alert_key: str, cooldown_minutes: int) -> bool:
         if alert_key not in self.alert_history:
             return False
         
         last_alert_time = self.alert_history[alert_key]
-        cooldown_time = timedelta(minutes=self.alert_cooldown_minutes)
+        cooldown_time = timedelta(minutes=cooldown_minutes)
         
         return datetime.now() - last_alert_time < cooldown_time
     
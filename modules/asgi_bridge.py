@@ -0,0 +1,166 @@
+import asyncio
+import sys
+import tempfile
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from urllib.parse import parse_qs, parse_qsl
+from werkzeug.datastructures import MultiDict
+
+
+SPOOL_MAX_SIZE = 1024 * 1024
+STREAM_CHUNK_SIZE = 64 * 1024
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+class AsyncCoalescer:
+    def __init__(self):
+        self.executed = 0
+        self.coalesced = 0
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, func: Callable[[], Any], executor: Optional[Executor] = None) -> Any:
+        # 所有协程运行在同一个事件循环里，字典操作之间不会被打断，不需要加锁
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(executor, func)
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._inflight.pop(key, None) if self._inflight.get(key) is done else None)
+            self.executed += 1
+        else:
+            self.coalesced += 1
+        # 某个请求断开被取消时不能连带取消其他请求共享的任务
+        return await asyncio.shield(future)
+
+    def stats(self) -> Dict:
+        return {
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'inflight': len(self._inflight)
+        }
+
+
+def header_value(scope: Dict, name: bytes) -> Optional[str]:
+    for key, value in scope.get('headers', ()):
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def query_param(scope: Dict, name: str) -> Optional[str]:
+    values = parse_qs(scope.get('query_string', b'').decode('latin-1')).get(name)
+    return values[0] if values else None
+
+
+def query_args(scope: Dict) -> MultiDict:
+    # 与 Flask 的 request.args 相同的接口，共用的 *_result 方法可以直接读取 get(..., type=...)
+    return MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+
+
+async def send_response(send, status: int, body: bytes, headers: Headers):
+    headers = headers + [(b'content-length', str(len(body)).encode('latin-1'))]
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def read_body(receive):
+    # 小请求体留在内存里，上传文件等大请求体溢出到临时文件
+    body = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body.write(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    length = body.tell()
+    body.seek(0)
+    return body, length
+
+
+def build_environ(scope: Dict, body, length: int) -> Dict:
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]) if server[1] else '80',
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(length),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if client:
+        environ['REMOTE_ADDR'] = client[0]
+        environ['REMOTE_PORT'] = str(client[1])
+
+    for key, value in scope.get('headers', ()):
+        name = key.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+        name = f'HTTP_{name}'
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    return environ
+
+
+class WsgiBridge:
+    def __init__(self, wsgi_app, executor: Executor):
+        self.wsgi_app = wsgi_app
+        self.executor = executor
+
+    def _start(self, environ: Dict, state: Dict):
+        def start_response(status, headers, exc_info=None):
+            if exc_info and state.get('started'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            state['status'] = int(status.split(' ', 1)[0])
+            state['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            return lambda data: state.setdefault('written', []).append(data)
+
+        iterable = self.wsgi_app(environ, start_response)
+        return iterable, iter(iterable)
+
+    @staticmethod
+    def _next_chunk(iterator, state: Dict) -> Tuple[bytes, bool]:
+        # 每次在线程里攒够一块再回到事件循环，流式导出不会为每一行切换一次线程
+        parts = state.pop('written', [])
+        size = sum(len(part) for part in parts)
+        for part in iterator:
+            if part:
+                parts.append(part)
+                size += len(part)
+                if size >= STREAM_CHUNK_SIZE:
+                    return b''.join(parts), True
+        return b''.join(parts), False
+
+    async def __call__(self, scope: Dict, receive, send):
+        loop = asyncio.get_running_loop()
+        body, length = await read_body(receive)
+        state: Dict = {}
+        iterable = None
+        try:
+            environ = build_environ(scope, body, length)
+            iterable, iterator = await loop.run_in_executor(self.executor, self._start, environ, state)
+            chunk, more = await loop.run_in_executor(self.executor, self._next_chunk, iterator, state)
+            await send({'type': 'http.response.start', 'status': state['status'], 'headers': state['headers']})
+            state['started'] = True
+            while True:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': more})
+                if not more:
+                    break
+                chunk, more = await loop.run_in_executor(self.executor, self._next_chunk, iterator, state)
+        finally:
+            if iterable is not None and hasattr(iterable, 'close'):
+                await loop.run_in_executor(self.executor, iterable.close)
+            body.close()
@@ -0,0 +1,61 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _InflightCall:
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class RequestCoalescer:
+    def __init__(self):
+        self.executed = 0
+        self.coalesced = 0
+        self._calls: Dict[Hashable, _InflightCall] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, func: Callable[[], Any], share: Optional[Callable[[Any], Any]] = None) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _InflightCall()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+
+        if not leader:
+            # 同一资源已有请求在途，等待它完成并共享结果
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return share(call.result) if share else call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def stats(self) -> Dict:
+        return {
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'inflight': len(self._calls)
+        }
+
+    def after_fork(self):
+        self._calls = {}
+        self._lock = threading.Lock()
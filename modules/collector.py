@@ -0,0 +1,215 @@
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from modules.alert_monitor import AlertMonitor
+from modules.columnar_history import ColumnarHistory
+from modules.config_manager import ConfigManager
+from modules.data_processor import DataProcessor
+from modules.email_notifier import EmailNotifier
+from modules.history_store import HistoryStore
+from modules.logger import logger_instance
+from modules.market_feed import FeedPublisher, FEED_GROUPS
+from modules.price_fetcher import PriceFetcher
+from modules.rate_governor import RateGovernor
+from modules.retention import RetentionEngine, RetentionPolicy
+from modules.subscriptions import UserWatchlists
+
+
+HEARTBEAT_INTERVAL = 15.0
+CLOSED_MARKET_RECHECK = 3600.0
+REQUEST_POLL_INTERVAL = 1.0
+REQUESTED_CODE_TTL = 86400.0
+
+
+class MarketCollector:
+    def __init__(self, config_manager: ConfigManager, logger, publisher: FeedPublisher,
+                 fetcher: PriceFetcher, processor: DataProcessor, monitor: AlertMonitor,
+                 watchlists: Optional[UserWatchlists] = None):
+        self.config_manager = config_manager
+        self.logger = logger
+        self.publisher = publisher
+        self.fetcher = fetcher
+        self.processor = processor
+        self.monitor = monitor
+        self.watchlists = watchlists
+        self.notifier = None
+        self.next_run: Dict[str, float] = {group: 0.0 for group in FEED_GROUPS}
+        # web 进程请求过、但不在任何关注列表中的基金，在有效期内随常规轮询一起抓取
+        self.requested: Dict[str, float] = {}
+        self.published: Dict[str, Dict] = {}
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+
+        config_manager.subscribe(fetcher.apply_config)
+        config_manager.subscribe(monitor.apply_config)
+        config_manager.subscribe(self._on_config_change)
+
+    def _on_config_change(self, snapshot, changed):
+        if self.notifier is not None:
+            self.notifier.apply_config(snapshot, changed)
+        if changed & {'gold', 'fund', 'schedule'}:
+            # 轮询间隔变化后立即按新配置重新排期
+            self.next_run = {group: 0.0 for group in FEED_GROUPS}
+            self._wakeup.set()
+
+    def fund_codes(self) -> List[str]:
+        codes = set(self.config_manager.fund_codes)
+        if self.watchlists:
+            codes.update(self.watchlists.poll_codes())
+        now = time.time()
+        self.requested = {code: expires for code, expires in self.requested.items() if expires > now}
+        codes.update(self.requested)
+        return sorted(codes)
+
+    def collect(self, group: str, codes: Optional[List[str]] = None):
+        partial = codes is not None
+        if group == 'metals':
+            processed = self.processor.process_gold_silver_data(self.fetcher.fetch_gold_silver_prices())
+            alerts = self.monitor.check_gold_silver_alerts(processed.get('gold'), processed.get('silver'))
+        else:
+            codes = codes if partial else self.fund_codes()
+            if not codes:
+                return
+            processed = self.processor.process_fund_data(self.fetcher.fetch_multiple_funds(codes))
+            alerts = self.monitor.check_fund_alerts(processed)
+
+        quotes = processed
+        if partial:
+            # 只补抓了部分基金，与上一份快照合并后整体发布
+            quotes = dict(self.published.get(group, {}))
+            quotes.update(processed)
+
+        # 先落盘再发布快照，web 进程发现序号不连续时可以从存储引擎补齐
+        if self.processor.store:
+            self.processor.store.flush()
+        sequence = self.publisher.publish(group, quotes)
+        self.published[group] = quotes
+        self.logger.log_debug(f'采集快照已发布: {group} #{sequence}, {len(quotes)} 条')
+        self._notify(alerts)
+
+    def collect_requested(self):
+        codes = self.publisher.take_requests()
+        if not codes:
+            return
+        expires = time.time() + REQUESTED_CODE_TTL
+        for code in codes:
+            self.requested[code] = expires
+        missing = sorted(code for code in set(codes) if code not in self.published.get('funds', {}))
+        if not missing:
+            return
+        try:
+            self.collect('funds', missing)
+        except Exception as e:
+            self.logger.log_error(f'补抓基金 {missing} 失败: {str(e)}')
+
+    def _notify(self, alerts: List[Dict]):
+        recipients = self.config_manager.get_email_list()
+        if not alerts or not recipients:
+            return
+        try:
+            if self.notifier is None:
+                self.notifier = EmailNotifier(self.config_manager.snapshot, self.logger)
+            for alert in alerts:
+                self.notifier.send_alert_email(
+                    recipients,
+                    self.monitor.format_alert_email_subject(alert),
+                    self.monitor.format_alert_email_content(alert)
+                )
+        except Exception as e:
+            self.logger.log_error(f'发送预警邮件失败: {str(e)}')
+
+    def run_once(self, now: Optional[float] = None):
+        now = now or time.time()
+        self.collect_requested()
+        for group in FEED_GROUPS:
+            if now < self.next_run[group]:
+                continue
+            try:
+                self.collect(group)
+            except Exception as e:
+                self.logger.log_error(f'采集 {group} 失败: {str(e)}')
+            # 休市期间不轮询，等到下次开盘；首次启动时无论是否开盘都会采集一次，保证 web 进程有数据可读
+            self.next_run[group] = self.fetcher.scheduler.next_poll_at(group, time.time()) or now + CLOSED_MARKET_RECHECK
+        # 降采样只在采集进程执行，web 进程不在请求线程里改写历史
+        if self.processor.retention:
+            self.processor.retention.maybe_run()
+
+    def run(self):
+        self.logger.log_info(f'采集进程启动，快照目录: {self.publisher.directory}')
+        last_heartbeat = 0.0
+        while not self._stop.is_set():
+            self.run_once()
+            if time.time() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                self.publisher.heartbeat()
+                last_heartbeat = time.time()
+            wait = min(self.next_run.values()) - time.time()
+            # web 进程请求的基金需要尽快抓取，等待时间不超过请求检查间隔
+            self._wakeup.wait(min(max(wait, 0.5), REQUEST_POLL_INTERVAL))
+            self._wakeup.clear()
+        self.logger.log_info('采集进程已停止')
+
+    def stop(self, *args):
+        self._stop.set()
+        self._wakeup.set()
+
+
+def build_collector(config_dir: str = 'config', feed_dir: Optional[str] = None) -> MarketCollector:
+    config_manager = ConfigManager(
+        os.path.join(config_dir, 'config.ini'),
+        os.path.join(config_dir, 'fund_list.txt'),
+        os.path.join(config_dir, 'email_list.txt'),
+        logger_instance
+    )
+    config = config_manager.snapshot
+
+    store = HistoryStore(config.get('storage', 'history_db', fallback=os.path.join('data', 'market_history.db')),
+                         logger_instance)
+    logger_instance.attach_store(store)
+    columnar_dir = config.get('storage', 'columnar_dir', fallback=os.path.join('data', 'columns'))
+    columnar = ColumnarHistory(columnar_dir, logger_instance) if columnar_dir else None
+    retention = RetentionEngine(store, RetentionPolicy.from_config(config), columnar, logger_instance)
+
+    publisher = FeedPublisher(feed_dir or config.get('collector', 'feed_dir', fallback=None) or None)
+    collector = MarketCollector(
+        config_manager,
+        logger_instance,
+        publisher,
+        PriceFetcher(config, RateGovernor.from_config(config, logger_instance)),
+        DataProcessor(logger_instance, store, columnar, retention),
+        AlertMonitor(config, logger_instance),
+        UserWatchlists.from_config(config, logger_instance)
+    )
+    config_manager.start_file_watcher()
+    return collector
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='行情采集进程：抓取行情并发布快照供 web 进程读取')
+    parser.add_argument('--config-dir', default='config', help='配置文件目录')
+    parser.add_argument('--feed-dir', help='快照目录，默认读取配置文件，未配置时使用 /dev/shm')
+    parser.add_argument('--once', action='store_true', help='采集一次后退出')
+    args = parser.parse_args(argv)
+
+    collector = build_collector(args.config_dir, args.feed_dir)
+    signal.signal(signal.SIGTERM, collector.stop)
+    signal.signal(signal.SIGINT, collector.stop)
+    try:
+        if args.once:
+            collector.run_once()
+            collector.publisher.heartbeat()
+        else:
+            collector.run()
+    finally:
+        collector.config_manager.stop_file_watcher()
+        collector.fetcher.close()
+        collector.processor.store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
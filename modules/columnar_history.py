@@ -0,0 +1,240 @@
+import mmap
+import os
+import re
+import struct
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from modules.file_utils import FileLock, atomic_write
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+RECORD = struct.Struct('<ddf')
+RECORD_FORMAT = '<ddf'
+RECORD_FIELDS = ('timestamp', 'value', 'change_percent')
+CHANGE_PRECISION = 4
+
+NUMPY_DTYPE = numpy.dtype([('timestamp', '<f8'), ('value', '<f8'), ('change_percent', '<f4')]) if numpy else None
+
+_UNSAFE_CHARS = re.compile(r'[^0-9A-Za-z_.-]')
+
+
+class ColumnarSeries:
+    def __init__(self, path: str):
+        self.path = path
+        self._map: Optional[mmap.mmap] = None
+        self._mapped_size = 0
+        self._mapped_ino = None
+        self._lock = threading.Lock()
+        # 追加与重写之间的跨进程互斥，保证文件内的时间戳严格递增
+        self._file_lock = FileLock(path + '.lock')
+
+    @staticmethod
+    def _last_timestamp(fd: int) -> Optional[float]:
+        size = os.fstat(fd).st_size
+        size -= size % RECORD.size
+        if size == 0:
+            return None
+        return RECORD.unpack(os.pread(fd, RECORD.size, size - RECORD.size))[0]
+
+    def append(self, rows) -> int:
+        with self._file_lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                # 二分查找依赖有序的记录，不晚于文件末尾时间戳的点（重复持久化或并发写入）直接丢弃
+                last = self._last_timestamp(fd)
+                parts = []
+                for ts, value, change_percent in rows:
+                    if last is not None and ts <= last:
+                        continue
+                    parts.append(RECORD.pack(ts, value, change_percent))
+                    last = ts
+                if parts:
+                    os.write(fd, b''.join(parts))
+            finally:
+                os.close(fd)
+        return len(parts)
+
+    def _replace(self, data: bytes):
+        # 原子替换，已映射旧文件的读取方不受影响，下次读取时按新文件重新映射；
+        # 不能原地截断，其他进程访问映射中超出新文件末尾的部分会收到 SIGBUS
+        atomic_write(self.path, data, fsync=False)
+        with self._lock:
+            self._mapped_size = -1
+
+    def rewrite(self, rows) -> int:
+        data = b''.join(RECORD.pack(ts, value, change_percent) for ts, value, change_percent in rows)
+        with self._file_lock:
+            self._replace(data)
+        return len(data) // RECORD.size
+
+    def splice(self, start: Optional[float], end: Optional[float], rows) -> int:
+        data = b''.join(RECORD.pack(ts, value, change_percent) for ts, value, change_percent in rows)
+        with self._file_lock:
+            try:
+                with open(self.path, 'rb') as f:
+                    current = f.read()
+            except FileNotFoundError:
+                return 0
+            view = memoryview(current)[:len(current) - len(current) % RECORD.size]
+            # 只替换 [start, end) 区间内的记录，区间前后的字节原样保留，不再从存储引擎读取整段历史
+            lo = self._bisect(view, start, False) if start is not None else 0
+            hi = self._bisect(view, end, False) if end is not None else len(view) // RECORD.size
+            self._replace(b''.join((view[:lo * RECORD.size], data, view[hi * RECORD.size:])))
+        return len(data) // RECORD.size
+
+    def _view(self) -> memoryview:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return memoryview(b'')
+        size = stat.st_size - stat.st_size % RECORD.size
+
+        # 其他进程原子替换后文件大小可能不变，需要同时比较 inode
+        if size != self._mapped_size or stat.st_ino != self._mapped_ino:
+            with self._lock:
+                if size != self._mapped_size or stat.st_ino != self._mapped_ino:
+                    with open(self.path, 'rb') as f:
+                        # 以实际打开的文件为准，stat 之后文件可能又被替换
+                        stat = os.fstat(f.fileno())
+                        size = stat.st_size - stat.st_size % RECORD.size
+                        self._map = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else None
+                    self._mapped_size = size
+                    self._mapped_ino = stat.st_ino
+
+        if self._map is None:
+            return memoryview(b'')
+        return memoryview(self._map)[:self._mapped_size]
+
+    def __len__(self) -> int:
+        return len(self._view()) // RECORD.size
+
+    def _bisect(self, view: memoryview, ts: float, right: bool) -> int:
+        lo, hi = 0, len(view) // RECORD.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = RECORD.unpack_from(view, mid * RECORD.size)[0]
+            if value < ts or (right and value == ts):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def slice(self, start: Optional[float] = None, end: Optional[float] = None,
+              limit: Optional[int] = None) -> memoryview:
+        view = self._view()
+        lo = self._bisect(view, start, False) if start is not None else 0
+        hi = self._bisect(view, end, True) if end is not None else len(view) // RECORD.size
+        if limit and hi - lo > limit:
+            lo = hi - limit
+        return view[lo * RECORD.size:hi * RECORD.size]
+
+    def iter_points(self, start: Optional[float] = None, end: Optional[float] = None,
+                    limit: Optional[int] = None) -> Iterator[Tuple[float, float, float]]:
+        for ts, value, change_percent in RECORD.iter_unpack(self.slice(start, end, limit)):
+            yield ts, value, round(change_percent, CHANGE_PRECISION)
+
+    def to_columns(self, start: Optional[float] = None, end: Optional[float] = None,
+                   limit: Optional[int] = None) -> Dict[str, List[float]]:
+        view = self.slice(start, end, limit)
+        if numpy is not None:
+            array = numpy.frombuffer(view, dtype=NUMPY_DTYPE)
+            return {
+                'timestamp': array['timestamp'].tolist(),
+                'value': array['value'].tolist(),
+                'change_percent': numpy.round(array['change_percent'].astype('<f8'), CHANGE_PRECISION).tolist()
+            }
+
+        columns = {field: [] for field in RECORD_FIELDS}
+        for ts, value, change_percent in RECORD.iter_unpack(view):
+            columns['timestamp'].append(ts)
+            columns['value'].append(value)
+            columns['change_percent'].append(round(change_percent, CHANGE_PRECISION))
+        return columns
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                try:
+                    self._map.close()
+                except BufferError:
+                    pass
+            self._map = None
+            self._mapped_size = 0
+            self._mapped_ino = None
+        self._file_lock.close()
+
+
+class ColumnarHistory:
+    def __init__(self, directory: str, logger=None):
+        self.directory = directory
+        self.logger = logger
+        self._series: Dict[str, ColumnarSeries] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, asset: str) -> str:
+        return os.path.join(self.directory, _UNSAFE_CHARS.sub('_', asset) + '.bin')
+
+    def series(self, asset: str) -> ColumnarSeries:
+        series = self._series.get(asset)
+        if series is None:
+            with self._lock:
+                series = self._series.get(asset)
+                if series is None:
+                    series = ColumnarSeries(self._path(asset))
+                    self._series[asset] = series
+        return series
+
+    def has_series(self, asset: str) -> bool:
+        return os.path.exists(self._path(asset))
+
+    def is_empty(self) -> bool:
+        return not any(name.endswith('.bin') for name in os.listdir(self.directory))
+
+    def append_rows(self, rows):
+        grouped: Dict[str, list] = {}
+        for asset, ts, value, change_percent in rows:
+            grouped.setdefault(asset, []).append((ts, value, change_percent))
+        for asset, points in grouped.items():
+            self.series(asset).append(points)
+
+    def rebuild_from_store(self, store):
+        total = 0
+        for asset in store.list_assets():
+            # 与 rewrite_from_store 一致读取汇总层加原始层，重建后仍保留已压缩的长期历史
+            total += self.series(asset).rewrite(store.query_series(asset))
+        if self.logger:
+            self.logger.log_info(f'列式历史文件已从存储引擎重建: {total} 条记录')
+
+    def rewrite_from_store(self, store, assets):
+        total = 0
+        for asset in assets:
+            total += self.series(asset).rewrite(store.query_series(asset))
+        return total
+
+    def splice_from_store(self, store, ranges: Dict[str, Tuple[float, float]]) -> int:
+        total = 0
+        for asset, (start, end) in ranges.items():
+            if not self.has_series(asset):
+                continue
+            rows = [row for row in store.query_series(asset, start, end) if row[0] < end]
+            total += self.series(asset).splice(start, end, rows)
+        return total
+
+    def drop_before(self, assets, cutoff: float):
+        for asset in assets:
+            if self.has_series(asset):
+                self.series(asset).splice(None, cutoff, ())
+
+    def after_fork(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def close(self):
+        for series in self._series.values():
+            series.close()
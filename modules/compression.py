@@ -0,0 +1,105 @@
+import gzip
+import threading
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+SUPPORTED_ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)
+MIN_COMPRESS_SIZE = 1024
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/javascript',
+    'application/manifest+json',
+    'application/x-ndjson',
+    'image/svg+xml',
+    'text/css',
+    'text/csv',
+    'text/html',
+    'text/javascript',
+    'text/plain',
+}
+
+DYNAMIC_LEVELS = {'br': 5, 'gzip': 6}
+STATIC_LEVELS = {'br': 11, 'gzip': 9}
+
+
+def is_compressible(mimetype: Optional[str]) -> bool:
+    return bool(mimetype) and mimetype.split(';', 1)[0].strip() in COMPRESSIBLE_MIMETYPES
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    if not accept_encoding:
+        return None
+
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name] = quality
+
+    best = None
+    best_quality = 0.0
+    for encoding in SUPPORTED_ENCODINGS:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best = encoding
+            best_quality = quality
+    return best
+
+
+def compress(data: bytes, encoding: str, levels: Dict[str, int] = DYNAMIC_LEVELS) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=levels['br'])
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=levels['gzip'], mtime=0)
+    raise ValueError(f'不支持的压缩格式: {encoding}')
+
+
+class CachedPayload:
+    def __init__(self, body: bytes, mimetype: str, levels: Dict[str, int] = DYNAMIC_LEVELS):
+        self.body = body
+        self.mimetype = mimetype
+        self.levels = levels
+        self.compressible = len(body) >= MIN_COMPRESS_SIZE and is_compressible(mimetype)
+        self._variants: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def precompress(self):
+        if self.compressible:
+            for encoding in SUPPORTED_ENCODINGS:
+                self.encoded(encoding)
+        return self
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        if not encoding or not self.compressible:
+            return self.body
+
+        variant = self._variants.get(encoding)
+        if variant is None:
+            with self._lock:
+                variant = self._variants.get(encoding)
+                if variant is None:
+                    variant = compress(self.body, encoding, self.levels)
+                    if len(variant) >= len(self.body):
+                        variant = self.body
+                    self._variants[encoding] = variant
+        return variant
+
+    def select(self, accept_encoding: Optional[str]):
+        encoding = negotiate_encoding(accept_encoding) if self.compressible else None
+        body = self.encoded(encoding)
+        if body is self.body:
+            encoding = None
+        return body, encoding
@@ -1,10 +1,88 @@
 import configparser
+import io
 import os
+import threading
 import time
-from typing import List, Set
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+from modules.data_processor import is_fund_code
+from modules.file_utils import FileLock, atomic_write
+from modules.watchlist_store import WatchlistStore
+
+
+FUND_LIST_HEADER = '# 基金代码列表\n# 每行一个基金代码，以#开头的行为注释\n'
+EMAIL_LIST_HEADER = '# 邮件地址列表\n# 每行一个邮箱地址，以#开头的行为注释\n'
+
+_UNSET = object()
+
+
+def _sections_of(parser: configparser.ConfigParser) -> Dict[str, Dict[str, str]]:
+    return {section: dict(parser.items(section, raw=True)) for section in parser.sections()}
+
+
+class ConfigSnapshot:
+    __slots__ = ('version', 'loaded_at', 'fund_codes', 'email_addresses', '_parser')
+
+    def __init__(self, version: int, parser: configparser.ConfigParser,
+                 fund_codes: FrozenSet[str], email_addresses: FrozenSet[str]):
+        # 快照发布后不再修改，任意线程都可以无锁读取
+        self.version = version
+        self.loaded_at = time.time()
+        self.fund_codes = fund_codes
+        self.email_addresses = email_addresses
+        self._parser = parser
+
+    def evolve(self, parser: Optional[configparser.ConfigParser] = None,
+               fund_codes: Optional[FrozenSet[str]] = None,
+               email_addresses: Optional[FrozenSet[str]] = None) -> 'ConfigSnapshot':
+        return ConfigSnapshot(
+            self.version + 1,
+            self._parser if parser is None else parser,
+            self.fund_codes if fund_codes is None else fund_codes,
+            self.email_addresses if email_addresses is None else email_addresses
+        )
+
+    def get(self, section: str, option: str, *, raw: bool = False, fallback=_UNSET):
+        if fallback is _UNSET:
+            return self._parser.get(section, option, raw=raw)
+        return self._parser.get(section, option, raw=raw, fallback=fallback)
+
+    def getint(self, section: str, option: str, *, fallback=_UNSET) -> int:
+        if fallback is _UNSET:
+            return self._parser.getint(section, option)
+        return self._parser.getint(section, option, fallback=fallback)
+
+    def getfloat(self, section: str, option: str, *, fallback=_UNSET) -> float:
+        if fallback is _UNSET:
+            return self._parser.getfloat(section, option)
+        return self._parser.getfloat(section, option, fallback=fallback)
+
+    def getboolean(self, section: str, option: str, *, fallback=_UNSET) -> bool:
+        if fallback is _UNSET:
+            return self._parser.getboolean(section, option)
+        return self._parser.getboolean(section, option, fallback=fallback)
+
+    def has_section(self, section: str) -> bool:
+        return self._parser.has_section(section)
+
+    def has_option(self, section: str, option: str) -> bool:
+        return self._parser.has_option(section, option)
+
+    def sections(self) -> List[str]:
+        return self._parser.sections()
+
+    def items(self, section: str):
+        return self._parser.items(section)
+
+    def to_dict(self) -> Dict[str, Dict[str, str]]:
+        return _sections_of(self._parser)
+
+    def changed_sections(self, other: 'ConfigSnapshot') -> Set[str]:
+        ours, theirs = self.to_dict(), other.to_dict()
+        return {section for section in set(ours) | set(theirs) if ours.get(section) != theirs.get(section)}
+
 
 class ConfigManager:
     def __init__(self, config_path: str, fund_list_path: str, email_list_path: str, logger):
@@ -12,222 +90,311 @@ class ConfigManager:
         self.fund_list_path = fund_list_path
         self.email_list_path = email_list_path
         self.logger = logger
-        
-        self.config = configparser.ConfigParser()
-        self.fund_codes = set()
-        self.email_addresses = set()
-        
+
         self.observer = None
         self.file_change_callbacks = []
-        
-        self._load_all_configs()
-    
-    def _load_all_configs(self):
-        self._load_config_file()
-        self._load_fund_list()
-        self._load_email_list()
-    
-    def _load_config_file(self):
+        self.subscribers: List[Callable[[ConfigSnapshot, Set[str]], None]] = []
+        self._publish_lock = threading.RLock()
+        self._file_lock = FileLock(config_path + '.lock')
+        # 基金代码会拼进上游请求地址，非 6 位数字的条目在写入时拒绝、读取时忽略
+        self.fund_store = WatchlistStore(fund_list_path, FUND_LIST_HEADER, is_fund_code)
+        self.email_store = WatchlistStore(email_list_path, EMAIL_LIST_HEADER, lambda line: '@' in line)
+
+        self._snapshot = ConfigSnapshot(
+            1, self._read_config_file(), self._read_list('基金列表', self.fund_store),
+            self._read_list('邮件列表', self.email_store)
+        )
+        self.logger.log_info(f'当前监控基金数量: {len(self._snapshot.fund_codes)}')
+        self.logger.log_info(f'当前邮件接收人数: {len(self._snapshot.email_addresses)}')
+
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        return self._snapshot
+
+    @property
+    def config(self) -> ConfigSnapshot:
+        return self._snapshot
+
+    @property
+    def fund_codes(self) -> FrozenSet[str]:
+        return self._snapshot.fund_codes
+
+    @property
+    def email_addresses(self) -> FrozenSet[str]:
+        return self._snapshot.email_addresses
+
+    def _read_config_file(self) -> configparser.ConfigParser:
+        parser = configparser.ConfigParser()
         try:
-            self.config.read(self.config_path, encoding='utf-8')
+            parser.read(self.config_path, encoding='utf-8')
             self.logger.log_info(f'配置文件加载成功: {self.config_path}')
         except Exception as e:
             self.logger.log_error(f'配置文件加载失败: {str(e)}')
             raise
-    
+        return parser
+
+    def _read_list(self, label: str, store: WatchlistStore) -> FrozenSet[str]:
+        if not os.path.exists(store.path):
+            self.logger.log_warning(f'{label}文件不存在，将创建: {store.path}')
+        store.load(force=True)
+        return frozenset(store.entries)
+
+    def _publish(self, **changes) -> ConfigSnapshot:
+        with self._publish_lock:
+            current = self._snapshot
+            candidate = current.evolve(**changes)
+
+            changed = set()
+            if 'parser' in changes:
+                changed |= candidate.changed_sections(current)
+            if candidate.fund_codes != current.fund_codes:
+                changed.add('fund_list')
+            if candidate.email_addresses != current.email_addresses:
+                changed.add('email_list')
+            if not changed:
+                return current
+
+            # 整体替换引用即可发布新版本，读取方只做一次属性访问，不需要加锁
+            self._snapshot = candidate
+            self.logger.log_info(f'配置已更新到版本 {candidate.version}: {", ".join(sorted(changed))}')
+            self._notify_subscribers(candidate, changed)
+            return candidate
+
+    def _notify_subscribers(self, snapshot: ConfigSnapshot, changed: Set[str]):
+        for callback in list(self.subscribers):
+            try:
+                callback(snapshot, changed)
+            except Exception as e:
+                self.logger.log_error(f'配置变更回调执行失败: {str(e)}')
+
+        for file_type in ('fund_list', 'email_list'):
+            if file_type in changed:
+                self._notify_file_change(file_type)
+        if changed - {'fund_list', 'email_list'}:
+            self._notify_file_change('config')
+
+    def _load_config_file(self):
+        try:
+            self._publish(parser=self._read_config_file())
+        except Exception as e:
+            self.logger.log_error(f'重新加载配置文件失败，继续使用当前版本: {str(e)}')
+
     def _load_fund_list(self):
         try:
-            if not os.path.exists(self.fund_list_path):
-                self.logger.log_warning(f'基金列表文件不存在，将创建: {self.fund_list_path}')
-                with open(self.fund_list_path, 'w', encoding='utf-8') as f:
-                    f.write('# 基金代码列表\n# 每行一个基金代码，以#开头的行为注释\n')
-                self.fund_codes = set()
+            # 本进程刚写入的文件不必重新解析，只有其他进程或手工修改才会重新加载
+            if not self.fund_store.load():
                 return
-            
-            new_fund_codes = set()
-            
-            with open(self.fund_list_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        fund_code = line.strip()
-                        if fund_code:
-                            new_fund_codes.add(fund_code)
-            
-            added_funds = new_fund_codes - self.fund_codes
-            removed_funds = self.fund_codes - new_fund_codes
-            
-            if added_funds or removed_funds:
-                self.fund_codes = new_fund_codes
-                if added_funds:
-                    self.logger.log_info(f'新增基金代码: {added_funds}')
-                if removed_funds:
-                    self.logger.log_info(f'移除基金代码: {removed_funds}')
-                self._notify_file_change('fund_list')
-            else:
-                self.fund_codes = new_fund_codes
-            
-            self.logger.log_info(f'当前监控基金数量: {len(self.fund_codes)}')
-            
+            current = self._snapshot.fund_codes
+            fund_codes = frozenset(self.fund_store.entries)
+            if fund_codes - current:
+                self.logger.log_info(f'新增基金代码: {set(fund_codes - current)}')
+            if current - fund_codes:
+                self.logger.log_info(f'移除基金代码: {set(current - fund_codes)}')
+            self._publish(fund_codes=fund_codes)
+            self.logger.log_info(f'当前监控基金数量: {len(fund_codes)}')
         except Exception as e:
             self.logger.log_error(f'加载基金列表失败: {str(e)}')
-    
+
     def _load_email_list(self):
         try:
-            if not os.path.exists(self.email_list_path):
-                self.logger.log_warning(f'邮件列表文件不存在，将创建: {self.email_list_path}')
-                with open(self.email_list_path, 'w', encoding='utf-8') as f:
-                    f.write('# 邮件地址列表\n# 每行一个邮箱地址，以#开头的行为注释\n')
-                self.email_addresses = set()
+            if not self.email_store.load():
                 return
-            
-            new_email_addresses = set()
-            
-            with open(self.email_list_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        email = line.strip()
-                        if '@' in email:
-                            new_email_addresses.add(email)
-            
-            added_emails = new_email_addresses - self.email_addresses
-            removed_emails = self.email_addresses - new_email_addresses
-            
-            if added_emails or removed_emails:
-                self.email_addresses = new_email_addresses
-                if added_emails:
-                    self.logger.log_info(f'新增邮件地址: {added_emails}')
-                if removed_emails:
-                    self.logger.log_info(f'移除邮件地址: {removed_emails}')
-                self._notify_file_change('email_list')
-            else:
-                self.email_addresses = new_email_addresses
-            
-            self.logger.log_info(f'当前邮件接收人数: {len(self.email_addresses)}')
-            
+            current = self._snapshot.email_addresses
+            email_addresses = frozenset(self.email_store.entries)
+            if email_addresses - current:
+                self.logger.log_info(f'新增邮件地址: {set(email_addresses - current)}')
+            if current - email_addresses:
+                self.logger.log_info(f'移除邮件地址: {set(current - email_addresses)}')
+            self._publish(email_addresses=email_addresses)
+            self.logger.log_info(f'当前邮件接收人数: {len(email_addresses)}')
         except Exception as e:
             self.logger.log_error(f'加载邮件列表失败: {str(e)}')
-    
+
     def reload_all_configs(self):
-        self._load_all_configs()
-        self.logger.log_config_loaded(len(self.fund_codes), len(self.email_addresses))
-    
+        self._load_config_file()
+        self._load_fund_list()
+        self._load_email_list()
+        snapshot = self._snapshot
+        self.logger.log_config_loaded(len(snapshot.fund_codes), len(snapshot.email_addresses))
+
+    def reload_config_file(self):
+        self._load_config_file()
+
     def reload_fund_list(self):
         self._load_fund_list()
-    
+
     def reload_email_list(self):
         self._load_email_list()
-    
+
     def get_fund_codes(self) -> List[str]:
-        return list(self.fund_codes)
-    
+        return list(self._snapshot.fund_codes)
+
     def get_email_addresses(self) -> List[str]:
-        return list(self.email_addresses)
-    
-    def get_config(self):
-        return self.config
-    
+        return list(self._snapshot.email_addresses)
+
+    def get_config(self) -> ConfigSnapshot:
+        return self._snapshot
+
+    def update_settings(self, updates: Dict[str, Dict[str, object]]) -> ConfigSnapshot:
+        # 线程锁保证本进程内按顺序发布，文件锁保证多个 worker 之间不会互相覆盖
+        with self._publish_lock, self._file_lock:
+            parser = self._read_config_file()
+            for section, options in updates.items():
+                if not parser.has_section(section):
+                    parser.add_section(section)
+                for option, value in options.items():
+                    parser.set(section, option, str(value))
+
+            buffer = io.StringIO()
+            parser.write(buffer)
+            atomic_write(self.config_path, buffer.getvalue())
+            return self._publish(parser=parser)
+
+    def update_fund_codes(self, add: Iterable[str] = (), remove: Iterable[str] = ()) -> Tuple[List[str], List[str]]:
+        with self._publish_lock:
+            added, removed = self.fund_store.update(add, remove)
+            if added or removed:
+                self._publish(fund_codes=frozenset(self.fund_store.entries))
+        if added:
+            self.logger.log_info(f'新增基金代码: {added}')
+        if removed:
+            self.logger.log_info(f'移除基金代码: {removed}')
+        return added, removed
+
+    def update_email_addresses(self, add: Iterable[str] = (), remove: Iterable[str] = ()) -> Tuple[List[str], List[str]]:
+        with self._publish_lock:
+            added, removed = self.email_store.update(add, remove)
+            if added or removed:
+                self._publish(email_addresses=frozenset(self.email_store.entries))
+        if added:
+            self.logger.log_info(f'新增邮件地址: {added}')
+        if removed:
+            self.logger.log_info(f'移除邮件地址: {removed}')
+        return added, removed
+
     def add_fund_code(self, fund_code: str):
         fund_code = fund_code.strip()
         if not fund_code:
             return False
-        
-        if fund_code in self.fund_codes:
+
+        if fund_code in self._snapshot.fund_codes:
             self.logger.log_warning(f'基金代码已存在: {fund_code}')
             return False
-        
+
         try:
-            with open(self.fund_list_path, 'a', encoding='utf-8') as f:
-                f.write(f'{fund_code}\n')
-            self.fund_codes.add(fund_code)
-            self.logger.log_info(f'添加基金代码成功: {fund_code}')
-            return True
+            added, _ = self.update_fund_codes(add=[fund_code])
+            return bool(added)
         except Exception as e:
             self.logger.log_error(f'添加基金代码失败: {str(e)}')
             return False
-    
+
+    def remove_fund_code(self, fund_code: str):
+        fund_code = fund_code.strip()
+        if fund_code not in self._snapshot.fund_codes:
+            self.logger.log_warning(f'基金代码不存在: {fund_code}')
+            return False
+
+        try:
+            _, removed = self.update_fund_codes(remove=[fund_code])
+            return bool(removed)
+        except Exception as e:
+            self.logger.log_error(f'删除基金代码失败: {str(e)}')
+            return False
+
     def add_email_address(self, email: str):
         email = email.strip()
         if not email or '@' not in email:
             return False
-        
-        if email in self.email_addresses:
+
+        if email in self._snapshot.email_addresses:
             self.logger.log_warning(f'邮件地址已存在: {email}')
             return False
-        
+
         try:
-            with open(self.email_list_path, 'a', encoding='utf-8') as f:
-                f.write(f'{email}\n')
-            self.email_addresses.add(email)
-            self.logger.log_info(f'添加邮件地址成功: {email}')
-            return True
+            added, _ = self.update_email_addresses(add=[email])
+            return bool(added)
         except Exception as e:
             self.logger.log_error(f'添加邮件地址失败: {str(e)}')
             return False
-    
+
     def remove_email_address(self, email: str):
         email = email.strip()
-        if email not in self.email_addresses:
+        if email not in self._snapshot.email_addresses:
             self.logger.log_warning(f'邮件地址不存在: {email}')
             return False
-        
+
         try:
-            lines = []
-            with open(self.email_list_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    line = line.strip()
-                    if line and not line.startswith('#') and line != email:
-                        lines.append(line)
-                    elif line.startswith('#'):
-                        lines.append(line)
-            
-            with open(self.email_list_path, 'w', encoding='utf-8') as f:
-                f.write('# 邮件地址列表\n# 每行一个邮箱地址，以#开头的行为注释\n')
-                for line in lines:
-                    f.write(f'{line}\n')
-            
-            self.email_addresses.remove(email)
-            self.logger.log_info(f'删除邮件地址成功: {email}')
-            return True
+            _, removed = self.update_email_addresses(remove=[email])
+            return bool(removed)
         except Exception as e:
             self.logger.log_error(f'删除邮件地址失败: {str(e)}')
             return False
-    
+
     def get_email_list(self) -> List[str]:
         return self.get_email_addresses()
-    
+
+    def watched_paths(self) -> Dict[str, Callable[[], None]]:
+        return {
+            os.path.abspath(self.config_path): self._load_config_file,
+            os.path.abspath(self.fund_list_path): self._load_fund_list,
+            os.path.abspath(self.email_list_path): self._load_email_list,
+        }
+
     def start_file_watcher(self):
         if self.observer:
             return
-        
+
         try:
             handler = ConfigFileChangeHandler(self)
             self.observer = Observer()
-            self.observer.schedule(handler, path=os.path.dirname(self.fund_list_path), recursive=False)
+            directories = {os.path.dirname(path) for path in self.watched_paths()}
+            for directory in directories:
+                self.observer.schedule(handler, path=directory, recursive=False)
+            self.observer.daemon = True
             self.observer.start()
             self.logger.log_info('文件监控服务已启动')
         except Exception as e:
+            self.observer = None
             self.logger.log_error(f'启动文件监控服务失败: {str(e)}')
-    
+
     def stop_file_watcher(self):
         if self.observer:
             self.observer.stop()
             self.observer.join()
             self.observer = None
             self.logger.log_info('文件监控服务已停止')
-    
+
+    def after_fork(self):
+        # 监控线程不会被 fork 复制，子进程需要重新启动；期间别的进程可能已改过文件，先重新读取一次
+        watching = self.observer is not None
+        self.observer = None
+        self._publish_lock = threading.RLock()
+        self._file_lock.after_fork()
+        self.fund_store.after_fork()
+        self.email_store.after_fork()
+        if watching:
+            self.start_file_watcher()
+        self.reload_all_configs()
+
+    def subscribe(self, callback: Callable[[ConfigSnapshot, Set[str]], None]):
+        if callback not in self.subscribers:
+            self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
     def _notify_file_change(self, file_type: str):
         for callback in self.file_change_callbacks:
             try:
                 callback(file_type)
             except Exception as e:
                 self.logger.log_error(f'文件变更回调执行失败: {str(e)}')
-    
+
     def register_file_change_callback(self, callback):
         if callback not in self.file_change_callbacks:
             self.file_change_callbacks.append(callback)
-    
+
     def unregister_file_change_callback(self, callback):
         if callback in self.file_change_callbacks:
             self.file_change_callbacks.remove(callback)
@@ -236,27 +403,42 @@ class ConfigManager:
 class ConfigFileChangeHandler(FileSystemEventHandler):
     def __init__(self, config_manager: ConfigManager):
         self.config_manager = config_manager
-        self.last_modified = {}
+        self.loaders = config_manager.watched_paths()
+        self.pending: Dict[str, threading.Timer] = {}
         self.debounce_delay = 1
-    
+        self._lock = threading.Lock()
+
+    def _schedule(self, paths: Iterable[str]):
+        for path in paths:
+            path = os.path.abspath(path)
+            loader = self.loaders.get(path)
+            if loader is None:
+                continue
+
+            # 连续写入只在最后一次变化之后重新加载一次，不会漏掉最终内容
+            with self._lock:
+                timer = self.pending.get(path)
+                if timer:
+                    timer.cancel()
+                timer = threading.Timer(self.debounce_delay, self._fire, (path, loader))
+                timer.daemon = True
+                self.pending[path] = timer
+                timer.start()
+
+    def _fire(self, path: str, loader: Callable[[], None]):
+        with self._lock:
+            self.pending.pop(path, None)
+        loader()
+
     def on_modified(self, event):
-        if event.is_directory:
-            return
-        
-        file_path = event.src_path
-        
-        if file_path not in [self.config_manager.fund_list_path, self.config_manager.email_list_path]:
-            return
-        
-        current_time = time.time()
-        
-        if file_path in self.last_modified:
-            if current_time - self.last_modified[file_path] < self.debounce_delay:
-                return
-        
-        self.last_modified[file_path] = current_time
-        
-        if file_path == self.config_manager.fund_list_path:
-            self.config_manager._load_fund_list()
-        elif file_path == self.config_manager.email_list_path:
-            self.config_manager._load_email_list()
+        if not event.is_directory:
+            self._schedule([event.src_path])
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._schedule([event.src_path])
+
+    def on_moved(self, event):
+        # 原子写入表现为临时文件被重命名为目标文件
+        if not event.is_directory:
+            self._schedule([event.dest_path])
@@ -0,0 +1,285 @@
+import argparse
+import json
+import math
+import random
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from fractions import Fraction
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from modules import exchange_rate_manager
+from modules.exchange_rate_manager import ExchangeRateManager
+
+
+TO_CNY, TO_USD = ExchangeRateManager.CONVERSIONS
+OUNCE_TO_GRAM = Decimal(str(ExchangeRateManager.OUNCE_TO_GRAM))
+CENT = Decimal('0.01')
+
+# (名称, 方向, 输入价格, 汇率, 期望结果)，期望值按十进制精确计算后四舍五入到分；
+# tie 用例的精确结果恰好落在五厘上，浮点乘除后略小于五厘，期望值是 round() 对浮点结果的舍入
+GOLDEN_CASES: Tuple[Tuple[str, str, float, float, float], ...] = (
+    ('gold_2000_at_7.2', TO_CNY, 2000.0, 7.2, 462.97),
+    ('gold_1950.5_at_7.3', TO_CNY, 1950.5, 7.3, 457.78),
+    ('gold_2345.6_at_7.1', TO_CNY, 2345.6, 7.1, 535.43),
+    ('one_ounce_equals_rate', TO_CNY, 31.1034768, 7.2, 7.2),
+    ('silver_30.25_at_7.1', TO_CNY, 30.25, 7.1, 6.91),
+    ('large_100000_at_7.25', TO_CNY, 100000.0, 7.25, 23309.29),
+    ('sub_cent_rounds_to_zero', TO_CNY, 0.01, 7.2, 0.0),
+    ('zero', TO_CNY, 0.0, 7.2, 0.0),
+    ('cny_456.54_at_7.1', TO_USD, 456.54, 7.1, 2000.0),
+    ('cny_535.43_at_7.1', TO_USD, 535.43, 7.1, 2345.6),
+    ('cny_7.2_at_7.2', TO_USD, 7.2, 7.2, 31.1),
+    ('cny_one_cent', TO_USD, 0.01, 7.2, 0.04),
+    ('tie_cny_7500_at_7.2', TO_USD, 7500.0, 7.2, 32399.45),
+    ('tie_cny_22500_at_7.2', TO_USD, 22500.0, 7.2, 97198.37),
+    ('tie_cny_20312.5_at_6.5', TO_USD, 20312.5, 6.5, 97198.36),
+    ('tie_gold_64798.91_at_7.8123', TO_CNY, 64798.91, 7.8123, 16275.62),
+)
+
+DEFAULT_RATES = (6.5, 7.1, 7.2, 7.3, 7.8123)
+DEFAULT_SAMPLES = 2000
+DEFAULT_BENCHMARK_SIZE = 100000
+MAX_SAMPLES = 20000
+MAX_BENCHMARK_SIZE = 200000
+DRIFT_ROUNDS = 10
+EPSILON = 1e-9
+TIE_CASES_PER_RATE = 20
+MAX_TIE_PRICE = 1e7
+
+PINNED_CACHE_FILE = os.path.join(tempfile.gettempdir(), 'conversion-validation', 'unused_rate_cache.json')
+
+
+class PinnedRateManager(ExchangeRateManager):
+    def __init__(self, rates: Dict[str, float]):
+        # 固定汇率，缓存文件指向一个不会写入的临时路径，也不请求上游；换算代码与线上实例完全相同
+        super().__init__(cache_file=PINNED_CACHE_FILE)
+        self._rates = dict(rates)
+        self._rate = self._rates['CNY']
+        self._last_update = datetime.now()
+
+    def get_rates(self, force_refresh: bool = False) -> Dict[str, float]:
+        return self._rates
+
+    def rate_series(self, currency: str = 'CNY', start: Optional[float] = None,
+                    end: Optional[float] = None) -> Tuple[List[float], List[float]]:
+        return [0.0], [self.cross_rate('USD', currency)]
+
+
+def pinned(rate: float) -> PinnedRateManager:
+    return PinnedRateManager({'USD': 1.0, 'CNY': rate})
+
+
+def decimal_reference(price: float, rate: float, direction: str) -> float:
+    price, rate = Decimal(repr(price)), Decimal(repr(rate))
+    exact = price * rate / OUNCE_TO_GRAM if direction == TO_CNY else price * OUNCE_TO_GRAM / rate
+    return float(exact.quantize(CENT, rounding=ROUND_HALF_UP))
+
+
+def tie_prices(rate: float, direction: str, count: int = TIE_CASES_PER_RATE) -> List[float]:
+    # 精确结果恰好落在五厘上的输入价格：以分为单位，价格必须是 step 的倍数，且倍数乘以 unit 的个位为 5
+    factor = Fraction(repr(rate)) / Fraction(OUNCE_TO_GRAM)
+    if direction == TO_USD:
+        factor = 1 / factor
+    per_cent = factor * 10
+    step, unit = per_cent.denominator, per_cent.numerator
+    prices = []
+    multiple = 1
+    while len(prices) < count and multiple * step / 100 <= MAX_TIE_PRICE:
+        if multiple * unit % 10 == 5:
+            prices.append(multiple * step / 100)
+        multiple += 1
+    return prices
+
+
+def round_trip_bound(rate: float) -> float:
+    # 人民币/克 舍入到分带来至多 0.005 元误差，换回美元/盎司放大 OUNCE/rate 倍，再加一次舍入
+    return 0.005 * ExchangeRateManager.OUNCE_TO_GRAM / rate + 0.005 + EPSILON
+
+
+class ConversionValidator:
+    def __init__(self, rates: Sequence[float] = DEFAULT_RATES, samples: int = DEFAULT_SAMPLES, seed: int = 0):
+        self.rates = tuple(rates)
+        self.samples = samples
+        self.seed = seed
+
+    def _prices(self, count: int, rng: random.Random) -> List[float]:
+        # 对数均匀分布，覆盖从几分钱到十万美元的量级
+        return [round(10 ** rng.uniform(-2, 5), 2) for _ in range(count)]
+
+    def _result(self, name: str, passed: bool, **details) -> Dict:
+        return dict(name=name, passed=passed, **details)
+
+    def check_golden(self) -> List[Dict]:
+        results = []
+        for name, direction, price, rate, expected in GOLDEN_CASES:
+            manager = pinned(rate)
+            scalar = (manager.convert_usd_oz_to_cny_gram(price) if direction == TO_CNY
+                      else manager.convert_cny_gram_to_usd_oz(price))
+            batch = manager.convert_many([price], direction)[0]
+            results.append(self._result(
+                f'golden:{name}', scalar == expected and batch == expected,
+                direction=direction, input=price, rate=rate, expected=expected, scalar=scalar, batch=batch
+            ))
+        return results
+
+    def check_decimal_reference(self, prices: List[float]) -> Dict:
+        max_error = 0.0
+        mismatches = 0
+        compared = 0
+        tie_inputs = 0
+        for rate in self.rates:
+            manager = pinned(rate)
+            for direction in (TO_CNY, TO_USD):
+                ties = tie_prices(rate, direction)
+                inputs = prices + ties
+                tie_inputs += len(ties)
+                converted = manager.convert_many(inputs, direction)
+                for price, value in zip(inputs, converted):
+                    error = abs(value - decimal_reference(price, rate, direction))
+                    if error > EPSILON:
+                        mismatches += 1
+                    max_error = max(max_error, error)
+                compared += len(inputs)
+        # 浮点运算只会在恰好五厘的边界上与十进制结果差一分
+        return self._result('decimal_reference', max_error <= 0.01 + EPSILON,
+                            max_error=max_error, mismatches=mismatches,
+                            compared=compared, tie_inputs=tie_inputs)
+
+    def check_round_trip(self, prices: List[float]) -> Dict:
+        worst = 0.0
+        worst_ratio = 0.0
+        for rate in self.rates:
+            manager = pinned(rate)
+            back = manager.convert_many(manager.convert_many(prices, TO_CNY), TO_USD)
+            bound = round_trip_bound(rate)
+            for price, value in zip(prices, back):
+                error = abs(value - price)
+                worst = max(worst, error)
+                worst_ratio = max(worst_ratio, error / bound)
+        return self._result('round_trip', worst_ratio <= 1.0, max_error=worst, max_error_to_bound=worst_ratio)
+
+    def check_rounding_drift(self, prices: List[float]) -> Dict:
+        worst = 0.0
+        unstable = 0
+        for rate in self.rates:
+            manager = pinned(rate)
+            values = prices
+            first = None
+            for _ in range(DRIFT_ROUNDS):
+                values = manager.convert_many(manager.convert_many(values, TO_CNY), TO_USD)
+                first = first or values
+            # 第一次往返后应到达不动点，之后的往返不再继续漂移
+            unstable += sum(1 for a, b in zip(first, values) if a != b)
+            bound = round_trip_bound(rate)
+            worst = max(worst, max(abs(a - b) / bound for a, b in zip(prices, values)))
+        return self._result('rounding_drift', unstable == 0 and worst <= 1.0,
+                            rounds=DRIFT_ROUNDS, unstable=unstable, max_drift_to_bound=worst)
+
+    def check_monotonic(self, prices: List[float]) -> Dict:
+        ordered = sorted(prices)
+        violations = 0
+        for rate in self.rates:
+            manager = pinned(rate)
+            for direction in (TO_CNY, TO_USD):
+                converted = manager.convert_many(ordered, direction)
+                violations += sum(1 for a, b in zip(converted, converted[1:]) if b < a)
+        return self._result('monotonic', violations == 0, violations=violations)
+
+    def check_batch_vs_scalar(self, prices: List[float], rng: random.Random) -> Dict:
+        mismatches = 0
+        tie_inputs = 0
+        for rate in self.rates:
+            manager = pinned(rate)
+            # 五厘边界是 numpy.round 与 round() 结果不同的地方，必须包含在对比样本里
+            ties = tie_prices(rate, TO_CNY) + tie_prices(rate, TO_USD)
+            tie_inputs += len(ties)
+            inputs = prices + ties
+            directions = [rng.choice((TO_CNY, TO_USD)) for _ in inputs]
+            expected = {
+                TO_CNY: [manager.convert_usd_oz_to_cny_gram(price) for price in inputs],
+                TO_USD: [manager.convert_cny_gram_to_usd_oz(price) for price in inputs],
+            }
+            for direction in (TO_CNY, TO_USD):
+                mismatches += sum(1 for a, b in zip(manager.convert_many(inputs, direction), expected[direction]) if a != b)
+            mixed = manager.convert_many(inputs, directions)
+            mismatches += sum(1 for i, value in enumerate(mixed) if value != expected[directions[i]][i])
+            series, _ = manager.convert_series(list(range(len(inputs))), inputs)
+            mismatches += sum(1 for a, b in zip(series, expected[TO_CNY]) if a != b)
+        return self._result('batch_vs_scalar', mismatches == 0, mismatches=mismatches, tie_inputs=tie_inputs,
+                            numpy=exchange_rate_manager.numpy is not None)
+
+    def run(self) -> Dict:
+        rng = random.Random(self.seed)
+        prices = self._prices(self.samples, rng)
+        details = self.check_golden()
+        details.extend([
+            self.check_decimal_reference(prices),
+            self.check_round_trip(prices),
+            self.check_rounding_drift(prices),
+            self.check_monotonic(prices),
+            self.check_batch_vs_scalar(prices, rng),
+        ])
+        passed = sum(1 for detail in details if detail['passed'])
+        return {
+            'total_tests': len(details),
+            'passed': passed,
+            'failed': len(details) - passed,
+            'samples': self.samples,
+            'rates': list(self.rates),
+            'seed': self.seed,
+            'details': details
+        }
+
+    def benchmark(self, size: int = DEFAULT_BENCHMARK_SIZE, rate: Optional[float] = None) -> Dict:
+        manager = pinned(rate or self.rates[0])
+        prices = self._prices(size, random.Random(self.seed))
+        timestamps = [float(i) for i in range(size)]
+
+        def timed(func: Callable[[], object]) -> Dict:
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            return {
+                'seconds': elapsed,
+                'per_second': size / elapsed if elapsed > 0 else math.inf
+            }
+
+        results = {
+            'scalar': timed(lambda: [manager.convert_usd_oz_to_cny_gram(price) for price in prices]),
+            'batch': timed(lambda: manager.convert_many(prices)),
+            'series': timed(lambda: manager.convert_series(timestamps, prices)),
+        }
+        scalar = results['scalar']['seconds']
+        for name in ('batch', 'series'):
+            elapsed = results[name]['seconds']
+            results[name]['speedup'] = scalar / elapsed if elapsed > 0 else math.inf
+        return {
+            'size': size,
+            'numpy': exchange_rate_manager.numpy is not None,
+            'results': results
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='汇率换算精度校验与性能基准')
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES, help='随机样本数量')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+    parser.add_argument('--rates', help='参与校验的汇率，逗号分隔')
+    parser.add_argument('--benchmark', type=int, default=DEFAULT_BENCHMARK_SIZE, help='基准测试的价格数量，0 表示跳过')
+    args = parser.parse_args(argv)
+
+    rates = [float(rate) for rate in args.rates.split(',')] if args.rates else DEFAULT_RATES
+    validator = ConversionValidator(rates, args.samples, args.seed)
+    report = validator.run()
+    if args.benchmark:
+        report['benchmark'] = validator.benchmark(args.benchmark)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0 if report['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,98 +1,128 @@
-from typing import Dict, List
-from datetime import datetime
+from typing import Dict, List, Optional, Union
+from collections import deque
 import json
+import re
+import time
+
+from modules.quote_models import MetalQuote, FundQuote, FundError, HistoryPoint
+
+
+FUND_ASSET_PREFIX = 'fund:'
+
+_FUND_CODE = re.compile(r'^\d{6}$')
+
+
+def fund_asset(fund_code: str) -> str:
+    return f'{FUND_ASSET_PREFIX}{fund_code}'
+
+
+def is_fund_code(code: str) -> bool:
+    return bool(_FUND_CODE.match(code))
 
 
 class DataProcessor:
-    def __init__(self, logger):
+    def __init__(self, logger, store=None, columnar=None, retention=None):
         self.logger = logger
-        self.price_history = {
-            'gold': [],
-            'silver': [],
+        self.store = store
+        self.columnar = columnar
+        self.retention = retention
+        # 内存中只保留原始数据层的时间窗口，长度上限仅作为内存保护
+        self.max_history_length = 20000
+        self.history_window = retention.policy.raw_window if retention else None
+        self.price_history = self._empty_history()
+        self._versions = {}
+    
+    def _empty_history(self) -> Dict:
+        return {
+            'gold': deque(maxlen=self.max_history_length),
+            'silver': deque(maxlen=self.max_history_length),
             'funds': {}
         }
-        self.max_history_length = 1000
-    
-    def process_gold_silver_data(self, raw_data: Dict[str, Dict]) -> Dict[str, Dict]:
-        processed = {}
-        
-        for metal, data in raw_data.items():
-            processed[metal] = {
-                'name': data['name'],
-                'current_price': data['price'],
-                'open_price': data['open_price'],
-                'high_price': data['high_price'],
-                'low_price': data['low_price'],
-                'change_percent_str': data['change_percent'],
-                'change_percent': self._parse_change_percent(data['change_percent']),
-                'update_time': data['update_time'],
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            self._update_price_history(metal, processed[metal])
+    
+    def _bump_version(self, *keys: str):
+        for key in keys:
+            self._versions[key] = self._versions.get(key, 0) + 1
+    
+    def _bump_all_versions(self):
+        self._bump_version('gold', 'silver', 'funds', *(fund_asset(code) for code in self.price_history['funds']))
+    
+    def history_version(self, key: str) -> int:
+        return self._versions.get(key, 0)
+    
+    def process_gold_silver_data(self, raw_data: Dict[str, MetalQuote]) -> Dict[str, MetalQuote]:
+        now = time.time()
+        
+        for metal, quote in raw_data.items():
+            quote.timestamp = now
+            self._update_price_history(metal, quote)
         
-        return processed
+        self._persist([(metal, now, quote.price, quote.change_percent) for metal, quote in raw_data.items()])
+        
+        return raw_data
     
-    def process_fund_data(self, raw_data: Dict[str, Dict]) -> Dict[str, Dict]:
-        processed = {}
+    def process_fund_data(self, raw_data: Dict[str, Union[FundQuote, FundError]]) -> Dict[str, Union[FundQuote, FundError]]:
+        now = time.time()
         
-        for fund_code, data in raw_data.items():
-            if 'error' in data:
-                processed[fund_code] = {
-                    'error': data['error'],
-                    'code': fund_code
-                }
+        for fund_code, quote in raw_data.items():
+            if isinstance(quote, FundError):
                 continue
             
-            processed[fund_code] = {
-                'code': data['code'],
-                'name': data['name'],
-                'net_value': data['net_value'],
-                'estimated_value': data['estimated_value'],
-                'change_percent': data['change_percent'],
-                'update_time': data['update_time'],
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            self._update_fund_history(fund_code, processed[fund_code])
+            quote.timestamp = now
+            self._update_fund_history(fund_code, quote)
+        
+        self._persist([
+            (fund_asset(fund_code), now, quote.estimated_value, quote.change_percent)
+            for fund_code, quote in raw_data.items()
+            if not isinstance(quote, FundError)
+        ])
         
-        return processed
+        return raw_data
     
-    def _parse_change_percent(self, change_percent_str: str) -> float:
-        try:
-            return float(change_percent_str.replace('%', ''))
-        except (ValueError, AttributeError):
-            return 0.0
+    def ingest_published(self, group: str, quotes: Dict[str, Union[MetalQuote, FundQuote, FundError]]):
+        # 采集进程已经写入存储引擎，这里只把快照补进本进程的内存历史
+        for key, quote in quotes.items():
+            if isinstance(quote, FundError):
+                continue
+            if group == 'metals':
+                points = self.price_history.get(key)
+                if not points or points[-1].timestamp < quote.timestamp:
+                    self._update_price_history(key, quote)
+            else:
+                points = self.price_history['funds'].get(key)
+                if not points or points[-1].timestamp < quote.timestamp:
+                    self._update_fund_history(key, quote)
+    
+    def _persist(self, rows: List):
+        if not rows:
+            return
+        if self.store:
+            self.store.add_quotes(rows)
+        if self.columnar:
+            self.columnar.append_rows(rows)
+    
+    def _trim(self, points: deque):
+        if self.history_window is None:
+            return
+        cutoff = time.time() - self.history_window
+        while points and points[0].timestamp < cutoff:
+            points.popleft()
     
-    def _update_price_history(self, metal: str, data: Dict):
+    def _update_price_history(self, metal: str, quote: MetalQuote):
         if metal not in self.price_history:
-            self.price_history[metal] = []
-        
-        history_entry = {
-            'price': data['current_price'],
-            'change_percent': data['change_percent'],
-            'timestamp': data['timestamp']
-        }
-        
-        self.price_history[metal].append(history_entry)
+            self.price_history[metal] = deque(maxlen=self.max_history_length)
         
-        if len(self.price_history[metal]) > self.max_history_length:
-            self.price_history[metal] = self.price_history[metal][-self.max_history_length:]
+        self.price_history[metal].append(HistoryPoint(quote.timestamp, quote.price, quote.change_percent))
+        self._trim(self.price_history[metal])
+        self._bump_version(metal)
     
-    def _update_fund_history(self, fund_code: str, data: Dict):
-        if fund_code not in self.price_history['funds']:
-            self.price_history['funds'][fund_code] = []
+    def _update_fund_history(self, fund_code: str, quote: FundQuote):
+        funds = self.price_history['funds']
+        if fund_code not in funds:
+            funds[fund_code] = deque(maxlen=self.max_history_length)
         
-        history_entry = {
-            'estimated_value': data['estimated_value'],
-            'change_percent': data['change_percent'],
-            'timestamp': data['timestamp']
-        }
-        
-        self.price_history['funds'][fund_code].append(history_entry)
-        
-        if len(self.price_history['funds'][fund_code]) > self.max_history_length:
-            self.price_history['funds'][fund_code] = self.price_history['funds'][fund_code][-self.max_history_length:]
+        funds[fund_code].append(HistoryPoint(quote.timestamp, quote.estimated_value, quote.change_percent))
+        self._trim(funds[fund_code])
+        self._bump_version('funds', fund_asset(fund_code))
     
     def calculate_price_change(self, metal: str) -> Dict:
         if metal not in self.price_history or len(self.price_history[metal]) < 2:
@@ -106,37 +136,147 @@ class DataProcessor:
         current = history[-1]
         previous = history[0]
         
-        price_change = current['price'] - previous['price']
-        if previous['price'] > 0:
-            percent_change = (price_change / previous['price']) * 100
+        price_change = current.value - previous.value
+        if previous.value > 0:
+            percent_change = (price_change / previous.value) * 100
         else:
             percent_change = 0.0
         
         return {
             'price_change': price_change,
             'percent_change': percent_change,
-            'previous_price': previous['price']
+            'previous_price': previous.value
         }
     
     def get_latest_price(self, metal: str) -> float:
         if metal not in self.price_history or not self.price_history[metal]:
             return 0.0
-        return self.price_history[metal][-1]['price']
+        return self.price_history[metal][-1].value
     
     def get_fund_latest_value(self, fund_code: str) -> float:
         if fund_code not in self.price_history['funds'] or not self.price_history['funds'][fund_code]:
             return 0.0
-        return self.price_history['funds'][fund_code][-1]['estimated_value']
+        return self.price_history['funds'][fund_code][-1].value
     
     def get_fund_latest_change(self, fund_code: str) -> float:
         if fund_code not in self.price_history['funds'] or not self.price_history['funds'][fund_code]:
             return 0.0
-        return self.price_history['funds'][fund_code][-1]['change_percent']
+        return self.price_history['funds'][fund_code][-1].change_percent
+    
+    def history_to_dict(self, asset_type: str):
+        if asset_type == 'funds':
+            return {
+                fund_code: [point.to_dict('estimated_value') for point in points]
+                for fund_code, points in self.price_history['funds'].items()
+            }
+        return [point.to_dict('price') for point in self.price_history.get(asset_type, ())]
+    
+    def history_columns(self, asset_type: str) -> Dict[str, List[float]]:
+        points = self.price_history.get(asset_type, ())
+        return {
+            'timestamp': [point.timestamp for point in points],
+            'value': [point.value for point in points],
+            'change_percent': [point.change_percent for point in points]
+        }
+    
+    def fund_history_to_dict(self, fund_code: str) -> List[Dict]:
+        return [point.to_dict('estimated_value') for point in self.price_history['funds'].get(fund_code, ())]
+    
+    def query_history(self, asset_type: str, start: Optional[float] = None, end: Optional[float] = None,
+                      limit: Optional[int] = None):
+        if asset_type == 'funds':
+            return {
+                asset[len(FUND_ASSET_PREFIX):]: self._query_points(asset, 'estimated_value', start, end, limit)
+                for asset in self.store.list_assets(FUND_ASSET_PREFIX)
+            }
+        return self._query_points(asset_type, 'price', start, end, limit)
+    
+    def query_fund_history(self, fund_code: str, start: Optional[float] = None, end: Optional[float] = None,
+                           limit: Optional[int] = None) -> List[Dict]:
+        return self._query_points(fund_asset(fund_code), 'estimated_value', start, end, limit)
+    
+    def _query_points(self, asset: str, value_key: str, start, end, limit) -> List[Dict]:
+        if self.columnar and self.columnar.has_series(asset):
+            rows = self.columnar.series(asset).iter_points(start, end, limit)
+        else:
+            rows = self.store.query_series(asset, start, end, limit)
+        return [HistoryPoint(ts, value, change_percent).to_dict(value_key) for ts, value, change_percent in rows]
+    
+    def query_columns(self, asset: str, start: Optional[float] = None, end: Optional[float] = None,
+                      limit: Optional[int] = None) -> Dict[str, List[float]]:
+        if self.columnar and self.columnar.has_series(asset):
+            return self.columnar.series(asset).to_columns(start, end, limit)
+        
+        columns = {'timestamp': [], 'value': [], 'change_percent': []}
+        for ts, value, change_percent in self.store.query_series(asset, start, end, limit):
+            columns['timestamp'].append(ts)
+            columns['value'].append(value)
+            columns['change_percent'].append(change_percent)
+        return columns
+    
+    def load_history_from_store(self):
+        history = self._empty_history()
+        start = time.time() - self.history_window if self.history_window else None
+        for metal in ('gold', 'silver'):
+            history[metal].extend(
+                HistoryPoint(*row) for row in self.store.query_quotes(metal, start, limit=self.max_history_length)
+            )
+        for asset in self.store.list_assets(FUND_ASSET_PREFIX):
+            history['funds'][asset[len(FUND_ASSET_PREFIX):]] = deque(
+                (HistoryPoint(*row) for row in self.store.query_quotes(asset, start, limit=self.max_history_length)),
+                maxlen=self.max_history_length
+            )
+        
+        self.price_history = history
+        self._bump_all_versions()
+        self.logger.log_info('价格历史数据已从存储引擎加载')
+    
+    def backfill_from_store(self, group: str, keys):
+        # 只补读内存中最后一个点之后的数据，不重新加载整个历史窗口
+        if self.store is None:
+            return
+        window_start = time.time() - self.history_window if self.history_window else None
+        for key in keys:
+            if group == 'metals':
+                asset = key
+                points = self.price_history.setdefault(key, deque(maxlen=self.max_history_length))
+            else:
+                asset = fund_asset(key)
+                points = self.price_history['funds'].setdefault(key, deque(maxlen=self.max_history_length))
+            
+            last = points[-1].timestamp if points else window_start
+            rows = self.store.query_quotes(asset, last, limit=self.max_history_length)
+            new_points = [HistoryPoint(*row) for row in rows if last is None or row[0] > last]
+            if not new_points:
+                continue
+            points.extend(new_points)
+            self._trim(points)
+            if group == 'metals':
+                self._bump_version(key)
+            else:
+                self._bump_version('funds', asset)
+    
+    def sync_history_to_store(self):
+        rows = []
+        for metal in ('gold', 'silver'):
+            rows.extend((metal, point.timestamp, point.value, point.change_percent) for point in self.price_history[metal])
+        for fund_code, points in self.price_history['funds'].items():
+            asset = fund_asset(fund_code)
+            rows.extend((asset, point.timestamp, point.value, point.change_percent) for point in points)
+        
+        self._persist(rows)
+        self.store.flush()
+        self.logger.log_info(f'已将 {len(rows)} 条历史数据写入存储引擎')
     
     def save_history_to_file(self, filepath: str):
         try:
+            data = {
+                'gold': self.history_to_dict('gold'),
+                'silver': self.history_to_dict('silver'),
+                'funds': self.history_to_dict('funds')
+            }
             with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(self.price_history, f, ensure_ascii=False, indent=2)
+                json.dump(data, f, ensure_ascii=False, indent=2)
             self.logger.log_info(f'价格历史数据已保存到 {filepath}')
         except Exception as e:
             self.logger.log_error(f'保存历史数据失败: {str(e)}')
@@ -144,31 +284,40 @@ class DataProcessor:
     def load_history_from_file(self, filepath: str):
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
-                self.price_history = json.load(f)
+                data = json.load(f)
+            
+            history = self._empty_history()
+            for metal in ('gold', 'silver'):
+                history[metal].extend(HistoryPoint.from_dict(entry, 'price') for entry in data.get(metal, []))
+            for fund_code, entries in data.get('funds', {}).items():
+                history['funds'][fund_code] = deque(
+                    (HistoryPoint.from_dict(entry, 'estimated_value') for entry in entries),
+                    maxlen=self.max_history_length
+                )
+            
+            self.price_history = history
+            self._bump_all_versions()
             self.logger.log_info(f'价格历史数据已从 {filepath} 加载')
         except FileNotFoundError:
             self.logger.log_info(f'历史数据文件不存在，将创建新的记录')
         except Exception as e:
-            self.logger.log_error(f'加载历史数据失败: {str(e)}')
-            self.price_history = {
-                'gold': [],
-                'silver': [],
-                'funds': {}
-            }
+            # 保留原文件，可修复后通过 python -m modules.history_import 补录
+            self.logger.log_error(f'加载历史数据失败，已保留原文件 {filepath}: {str(e)}')
     
     def clear_old_history(self, days: int = 30):
-        cutoff_time = datetime.now().timestamp() - (days * 24 * 60 * 60)
+        cutoff_time = time.time() - (days * 24 * 60 * 60)
         
         for metal in ['gold', 'silver']:
-            self.price_history[metal] = [
-                entry for entry in self.price_history[metal]
-                if datetime.fromisoformat(entry['timestamp']).timestamp() > cutoff_time
-            ]
+            self.price_history[metal] = deque(
+                (point for point in self.price_history[metal] if point.timestamp > cutoff_time),
+                maxlen=self.max_history_length
+            )
         
         for fund_code in list(self.price_history['funds'].keys()):
-            self.price_history['funds'][fund_code] = [
-                entry for entry in self.price_history['funds'][fund_code]
-                if datetime.fromisoformat(entry['timestamp']).timestamp() > cutoff_time
-            ]
+            self.price_history['funds'][fund_code] = deque(
+                (point for point in self.price_history['funds'][fund_code] if point.timestamp > cutoff_time),
+                maxlen=self.max_history_length
+            )
         
+        self._bump_all_versions()
         self.logger.log_info(f'已清除 {days} 天前的历史数据')
@@ -1,6 +1,8 @@
 from typing import Dict, List
 from datetime import datetime
 
+from modules.quote_models import FundError
+
 class DisplayFormatter:
     USD_TO_CNY = 7.2
     OUNCE_TO_GRAM = 31.1034768
@@ -19,6 +21,27 @@ class DisplayFormatter:
             return cls._exchange_rate_manager.convert_usd_oz_to_cny_gram(price_usd_per_ounce)
         return price_usd_per_ounce * cls.USD_TO_CNY / cls.OUNCE_TO_GRAM
     
+    @classmethod
+    def convert_many_to_cny_per_gram(cls, prices: List[float]) -> List[float]:
+        return cls.convert_many_per_gram(prices, 'CNY')
+    
+    @classmethod
+    def convert_many_per_gram(cls, prices: List[float], currency: str = 'CNY') -> List[float]:
+        if cls._exchange_rate_manager:
+            return cls._exchange_rate_manager.convert_many(prices, currency=currency)
+        rate = {'USD': 1.0, 'CNY': cls.USD_TO_CNY}.get(currency.upper())
+        if rate is None:
+            raise ValueError(f'不支持的货币: {currency}')
+        return [price * rate / cls.OUNCE_TO_GRAM for price in prices]
+    
+    @classmethod
+    def convert_currency(cls, amount: float, base: str, quote: str) -> float:
+        if cls._exchange_rate_manager:
+            return cls._exchange_rate_manager.convert_amount(amount, base, quote)
+        if base.upper() == quote.upper():
+            return amount
+        raise ValueError(f'未配置汇率管理器，无法换算 {base}/{quote}')
+    
     @staticmethod
     def format_price(price: float) -> str:
         return f"{price:.2f}"
@@ -91,35 +114,33 @@ class DisplayFormatter:
         
         if 'gold' in data:
             gold = data['gold']
-            price = gold.get('current_price', gold.get('price', 0))
-            price_cny = DisplayFormatter.convert_to_cny_per_gram(price)
-            open_cny = DisplayFormatter.convert_to_cny_per_gram(gold['open_price'])
-            high_cny = DisplayFormatter.convert_to_cny_per_gram(gold['high_price'])
-            low_cny = DisplayFormatter.convert_to_cny_per_gram(gold['low_price'])
-            change_str = DisplayFormatter.format_change(gold.get('change_percent_str', gold.get('change_percent', '0%')))
+            price = gold.price
+            price_cny, open_cny, high_cny, low_cny = DisplayFormatter.convert_many_to_cny_per_gram(
+                [price, gold.open_price, gold.high_price, gold.low_price]
+            )
+            change_str = DisplayFormatter.format_change(gold.change_percent_str)
             price_with_change = DisplayFormatter.format_price_with_change('gold_cny', price_cny)
             
             lines.append("│" + "-" * 90 + "│")
-            lines.append(f"│ 🥇 {gold['name']}")
-            lines.append(f"│   美元/盎司: {DisplayFormatter.format_price(price)} | 开盘: {DisplayFormatter.format_price(gold['open_price'])} | 最高: {DisplayFormatter.format_price(gold['high_price'])} | 最低: {DisplayFormatter.format_price(gold['low_price'])}")
+            lines.append(f"│ 🥇 {gold.name}")
+            lines.append(f"│   美元/盎司: {DisplayFormatter.format_price(price)} | 开盘: {DisplayFormatter.format_price(gold.open_price)} | 最高: {DisplayFormatter.format_price(gold.high_price)} | 最低: {DisplayFormatter.format_price(gold.low_price)}")
             lines.append(f"│   人民币/克: {price_with_change} | 开盘: {DisplayFormatter.format_price(open_cny)} | 最高: {DisplayFormatter.format_price(high_cny)} | 最低: {DisplayFormatter.format_price(low_cny)}")
-            lines.append(f"│   涨跌幅: {change_str} | 更新: {gold['update_time']} | 来源: {gold.get('source', '未知')}")
+            lines.append(f"│   涨跌幅: {change_str} | 更新: {gold.update_time} | 来源: {gold.source or '未知'}")
         
         if 'silver' in data:
             silver = data['silver']
-            price = silver.get('current_price', silver.get('price', 0))
-            price_cny = DisplayFormatter.convert_to_cny_per_gram(price)
-            open_cny = DisplayFormatter.convert_to_cny_per_gram(silver['open_price'])
-            high_cny = DisplayFormatter.convert_to_cny_per_gram(silver['high_price'])
-            low_cny = DisplayFormatter.convert_to_cny_per_gram(silver['low_price'])
-            change_str = DisplayFormatter.format_change(silver.get('change_percent_str', silver.get('change_percent', '0%')))
+            price = silver.price
+            price_cny, open_cny, high_cny, low_cny = DisplayFormatter.convert_many_to_cny_per_gram(
+                [price, silver.open_price, silver.high_price, silver.low_price]
+            )
+            change_str = DisplayFormatter.format_change(silver.change_percent_str)
             price_with_change = DisplayFormatter.format_price_with_change('silver_cny', price_cny)
             
             lines.append("│" + "-" * 90 + "│")
-            lines.append(f"│ 🥈 {silver['name']}")
-            lines.append(f"│   美元/盎司: {DisplayFormatter.format_price(price)} | 开盘: {DisplayFormatter.format_price(silver['open_price'])} | 最高: {DisplayFormatter.format_price(silver['high_price'])} | 最低: {DisplayFormatter.format_price(silver['low_price'])}")
+            lines.append(f"│ 🥈 {silver.name}")
+            lines.append(f"│   美元/盎司: {DisplayFormatter.format_price(price)} | 开盘: {DisplayFormatter.format_price(silver.open_price)} | 最高: {DisplayFormatter.format_price(silver.high_price)} | 最低: {DisplayFormatter.format_price(silver.low_price)}")
             lines.append(f"│   人民币/克: {price_with_change} | 开盘: {DisplayFormatter.format_price(open_cny)} | 最高: {DisplayFormatter.format_price(high_cny)} | 最低: {DisplayFormatter.format_price(low_cny)}")
-            lines.append(f"│   涨跌幅: {change_str} | 更新: {silver['update_time']} | 来源: {silver.get('source', '未知')}")
+            lines.append(f"│   涨跌幅: {change_str} | 更新: {silver.update_time} | 来源: {silver.source or '未知'}")
         
         lines.append("│" + "-" * 90 + "│")
         
@@ -128,13 +149,13 @@ class DisplayFormatter:
             lines.append("│" + "-" * 90 + "│")
             
             for fund_code, fund_data in data['funds'].items():
-                if 'error' not in fund_data:
-                    change_str = DisplayFormatter.format_change(f"{fund_data['change_percent']:.2f}%")
-                    value_with_change = DisplayFormatter.format_fund_with_change(fund_code, fund_data['estimated_value'])
+                if not isinstance(fund_data, FundError):
+                    change_str = DisplayFormatter.format_change(f"{fund_data.change_percent:.2f}%")
+                    value_with_change = DisplayFormatter.format_fund_with_change(fund_code, fund_data.estimated_value)
                     lines.append("│" + "-" * 90 + "│")
-                    lines.append(f"│ 📊 基金代码: {fund_data['code']} | 基金名称: {fund_data['name']}")
-                    lines.append(f"│   单位净值: {DisplayFormatter.format_price(fund_data['net_value'])} | 估算净值: {value_with_change} | 涨跌幅: {change_str}")
-                    lines.append(f"│   更新时间: {fund_data['update_time']}")
+                    lines.append(f"│ 📊 基金代码: {fund_data.code} | 基金名称: {fund_data.name}")
+                    lines.append(f"│   单位净值: {DisplayFormatter.format_price(fund_data.net_value)} | 估算净值: {value_with_change} | 涨跌幅: {change_str}")
+                    lines.append(f"│   更新时间: {fund_data.update_time}")
         
         lines.append("└" + "─" * 90 + "┘")
         
@@ -9,17 +9,21 @@ from datetime import datetime
 
 class EmailNotifier:
     def __init__(self, config, logger):
-        self.config = config
         self.logger = logger
+        self.apply_config(config)
         
+        self.sent_emails = set()
+    
+    def apply_config(self, config, changed=None):
+        if changed is not None and 'email' not in changed:
+            return
+        self.config = config
         self.sender_email = config.get('email', 'sender_email')
         self.sender_password = config.get('email', 'sender_password')
         self.smtp_server = config.get('email', 'smtp_server')
         self.smtp_port = config.getint('email', 'smtp_port')
         self.retry_attempts = config.getint('email', 'retry_attempts')
         self.retry_delay = config.getint('email', 'retry_delay_seconds')
-        
-        self.sent_emails = set()
     
     def send_alert_email(self, recipients: List[str], subject: str, content: str) -> bool:
         success = True
@@ -1,11 +1,24 @@
 import requests
-import json
 import time
+from bisect import bisect_right
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Tuple
+from typing import Optional, Dict, List, Sequence, Tuple, Union
 from pathlib import Path
 import threading
 
+from modules.coalescer import RequestCoalescer
+from modules.rate_cache import RateCache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def round_cents(values: List[float]) -> List[float]:
+    # 与单个换算使用同一个 round()；numpy.round 先乘 100 再取整，恰好五厘的值会与 round() 差一分
+    return [round(value, 2) for value in values]
+
 
 class ExchangeRateManager:
     USD_TO_CNY = 7.2
@@ -17,114 +30,154 @@ class ExchangeRateManager:
     
     CACHE_FILE = Path(__file__).parent.parent / 'data' / 'exchange_rate_cache.json'
     
-    def __init__(self, logger=None):
+    RATE_PAIR = 'USD/CNY'
+    DEFAULT_HISTORY_CURRENCIES = ('CNY', 'EUR', 'HKD', 'GBP', 'JPY')
+    
+    CONVERSIONS = ('usd_oz_to_cny_gram', 'cny_gram_to_usd_oz')
+    
+    def __init__(self, logger=None, store=None, governor=None,
+                 history_currencies: Sequence[str] = DEFAULT_HISTORY_CURRENCIES, cache_file: Optional[str] = None):
         self.logger = logger
+        self.store = store
+        self.governor = governor
+        self.history_currencies = tuple(code.upper() for code in history_currencies)
         self._rate = None
+        self._rates: Dict[str, float] = {}
         self._last_update = None
         self._cache_duration = self.DEFAULT_CACHE_DURATION
-        self._cache_data = self._load_cache()
+        self._cache_data = {}
         self._lock = threading.Lock()
-        
-        if self._cache_data.get('rate'):
-            self._rate = self._cache_data['rate']
-            self._last_update = datetime.fromisoformat(self._cache_data['last_update'])
-            
-    def _load_cache(self) -> Dict:
+        self._coalescer = RequestCoalescer()
+        self.cache = RateCache(cache_file or str(self.CACHE_FILE), logger)
+        self._sync_from_cache()
+    
+    @classmethod
+    def from_config(cls, config, logger=None, store=None, governor=None) -> 'ExchangeRateManager':
+        currencies = config.get('exchange', 'history_currencies', fallback=None)
+        if currencies:
+            currencies = [code.strip() for code in currencies.split(',') if code.strip()]
+        manager = cls(logger, store, governor, currencies or cls.DEFAULT_HISTORY_CURRENCIES,
+                      config.get('exchange', 'cache_file', fallback=None) or None)
+        manager.set_cache_duration(config.getint('exchange', 'cache_duration', fallback=cls.DEFAULT_CACHE_DURATION))
+        return manager
+    
+    def _sync_from_cache(self) -> bool:
+        data = self.cache.read()
+        if data is self._cache_data or not data.get('rate'):
+            return False
         try:
-            if self.CACHE_FILE.exists():
-                with open(self.CACHE_FILE, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except Exception as e:
-            if self.logger:
-                self.logger.log_warning(f'加载汇率缓存失败: {str(e)}')
-        return {}
+            last_update = datetime.fromisoformat(data['last_update'])
+        except (KeyError, TypeError, ValueError):
+            return False
+        self._cache_data = data
+        if self._last_update is not None and last_update <= self._last_update:
+            return False
+        # 旧版缓存只有 USD/CNY 一个汇率，用它补出最小的汇率表，否则交叉汇率会在缓存仍然新鲜时失败
+        self._rates = self._parse_rates(data.get('rates')) or {'USD': 1.0, 'CNY': float(data['rate'])}
+        self._rate = data['rate']
+        self._last_update = last_update
+        return True
     
-    def _save_cache(self, rate: float, source: str):
+    def _save_cache(self, rates: Dict[str, float], source: str, now: datetime):
         try:
             cache_data = {
-                'rate': rate,
-                'last_update': datetime.now().isoformat(),
+                'rate': rates['CNY'],
+                'rates': rates,
+                'last_update': now.isoformat(),
                 'source': source
             }
-            self.CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.CACHE_FILE, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, ensure_ascii=False, indent=2)
+            self.cache.write(cache_data)
             self._cache_data = cache_data
         except Exception as e:
             if self.logger:
                 self.logger.log_warning(f'保存汇率缓存失败: {str(e)}')
     
-    def _fetch_from_exchangerate_api(self) -> Optional[float]:
+    def _record_rate(self, rates: Dict[str, float], source: str, now: datetime):
+        # 整张汇率表一次替换，读取方拿到的总是同一次查询的结果
+        self._rates = rates
+        self._rate = rates['CNY']
+        self._last_update = now
+        self._save_cache(rates, source, now)
+        if self.store:
+            ts = now.timestamp()
+            self.store.add_fx_rates(
+                (f'USD/{code}', ts, rates[code], source) for code in self.history_currencies if code in rates
+            )
+    
+    def _get(self, url: str) -> requests.Response:
+        if self.governor:
+            return self.governor.get(requests, url, timeout=self.API_TIMEOUT)
+        return requests.get(url, timeout=self.API_TIMEOUT)
+    
+    @staticmethod
+    def _parse_rates(rates: Dict) -> Optional[Dict[str, float]]:
+        table = {}
+        for code, value in (rates or {}).items():
+            if isinstance(value, dict):
+                value = value.get('value')
+            if isinstance(value, (int, float)) and value > 0:
+                table[code.upper()] = float(value)
+        if not table.get('CNY'):
+            return None
+        table['USD'] = 1.0
+        return table
+    
+    def _fetch_from_exchangerate_api(self) -> Optional[Dict[str, float]]:
         try:
             url = 'https://api.exchangerate-api.com/v4/latest/USD'
-            response = requests.get(url, timeout=self.API_TIMEOUT)
+            response = self._get(url)
             if response.status_code == 200:
-                data = response.json()
-                rate = data.get('rates', {}).get('CNY')
-                if rate:
-                    return rate
+                return self._parse_rates(response.json().get('rates'))
         except Exception as e:
             if self.logger:
                 self.logger.log_warning(f'Exchangerate-API 请求失败: {str(e)}')
         return None
     
-    def _fetch_from_fixer(self) -> Optional[float]:
+    def _fetch_from_fixer(self) -> Optional[Dict[str, float]]:
         try:
-            url = 'https://api.fixer.io/latest?base=USD&symbols=CNY'
-            response = requests.get(url, timeout=self.API_TIMEOUT)
+            url = 'https://api.fixer.io/latest?base=USD'
+            response = self._get(url)
             if response.status_code == 200:
-                data = response.json()
-                rate = data.get('rates', {}).get('CNY')
-                if rate:
-                    return rate
+                return self._parse_rates(response.json().get('rates'))
         except Exception as e:
             if self.logger:
                 self.logger.log_warning(f'Fixer API 请求失败: {str(e)}')
         return None
     
-    def _fetch_from_openexchangerates(self) -> Optional[float]:
+    def _fetch_from_openexchangerates(self) -> Optional[Dict[str, float]]:
         try:
-            url = 'https://openexchangerates.org/api/latest.json?app_id=demo&base=USD&symbols=CNY'
-            response = requests.get(url, timeout=self.API_TIMEOUT)
+            url = 'https://openexchangerates.org/api/latest.json?app_id=demo&base=USD'
+            response = self._get(url)
             if response.status_code == 200:
-                data = response.json()
-                rate = data.get('rates', {}).get('CNY')
-                if rate:
-                    return rate
+                return self._parse_rates(response.json().get('rates'))
         except Exception as e:
             if self.logger:
                 self.logger.log_warning(f'Open Exchange Rates API 请求失败: {str(e)}')
         return None
     
-    def _fetch_from_currencyapi(self) -> Optional[float]:
+    def _fetch_from_currencyapi(self) -> Optional[Dict[str, float]]:
         try:
             url = 'https://api.currencyapi.com/v3/latest?apikey=fca_live_demo&base_currency=USD'
-            response = requests.get(url, timeout=self.API_TIMEOUT)
+            response = self._get(url)
             if response.status_code == 200:
-                data = response.json()
-                rate = data.get('data', {}).get('CNY', {}).get('value')
-                if rate:
-                    return rate
+                return self._parse_rates(response.json().get('data'))
         except Exception as e:
             if self.logger:
                 self.logger.log_warning(f'CurrencyAPI 请求失败: {str(e)}')
         return None
     
-    def _fetch_from_exchange_rate_host(self) -> Optional[float]:
+    def _fetch_from_exchange_rate_host(self) -> Optional[Dict[str, float]]:
         try:
-            url = 'https://api.exchangerate.host/latest?base=USD&symbols=CNY'
-            response = requests.get(url, timeout=self.API_TIMEOUT)
+            url = 'https://api.exchangerate.host/latest?base=USD'
+            response = self._get(url)
             if response.status_code == 200:
-                data = response.json()
-                rate = data.get('rates', {}).get('CNY')
-                if rate:
-                    return rate
+                return self._parse_rates(response.json().get('rates'))
         except Exception as e:
             if self.logger:
                 self.logger.log_warning(f'ExchangeRate.host 请求失败: {str(e)}')
         return None
     
-    def _fetch_rate_from_multiple_sources(self) -> Tuple[Optional[float], Optional[str]]:
+    def _fetch_rate_from_multiple_sources(self) -> Tuple[Optional[Dict[str, float]], Optional[str]]:
         sources = [
             ('Exchangerate-API', self._fetch_from_exchangerate_api),
             ('ExchangeRate.host', self._fetch_from_exchange_rate_host),
@@ -135,39 +188,71 @@ class ExchangeRateManager:
         
         for source_name, fetch_func in sources:
             for attempt in range(self.MAX_RETRIES):
-                rate = fetch_func()
-                if rate and 1 < rate < 15:
+                rates = fetch_func()
+                if rates and 1 < rates['CNY'] < 15:
                     if self.logger:
-                        self.logger.log_info(f'从 {source_name} 获取汇率成功: {rate:.4f}')
-                    return rate, source_name
+                        self.logger.log_info(f'从 {source_name} 获取汇率成功: {rates["CNY"]:.4f}，共 {len(rates)} 种货币')
+                    return rates, source_name
                 time.sleep(0.5)
         
         if self.logger:
             self.logger.log_error('所有汇率API源均获取失败')
         return None, None
     
-    def get_rate(self, force_refresh: bool = False) -> float:
-        with self._lock:
-            now = datetime.now()
-            
-            if self._rate is None or force_refresh:
-                rate, source = self._fetch_rate_from_multiple_sources()
-                if rate:
-                    self._rate = rate
-                    self._last_update = now
-                    self._save_cache(rate, source or 'Unknown')
-                    return rate
-            
-            if self._last_update:
-                age = (now - self._last_update).total_seconds()
-                if age >= self._cache_duration:
-                    rate, source = self._fetch_rate_from_multiple_sources()
-                    if rate:
-                        self._rate = rate
-                        self._last_update = now
-                        self._save_cache(rate, source or 'Unknown')
+    def _expired(self, now: datetime) -> bool:
+        return self._last_update is None or (now - self._last_update).total_seconds() >= self._cache_duration
+    
+    def _refresh_shared(self, requested_at: datetime, force: bool) -> Optional[Dict[str, float]]:
+        lock = self.cache.lock
+        if not lock.try_acquire():
+            if self._rate is not None and not force:
+                # 其他 worker 正在刷新，先沿用当前汇率，新汇率写入缓存文件后再读取
+                return None
+            lock.acquire()
+        try:
+            # 等锁期间其他 worker 可能已经刷新过，直接使用它写入的结果
+            self._sync_from_cache()
+            if self._last_update is not None and (
+                    self._last_update >= requested_at if force else not self._expired(datetime.now())):
+                return self._rates or None
             
-            return self._rate if self._rate is not None else self.USD_TO_CNY
+            rates, source = self._fetch_rate_from_multiple_sources()
+            if rates:
+                with self._lock:
+                    self._record_rate(rates, source or 'Unknown', datetime.now())
+            return rates
+        finally:
+            lock.release()
+    
+    def _refresh(self, requested_at: datetime, force: bool = False) -> Optional[Dict[str, float]]:
+        # 进程内的并发刷新共用同一次查询，跨进程由缓存文件锁保证只有一个 worker 请求上游
+        return self._coalescer.do(('fx', force), lambda: self._refresh_shared(requested_at, force))
+    
+    def get_rates(self, force_refresh: bool = False) -> Dict[str, float]:
+        now = datetime.now()
+        self._sync_from_cache()
+        if self._rate is None or force_refresh or self._expired(now):
+            rates = self._refresh(now, force_refresh)
+            if rates:
+                return rates
+        
+        if self._rates:
+            return self._rates
+        return {'USD': 1.0, 'CNY': self._rate if self._rate is not None else self.USD_TO_CNY}
+    
+    def get_rate(self, force_refresh: bool = False) -> float:
+        return self.get_rates(force_refresh)['CNY']
+    
+    def cross_rate(self, base: str, quote: str, force_refresh: bool = False) -> float:
+        rates = self.get_rates(force_refresh)
+        try:
+            # 所有汇率都以美元为基准，任意两种货币的汇率由两次字典查找得出
+            return rates[quote.upper()] / rates[base.upper()]
+        except KeyError as e:
+            raise ValueError(f'不支持的货币: {e.args[0]}')
+    
+    def convert_amount(self, amount: float, base: str, quote: str, force_refresh: bool = False) -> float:
+        return round(amount * self.cross_rate(base, quote, force_refresh), 2)
     
     def convert_usd_oz_to_cny_gram(self, price_usd_per_ounce: float, force_refresh: bool = False) -> float:
         rate = self.get_rate(force_refresh)
@@ -179,54 +264,85 @@ class ExchangeRateManager:
         result = price_cny_per_gram * self.OUNCE_TO_GRAM / rate
         return round(result, 2)
     
+    def convert_many(self, prices: Sequence[float], directions: Union[str, Sequence[str]] = 'usd_oz_to_cny_gram',
+                     force_refresh: bool = False, currency: str = 'CNY') -> List[float]:
+        uniform = isinstance(directions, str)
+        if not uniform and len(directions) != len(prices):
+            raise ValueError(f'转换方向数量({len(directions)})与价格数量({len(prices)})不一致')
+        unknown = {directions} if uniform else set(directions)
+        unknown -= set(self.CONVERSIONS)
+        if unknown:
+            raise ValueError(f'不支持的转换方向: {", ".join(sorted(unknown))}')
+        if not len(prices):
+            return []
+        
+        # 整批只读取一次汇率，运算顺序与单个换算一致，结果逐个相同；currency 指定按克计价的货币
+        rate = self.cross_rate('USD', currency, force_refresh)
+        to_cny = self.CONVERSIONS[0]
+        if numpy is not None:
+            values = numpy.asarray(prices, dtype=numpy.float64)
+            if uniform:
+                result = values * rate / self.OUNCE_TO_GRAM if directions == to_cny else values * self.OUNCE_TO_GRAM / rate
+            else:
+                result = numpy.where(numpy.asarray(directions) == to_cny,
+                                     values * rate / self.OUNCE_TO_GRAM, values * self.OUNCE_TO_GRAM / rate)
+            return round_cents(result.tolist())
+        
+        if uniform:
+            directions = [directions] * len(prices)
+        return [
+            round(float(price) * rate / self.OUNCE_TO_GRAM if direction == to_cny
+                  else float(price) * self.OUNCE_TO_GRAM / rate, 2)
+            for price, direction in zip(prices, directions)
+        ]
+    
+    def rate_series(self, currency: str = 'CNY', start: Optional[float] = None,
+                    end: Optional[float] = None) -> Tuple[List[float], List[float]]:
+        if not self.store:
+            return [], []
+        rows = self.store.query_fx_rates(f'USD/{currency.upper()}', start, end)
+        return [row[0] for row in rows], [row[1] for row in rows]
+    
+    def convert_series(self, timestamps: Sequence[float], prices: Sequence[float],
+                       currency: str = 'CNY') -> Tuple[List[float], List[float]]:
+        if len(timestamps) != len(prices):
+            raise ValueError(f'时间戳数量({len(timestamps)})与价格数量({len(prices)})不一致')
+        if not len(prices):
+            return [], []
+        
+        fx_ts, fx_rates = self.rate_series(currency, min(timestamps), max(timestamps))
+        if not fx_ts:
+            # 没有记录过该货币的汇率序列，只能按当前汇率换算
+            rate = self.cross_rate('USD', currency)
+            return self.convert_many(prices, currency=currency), [rate] * len(prices)
+        
+        # as-of 连接：每个行情点取其时间之前最近一次的汇率，早于第一条汇率记录的点使用第一条
+        if numpy is not None:
+            index = numpy.searchsorted(numpy.asarray(fx_ts), numpy.asarray(timestamps, dtype=numpy.float64), side='right') - 1
+            rates = numpy.asarray(fx_rates)[numpy.maximum(index, 0)]
+            result = numpy.asarray(prices, dtype=numpy.float64) * rates / self.OUNCE_TO_GRAM
+            return round_cents(result.tolist()), rates.tolist()
+        
+        rates = [fx_rates[max(bisect_right(fx_ts, ts) - 1, 0)] for ts in timestamps]
+        return [round(float(price) * rate / self.OUNCE_TO_GRAM, 2) for price, rate in zip(prices, rates)], rates
+    
     def get_rate_info(self) -> Dict:
         return {
             'rate': self._rate if self._rate is not None else self.USD_TO_CNY,
             'last_update': self._last_update.isoformat() if self._last_update else None,
             'source': self._cache_data.get('source', 'Fixed'),
+            'currencies': len(self._rates),
             'is_cached': self._last_update is not None,
             'cache_age_seconds': (datetime.now() - self._last_update).total_seconds() if self._last_update else None
         }
     
+    def after_fork(self):
+        self._lock = threading.Lock()
+        self._coalescer.after_fork()
+        self.cache.after_fork()
+    
     def set_cache_duration(self, seconds: int):
         self._cache_duration = max(300, min(86400, seconds))
     
     def refresh_now(self) -> bool:
-        rate, source = self._fetch_rate_from_multiple_sources()
-        if rate:
-            with self._lock:
-                self._rate = rate
-                self._last_update = datetime.now()
-                self._save_cache(rate, source or 'Unknown')
-            return True
-        return False
-    
-    @staticmethod
-    def validate_conversion(test_cases: Dict[str, Tuple[float, float, float]]) -> Dict:
-        results = {
-            'total_tests': len(test_cases),
-            'passed': 0,
-            'failed': 0,
-            'details': []
-        }
-        
-        for name, (price_usd_oz, expected_rate, tolerance) in test_cases.items():
-            actual_rate = ExchangeRateManager.USD_TO_CNY
-            error = abs(actual_rate - expected_rate)
-            passed = error <= tolerance
-            
-            results['details'].append({
-                'name': name,
-                'expected_rate': expected_rate,
-                'actual_rate': actual_rate,
-                'error': error,
-                'tolerance': tolerance,
-                'passed': passed
-            })
-            
-            if passed:
-                results['passed'] += 1
-            else:
-                results['failed'] += 1
-        
-        return results
+        return bool(self._refresh(datetime.now(), True))
@@ -0,0 +1,102 @@
+import os
+import tempfile
+import threading
+from typing import Union
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+def atomic_write(path: str, data: Union[bytes, str], fsync: bool = True):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        # 同目录内 rename 是原子的，读取方要么看到旧文件要么看到完整的新文件
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class FileLock:
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = None
+        self._pid = None
+        self._thread_lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _open(self) -> int:
+        if self.fd is None or self._pid != os.getpid():
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        return self.fd
+
+    def acquire(self):
+        # flock 只在不同的打开文件之间互斥，同一进程内的线程还需要线程锁
+        self._thread_lock.acquire()
+        try:
+            fd = self._open()
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def try_acquire(self) -> bool:
+        if not self._thread_lock.acquire(blocking=False):
+            return False
+        try:
+            fd = self._open()
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._thread_lock.release()
+            return False
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return True
+
+    def release(self):
+        try:
+            if fcntl and self.fd is not None:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+        finally:
+            self._thread_lock.release()
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def after_fork(self):
+        # 子进程需要自己的文件描述符，否则 flock 与父进程共享同一把锁
+        self.fd = None
+        self._pid = None
+        self._thread_lock = threading.Lock()
+
+    def close(self):
+        if self.fd is not None and self._pid == os.getpid():
+            os.close(self.fd)
+        self.fd = None
+        self._pid = None
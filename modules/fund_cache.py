@@ -0,0 +1,103 @@
+import threading
+import time
+from dataclasses import replace
+from datetime import datetime
+from typing import Dict, Optional
+
+from modules.quote_models import FundQuote
+from modules.trading_calendar import CN_TIMEZONE, TradingCalendar
+
+
+FUND_TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+DEFAULT_TRADING_TTL = 60
+SETTLE_RETRY_TTL = 300
+CLOSED_FALLBACK_TTL = 86400
+
+
+def quote_time(quote: FundQuote) -> Optional[float]:
+    try:
+        return datetime.strptime(quote.update_time, FUND_TIME_FORMAT).replace(tzinfo=CN_TIMEZONE).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class _CacheEntry:
+    __slots__ = ('quote', 'expires_at', 'retries')
+
+    def __init__(self, quote: FundQuote, expires_at: float, retries: int):
+        self.quote = quote
+        self.expires_at = expires_at
+        self.retries = retries
+
+
+class FundQuoteCache:
+    def __init__(self, calendar: TradingCalendar, trading_ttl: float = DEFAULT_TRADING_TTL,
+                 settle_retry_ttl: float = SETTLE_RETRY_TTL):
+        self.calendar = calendar
+        self.trading_ttl = trading_ttl
+        self.settle_retry_ttl = settle_retry_ttl
+        self.names: Dict[str, str] = {}
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[str, _CacheEntry] = {}
+        self._lock = threading.Lock()
+
+    def expiry_for(self, quote: FundQuote, now: float, retries: int = 0) -> float:
+        session = self.calendar.current_session(now)
+        if session is not None:
+            return min(now + self.trading_ttl, session[1])
+
+        next_open = self.calendar.next_open(now) or now + CLOSED_FALLBACK_TTL
+        last_close = self.calendar.last_close(now)
+        updated = quote_time(quote)
+        if updated is not None and last_close is not None and updated >= last_close:
+            # 估值已经更新到最近一次收盘，下个交易时段开始前不会再变化
+            return next_open
+
+        # 上游估值还没跟上收盘，按指数退避重试，避免非交易时段持续请求
+        return min(now + self.settle_retry_ttl * (2 ** retries), next_open)
+
+    def get(self, fund_code: str, now: Optional[float] = None) -> Optional[FundQuote]:
+        now = now or time.time()
+        entry = self._entries.get(fund_code)
+        if entry is None or entry.expires_at <= now:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return replace(entry.quote)
+
+    def put(self, fund_code: str, quote: FundQuote, now: Optional[float] = None) -> FundQuote:
+        now = now or time.time()
+
+        if quote.name:
+            self.names[fund_code] = quote.name
+        elif fund_code in self.names:
+            quote.name = self.names[fund_code]
+
+        with self._lock:
+            previous = self._entries.get(fund_code)
+            retries = 0
+            if (previous is not None and previous.quote.update_time == quote.update_time
+                    and not self.calendar.is_open(now)):
+                retries = previous.retries + 1
+            self._entries[fund_code] = _CacheEntry(replace(quote), self.expiry_for(quote, now, retries), retries)
+        return quote
+
+    def get_name(self, fund_code: str) -> Optional[str]:
+        return self.names.get(fund_code)
+
+    def stats(self) -> Dict:
+        return {
+            'entries': len(self._entries),
+            'names': len(self.names),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def after_fork(self):
+        self._lock = threading.Lock()
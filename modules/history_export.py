@@ -0,0 +1,60 @@
+import csv
+import io
+from typing import Iterable, Iterator, List
+
+from modules import json_codec
+from modules.quote_models import format_timestamp
+
+
+EXPORT_FIELDS = ('asset', 'timestamp', 'time', 'value', 'change_percent')
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def iter_csv(batches: Iterable[List]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(EXPORT_FIELDS)
+
+    for rows in batches:
+        writer.writerows(
+            (asset, ts, format_timestamp(ts), value, change_percent)
+            for asset, ts, value, change_percent in rows
+        )
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+    # 没有数据时也要输出表头
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def iter_ndjson(batches: Iterable[List]) -> Iterator[bytes]:
+    for rows in batches:
+        yield b''.join(
+            json_codec.dumps({
+                'asset': asset,
+                'timestamp': ts,
+                'time': format_timestamp(ts),
+                'value': value,
+                'change_percent': change_percent
+            }) + b'\n'
+            for asset, ts, value, change_percent in rows
+        )
+
+
+EXPORT_WRITERS = {
+    'csv': iter_csv,
+    'ndjson': iter_ndjson,
+}
+
+
+def export_stream(store, assets: List[str], output_format: str, start=None, end=None) -> Iterator[bytes]:
+    writer = EXPORT_WRITERS.get(output_format)
+    if writer is None:
+        raise ValueError(f'不支持的导出格式: {output_format}')
+    return writer(store.iter_series(assets, start, end))
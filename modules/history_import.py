@@ -0,0 +1,392 @@
+import argparse
+import configparser
+import csv
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from modules import json_codec
+from modules.columnar_history import ColumnarHistory
+from modules.data_processor import FUND_ASSET_PREFIX, fund_asset
+from modules.file_utils import atomic_write
+from modules.history_store import HistoryStore
+from modules.logger import logger_instance
+from modules.retention import RetentionEngine, RetentionPolicy
+
+
+DEFAULT_CHUNK_SIZE = 50000
+MAX_REPORTED_ERRORS = 20
+HASH_BLOCK_SIZE = 1 << 20
+
+PROGRESS_KEYS = ('rows', 'imported', 'duplicates', 'invalid', 'offset', 'total_bytes')
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+METAL_ASSETS = ('gold', 'silver')
+TIME_KEYS = ('timestamp', 'ts', 'time', 'date')
+VALUE_KEYS = ('value', 'price', 'estimated_value', 'net_value')
+
+IMPORT_FORMATS = {
+    '.csv': 'csv',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+}
+
+
+def normalize_asset(name: str) -> str:
+    name = str(name).strip()
+    if name in METAL_ASSETS or (name.startswith(FUND_ASSET_PREFIX) and len(name) > len(FUND_ASSET_PREFIX)):
+        return name
+    if name.isdigit():
+        return fund_asset(name)
+    raise ValueError(f'未知的资产: {name}')
+
+
+def parse_timestamp(value) -> float:
+    try:
+        ts = float(value)
+    except ValueError:
+        ts = datetime.fromisoformat(str(value).strip()).timestamp()
+
+    # 兼容毫秒时间戳
+    if ts > 1e11:
+        ts /= 1000
+    if not math.isfinite(ts) or ts <= 0:
+        raise ValueError(f'无效的时间: {value}')
+    return ts
+
+
+class _AssetNames(dict):
+    def __missing__(self, name):
+        asset = normalize_asset(name)
+        self[name] = asset
+        return asset
+
+
+def _validate(asset: str, ts, value, change_percent) -> Tuple[str, float, float, float]:
+    if value in (None, ''):
+        raise ValueError('缺少价格字段')
+    value = float(value)
+    if not math.isfinite(value) or value <= 0:
+        raise ValueError(f'无效的价格: {value}')
+
+    change_percent = float(change_percent) if change_percent not in (None, '') else 0.0
+    if not math.isfinite(change_percent):
+        raise ValueError(f'无效的涨跌幅: {change_percent}')
+
+    if ts in (None, ''):
+        raise ValueError('缺少时间字段')
+    return asset, parse_timestamp(ts), value, change_percent
+
+
+def _first_present(record: Dict, keys):
+    for key in keys:
+        value = record.get(key)
+        if value not in (None, ''):
+            return value
+    return None
+
+
+def parse_record(record: Dict, default_asset: Optional[str] = None, assets: Optional[Dict] = None):
+    asset = record.get('asset') or default_asset
+    if not asset:
+        raise ValueError('缺少资产名称')
+    asset = assets[asset] if assets is not None else normalize_asset(asset)
+    return _validate(asset, _first_present(record, TIME_KEYS), _first_present(record, VALUE_KEYS),
+                     record.get('change_percent'))
+
+
+def csv_row_parser(header: List[str], default_asset: Optional[str] = None, assets: Optional[Dict] = None):
+    index = {name: position for position, name in enumerate(header)}
+    asset_index = index.get('asset')
+    ts_index = next((index[key] for key in TIME_KEYS if key in index), None)
+    value_index = next((index[key] for key in VALUE_KEYS if key in index), None)
+    change_index = index.get('change_percent')
+
+    if ts_index is None:
+        raise ValueError('CSV 缺少时间列')
+    if value_index is None:
+        raise ValueError('CSV 缺少价格列')
+    if asset_index is None and not default_asset:
+        raise ValueError('CSV 缺少 asset 列，请指定资产')
+    assets = assets if assets is not None else _AssetNames()
+
+    # 列位置在表头解析时确定，逐行只做定位和数值校验
+    def parse(fields: List[str]) -> Tuple[str, float, float, float]:
+        asset = fields[asset_index] if asset_index is not None else ''
+        if not asset:
+            if not default_asset:
+                raise ValueError('缺少资产名称')
+            asset = default_asset
+        change_percent = fields[change_index] if change_index is not None else None
+        return _validate(assets[asset], fields[ts_index], fields[value_index], change_percent)
+
+    return parse
+
+
+def detect_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in IMPORT_FORMATS:
+        raise ValueError(f'无法识别的文件格式: {path}，请指定 csv 或 ndjson')
+    return IMPORT_FORMATS[extension]
+
+
+class HistoryImporter:
+    def __init__(self, store, logger=None, columnar=None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.store = store
+        self.logger = logger
+        self.columnar = columnar
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def file_digest(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _file_identity(self, path: str) -> Dict:
+        # 以文件内容识别断点，重新上传或移动后的同一文件仍能继续导入
+        return {'sha256': self.file_digest(path), 'size': os.path.getsize(path)}
+
+    def _load_checkpoint(self, checkpoint_path: str, identity: Dict) -> Optional[Dict]:
+        try:
+            with open(checkpoint_path, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if checkpoint.get('file') != identity:
+            return None
+        return checkpoint
+
+    def _save_checkpoint(self, checkpoint_path: str, checkpoint: Dict):
+        atomic_write(checkpoint_path, json.dumps(checkpoint, ensure_ascii=False), fsync=False)
+
+    def import_file(self, path: str, input_format: Optional[str] = None, asset: Optional[str] = None,
+                    checkpoint_path: Optional[str] = None, resume: bool = True,
+                    progress: Optional[Callable[[Dict], None]] = None, checkpoint_dir: Optional[str] = None) -> Dict:
+        input_format = input_format or detect_format(path)
+        if input_format not in ('csv', 'ndjson'):
+            raise ValueError(f'不支持的导入格式: {input_format}')
+        default_asset = normalize_asset(asset) if asset else None
+
+        identity = self._file_identity(path)
+        if checkpoint_path is None:
+            if checkpoint_dir:
+                checkpoint_path = os.path.join(checkpoint_dir, f'{identity["sha256"]}.json')
+            else:
+                checkpoint_path = f'{path}.checkpoint.json'
+        checkpoint = self._load_checkpoint(checkpoint_path, identity) if resume else None
+        stats = {
+            'rows': 0,
+            'imported': 0,
+            'duplicates': 0,
+            'invalid': 0,
+            'offset': 0,
+            'line': 0,
+        }
+        if checkpoint:
+            stats.update(checkpoint['stats'])
+        stats['total_bytes'] = identity['size']
+        errors: List[str] = []
+        assets = set()
+        started = time.monotonic()
+
+        asset_names = _AssetNames()
+        with open(path, 'rb') as f:
+            if input_format == 'csv':
+                header_line = f.readline()
+                header = [name.strip().lower() for name in next(csv.reader([header_line.decode('utf-8-sig')]))]
+                parse_fields = csv_row_parser(header, default_asset, asset_names)
+                if not stats['offset']:
+                    stats['offset'] = f.tell()
+                    stats['line'] = 1
+
+            if checkpoint:
+                if self.logger:
+                    self.logger.log_info(f'从断点继续导入 {path}: 第 {stats["line"]} 行, 偏移 {stats["offset"]}')
+            f.seek(stats['offset'])
+
+            chunk: Dict[Tuple[str, float], Tuple] = {}
+            chunk_rows = 0
+            offset = stats['offset']
+            line_number = stats['line']
+
+            def commit():
+                inserted = self.store.insert_quotes(list(chunk.values())) if chunk else 0
+                assets.update(asset_name for asset_name, ts in chunk)
+                stats['rows'] += chunk_rows
+                stats['imported'] += inserted
+                stats['duplicates'] += chunk_rows - inserted
+                stats['offset'] = offset
+                stats['line'] = line_number
+                self._save_checkpoint(checkpoint_path, {
+                    'file': identity,
+                    'stats': {key: stats[key] for key in ('rows', 'imported', 'duplicates', 'invalid', 'offset', 'line')}
+                })
+                if progress:
+                    progress(stats)
+
+            for raw_line in f:
+                offset += len(raw_line)
+                line_number += 1
+                if not raw_line.strip():
+                    continue
+
+                try:
+                    if input_format == 'csv':
+                        text = raw_line.decode('utf-8').rstrip('\r\n')
+                        row = parse_fields(text.split(',') if '"' not in text else next(csv.reader([text])))
+                    else:
+                        record = json_codec.loads(raw_line)
+                        if not isinstance(record, dict):
+                            raise ValueError('每行必须是一个 JSON 对象')
+                        row = parse_record(record, default_asset, asset_names)
+                except (ValueError, TypeError, IndexError, UnicodeDecodeError) as e:
+                    stats['invalid'] += 1
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append(f'第 {line_number} 行: {str(e)}')
+                    continue
+
+                chunk[(row[0], row[1])] = row
+                chunk_rows += 1
+                if chunk_rows >= self.chunk_size:
+                    commit()
+                    chunk = {}
+                    chunk_rows = 0
+
+            commit()
+
+        if self.columnar and assets:
+            self.columnar.rewrite_from_store(self.store, sorted(assets))
+
+        stats['assets'] = sorted(assets)
+        stats['errors'] = errors
+        stats['resumed'] = checkpoint is not None
+        stats['elapsed_seconds'] = round(time.monotonic() - started, 3)
+        if self.logger:
+            self.logger.log_info(
+                f'历史数据导入完成 {path}: 读取 {stats["rows"]} 行, 新增 {stats["imported"]} 条, '
+                f'重复 {stats["duplicates"]} 条, 无效 {stats["invalid"]} 行, 耗时 {stats["elapsed_seconds"]} 秒'
+            )
+        return stats
+
+
+class ImportJobs:
+    def __init__(self, directory: str, logger=None):
+        self.directory = directory
+        self.logger = logger
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='history-import')
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f'{job_id}.json')
+
+    def _write(self, job: Dict):
+        # 任务状态写入文件，任意 worker 都能查询到其他 worker 上运行的导入
+        job['updated_at'] = datetime.now().isoformat()
+        atomic_write(self._path(job['id']), json.dumps(job, ensure_ascii=False), fsync=False)
+
+    def submit(self, filename: str, task: Callable[[Callable[[Dict], None]], Dict]) -> Dict:
+        job = {
+            'id': uuid.uuid4().hex,
+            'status': 'queued',
+            'file': filename,
+            'progress': None,
+            'result': None,
+            'error': None,
+            'created_at': datetime.now().isoformat(),
+        }
+        self._write(job)
+        self._executor.submit(self._run, dict(job), task)
+        return job
+
+    def _run(self, job: Dict, task: Callable[[Callable[[Dict], None]], Dict]):
+        job['status'] = 'running'
+        self._write(job)
+
+        def progress(stats: Dict):
+            job['progress'] = {key: stats[key] for key in PROGRESS_KEYS}
+            self._write(job)
+
+        try:
+            job['result'] = task(progress)
+            job['status'] = 'completed'
+        except Exception as e:
+            job['status'] = 'failed'
+            job['error'] = str(e)
+            if self.logger:
+                self.logger.log_error(f'历史数据导入任务 {job["id"]} 失败: {str(e)}')
+        self._write(job)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        if not _JOB_ID.match(job_id):
+            return None
+        try:
+            with open(self._path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def after_fork(self):
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='history-import')
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def _print_progress(stats: Dict):
+    percent = stats['offset'] / stats['total_bytes'] * 100 if stats['total_bytes'] else 100.0
+    print(f'\r已处理 {percent:5.1f}%  读取 {stats["rows"]} 行  新增 {stats["imported"]} 条', end='', file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='批量导入历史行情数据 (CSV/NDJSON)')
+    parser.add_argument('files', nargs='+', help='待导入的文件')
+    parser.add_argument('--format', choices=('csv', 'ndjson'), help='文件格式，默认按扩展名识别')
+    parser.add_argument('--asset', help='文件中没有 asset 列时使用的资产，如 gold、silver 或基金代码')
+    parser.add_argument('--config', default=os.path.join('config', 'config.ini'), help='配置文件路径')
+    parser.add_argument('--db', help='历史数据库路径，默认读取配置文件')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='每批写入的行数')
+    parser.add_argument('--no-resume', action='store_true', help='忽略断点，从头导入')
+    args = parser.parse_args(argv)
+
+    config = configparser.ConfigParser()
+    config.read(args.config, encoding='utf-8')
+    db_path = args.db or config.get('storage', 'history_db', fallback=os.path.join('data', 'market_history.db'))
+    columnar_dir = config.get('storage', 'columnar_dir', fallback=os.path.join('data', 'columns'))
+
+    store = HistoryStore(db_path, logger_instance)
+    columnar = ColumnarHistory(columnar_dir, logger_instance) if columnar_dir else None
+    importer = HistoryImporter(store, logger_instance, columnar, args.chunk_size)
+
+    exit_code = 0
+    try:
+        for path in args.files:
+            try:
+                stats = importer.import_file(path, args.format, args.asset, resume=not args.no_resume,
+                                             progress=_print_progress)
+            except (OSError, ValueError) as e:
+                print(f'\n导入失败 {path}: {str(e)}', file=sys.stderr)
+                exit_code = 1
+                continue
+            print(file=sys.stderr)
+            for error in stats['errors']:
+                print(f'  {error}', file=sys.stderr)
+
+        RetentionEngine(store, RetentionPolicy.from_config(config), columnar, logger_instance).run()
+    finally:
+        store.close()
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,367 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+QuoteRow = Tuple[str, float, float, float]
+
+DEFAULT_EXPORT_BATCH_SIZE = 5000
+
+_RAW_AS_ROLLUP_SQL = (
+    'SELECT asset, ts, value, value, value, value, change_percent, 1, ts, ts '
+    'FROM quotes WHERE ts < ? ORDER BY asset, ts'
+)
+_ROLLUP_SQL = (
+    'SELECT asset, bucket, open, high, low, close, change_percent, count, first_ts, last_ts '
+    'FROM rollups WHERE resolution = ? AND bucket < ? ORDER BY asset, bucket'
+)
+
+
+def _merge_rollup(current: list, row) -> list:
+    # row: (open, high, low, close, change_percent, count, first_ts, last_ts)
+    if row[6] < current[6]:
+        current[0] = row[0]
+        current[6] = row[6]
+    if row[7] >= current[7]:
+        current[3] = row[3]
+        current[4] = row[4]
+        current[7] = row[7]
+    current[1] = max(current[1], row[1])
+    current[2] = min(current[2], row[2])
+    current[5] += row[5]
+    return current
+
+
+class HistoryStore:
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS quotes (
+            asset TEXT NOT NULL,
+            ts REAL NOT NULL,
+            value REAL NOT NULL,
+            change_percent REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (asset, ts)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS fx_rates (
+            pair TEXT NOT NULL,
+            ts REAL NOT NULL,
+            rate REAL NOT NULL,
+            source TEXT,
+            PRIMARY KEY (pair, ts)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS rollups (
+            asset TEXT NOT NULL,
+            resolution INTEGER NOT NULL,
+            bucket REAL NOT NULL,
+            open REAL NOT NULL,
+            high REAL NOT NULL,
+            low REAL NOT NULL,
+            close REAL NOT NULL,
+            change_percent REAL NOT NULL,
+            count INTEGER NOT NULL,
+            first_ts REAL NOT NULL,
+            last_ts REAL NOT NULL,
+            PRIMARY KEY (asset, resolution, bucket)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_rollups_asset_bucket ON rollups (asset, bucket);
+
+        CREATE TABLE IF NOT EXISTS alerts (
+            ts REAL NOT NULL,
+            alert_type TEXT NOT NULL,
+            asset_name TEXT NOT NULL,
+            info TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_alerts_ts ON alerts (ts);
+    '''
+
+    DEFAULT_BATCH_SIZE = 500
+    DEFAULT_FLUSH_INTERVAL = 5.0
+
+    def __init__(self, db_path: str, logger=None, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.logger = logger
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._local = threading.local()
+        self._pending: List[QuoteRow] = []
+        self._pending_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('PRAGMA busy_timeout=30000')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def after_fork(self):
+        self._local = threading.local()
+        self._pending_lock = threading.Lock()
+
+    def add_quotes(self, rows: Iterable[QuoteRow]):
+        with self._pending_lock:
+            self._pending.extend(rows)
+            due = (len(self._pending) >= self.batch_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def add_quote(self, asset: str, ts: float, value: float, change_percent: float = 0.0):
+        self.add_quotes(((asset, ts, value, change_percent),))
+
+    def flush(self) -> int:
+        with self._pending_lock:
+            rows = self._pending
+            self._pending = []
+            self._last_flush = time.monotonic()
+
+        if not rows:
+            return 0
+
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute('BEGIN')
+                connection.executemany(
+                    'INSERT OR IGNORE INTO quotes (asset, ts, value, change_percent) VALUES (?, ?, ?, ?)',
+                    rows
+                )
+        except sqlite3.Error as e:
+            if self.logger:
+                self.logger.log_error(f'写入历史数据失败: {str(e)}')
+            with self._pending_lock:
+                self._pending[:0] = rows
+            return 0
+        return len(rows)
+
+    def insert_quotes(self, rows: List[QuoteRow]) -> int:
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            before = connection.total_changes
+            connection.executemany(
+                'INSERT OR IGNORE INTO quotes (asset, ts, value, change_percent) VALUES (?, ?, ?, ?)',
+                rows
+            )
+            return connection.total_changes - before
+
+    def query_quotes(self, asset: str, start: Optional[float] = None, end: Optional[float] = None,
+                     limit: Optional[int] = None) -> List[Tuple[float, float, float]]:
+        self.flush()
+
+        sql = 'SELECT ts, value, change_percent FROM quotes WHERE asset = ?'
+        params = [asset]
+        if start is not None:
+            sql += ' AND ts >= ?'
+            params.append(start)
+        if end is not None:
+            sql += ' AND ts <= ?'
+            params.append(end)
+
+        if limit:
+            sql += ' ORDER BY ts DESC LIMIT ?'
+            params.append(limit)
+            rows = self._connection().execute(sql, params).fetchall()
+            rows.reverse()
+            return rows
+
+        sql += ' ORDER BY ts'
+        return self._connection().execute(sql, params).fetchall()
+
+    def query_series(self, asset: str, start: Optional[float] = None, end: Optional[float] = None,
+                     limit: Optional[int] = None) -> List[Tuple[float, float, float]]:
+        self.flush()
+
+        raw_sql = 'SELECT ts, value, change_percent FROM quotes WHERE asset = ?'
+        rollup_sql = 'SELECT bucket, close, change_percent FROM rollups WHERE asset = ?'
+        raw_params = [asset]
+        rollup_params = [asset]
+        if start is not None:
+            raw_sql += ' AND ts >= ?'
+            rollup_sql += ' AND bucket >= ?'
+            raw_params.append(start)
+            rollup_params.append(start)
+        if end is not None:
+            raw_sql += ' AND ts <= ?'
+            rollup_sql += ' AND bucket <= ?'
+            raw_params.append(end)
+            rollup_params.append(end)
+
+        sql = f'{rollup_sql} UNION ALL {raw_sql}'
+        params = rollup_params + raw_params
+        if limit:
+            rows = self._connection().execute(f'{sql} ORDER BY 1 DESC LIMIT ?', params + [limit]).fetchall()
+            rows.reverse()
+            return rows
+        return self._connection().execute(f'{sql} ORDER BY 1', params).fetchall()
+
+    def iter_series(self, assets: Iterable[str], start: Optional[float] = None, end: Optional[float] = None,
+                    batch_size: int = DEFAULT_EXPORT_BATCH_SIZE) -> Iterator[List[QuoteRow]]:
+        self.flush()
+
+        # 导出使用独立的只读连接，长时间游标不会占用请求线程共享的连接
+        connection = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, timeout=30, check_same_thread=False)
+        try:
+            for asset in assets:
+                sql = ('SELECT ?1, ts, value, change_percent FROM ('
+                       'SELECT bucket AS ts, close AS value, change_percent FROM rollups WHERE asset = ?1 '
+                       'UNION ALL SELECT ts, value, change_percent FROM quotes WHERE asset = ?1) '
+                       'WHERE ts >= ?2 AND ts <= ?3 ORDER BY ts')
+                cursor = connection.execute(sql, (
+                    asset,
+                    start if start is not None else float('-inf'),
+                    end if end is not None else float('inf')
+                ))
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+        finally:
+            connection.close()
+
+    def list_assets(self, prefix: str = '') -> List[str]:
+        self.flush()
+        rows = self._connection().execute(
+            'SELECT asset FROM quotes WHERE asset >= ?1 AND asset < ?2 '
+            'UNION SELECT asset FROM rollups WHERE asset >= ?1 AND asset < ?2 ORDER BY asset',
+            (prefix, prefix + '\uffff')
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def compact(self, source_resolution: int, target_resolution: int, cutoff: float) -> Dict[str, float]:
+        self.flush()
+        connection = self._connection()
+
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            if source_resolution:
+                source_rows = connection.execute(_ROLLUP_SQL, (source_resolution, cutoff))
+            else:
+                source_rows = connection.execute(_RAW_AS_ROLLUP_SQL, (cutoff,))
+
+            buckets: Dict[Tuple[str, float], list] = {}
+            for asset, ts, *values in source_rows:
+                key = (asset, ts - ts % target_resolution)
+                if key in buckets:
+                    _merge_rollup(buckets[key], values)
+                else:
+                    buckets[key] = list(values)
+
+            if not buckets:
+                return {}
+
+            merged = []
+            for (asset, bucket), values in buckets.items():
+                existing = connection.execute(
+                    'SELECT open, high, low, close, change_percent, count, first_ts, last_ts FROM rollups '
+                    'WHERE asset = ? AND resolution = ? AND bucket = ?',
+                    (asset, target_resolution, bucket)
+                ).fetchone()
+                if existing:
+                    _merge_rollup(values, existing)
+                merged.append((asset, target_resolution, bucket, *values))
+
+            connection.executemany(
+                'INSERT OR REPLACE INTO rollups (asset, resolution, bucket, open, high, low, close, '
+                'change_percent, count, first_ts, last_ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                merged
+            )
+            if source_resolution:
+                connection.execute('DELETE FROM rollups WHERE resolution = ? AND bucket < ?', (source_resolution, cutoff))
+            else:
+                connection.execute('DELETE FROM quotes WHERE ts < ?', (cutoff,))
+
+        # 每个资产最早被改写的桶，列式文件只需替换从这里到 cutoff 的区间
+        changed: Dict[str, float] = {}
+        for asset, bucket in buckets:
+            if asset not in changed or bucket < changed[asset]:
+                changed[asset] = bucket
+        return changed
+
+    def expire(self, resolution: int, cutoff: float) -> int:
+        self.flush()
+        connection = self._connection()
+        if resolution:
+            cursor = connection.execute('DELETE FROM rollups WHERE resolution = ? AND bucket < ?', (resolution, cutoff))
+        else:
+            cursor = connection.execute('DELETE FROM quotes WHERE ts < ?', (cutoff,))
+        return cursor.rowcount
+
+    def is_empty(self) -> bool:
+        self.flush()
+        return self._connection().execute('SELECT 1 FROM quotes LIMIT 1').fetchone() is None
+
+    def add_fx_rate(self, pair: str, ts: float, rate: float, source: str = None):
+        try:
+            self._connection().execute(
+                'INSERT OR REPLACE INTO fx_rates (pair, ts, rate, source) VALUES (?, ?, ?, ?)',
+                (pair, ts, rate, source)
+            )
+        except sqlite3.Error as e:
+            if self.logger:
+                self.logger.log_error(f'写入汇率数据失败: {str(e)}')
+
+    def add_fx_rates(self, rows: Iterable[Tuple[str, float, float, Optional[str]]]):
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute('BEGIN')
+                connection.executemany(
+                    'INSERT OR REPLACE INTO fx_rates (pair, ts, rate, source) VALUES (?, ?, ?, ?)',
+                    rows
+                )
+        except sqlite3.Error as e:
+            if self.logger:
+                self.logger.log_error(f'写入汇率数据失败: {str(e)}')
+
+    def query_fx_rates(self, pair: str, start: Optional[float] = None,
+                       end: Optional[float] = None) -> List[Tuple[float, float]]:
+        sql = 'SELECT ts, rate FROM fx_rates WHERE pair = ?'
+        params = [pair]
+        if start is not None:
+            # 带上起点之前最近的一条汇率，起点附近的行情也能按当时的汇率换算
+            sql += ' AND ts >= COALESCE((SELECT MAX(ts) FROM fx_rates WHERE pair = ? AND ts <= ?), ?)'
+            params.extend((pair, start, start))
+        if end is not None:
+            sql += ' AND ts <= ?'
+            params.append(end)
+        sql += ' ORDER BY ts'
+        return self._connection().execute(sql, params).fetchall()
+
+    def add_alert(self, ts: float, alert_type: str, asset_name: str, info: str):
+        try:
+            self._connection().execute(
+                'INSERT INTO alerts (ts, alert_type, asset_name, info) VALUES (?, ?, ?, ?)',
+                (ts, alert_type, asset_name, info)
+            )
+        except sqlite3.Error as e:
+            if self.logger:
+                self.logger.log_error(f'写入预警记录失败: {str(e)}')
+
+    def query_alerts(self, since: float) -> List[Tuple[float, str, str, str]]:
+        return self._connection().execute(
+            'SELECT ts, alert_type, asset_name, info FROM alerts WHERE ts > ? ORDER BY ts',
+            (since,)
+        ).fetchall()
+
+    def close(self):
+        self.flush()
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and self._local.pid == os.getpid():
+            connection.close()
+        self._local = threading.local()
@@ -0,0 +1,73 @@
+import json
+import threading
+from datetime import datetime, date
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+BACKEND = 'orjson' if orjson else 'json'
+
+
+def _default(obj):
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    raise TypeError(f'无法序列化类型: {type(obj).__name__}')
+
+
+if orjson:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    def loads(data) -> Any:
+        return orjson.loads(data)
+else:
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=_default)
+
+    def dumps(obj: Any) -> bytes:
+        return _encoder.encode(obj).encode('utf-8')
+
+    def loads(data) -> Any:
+        return json.loads(data)
+
+
+def encode_envelope(data: bytes, **fields) -> bytes:
+    parts = [b'{"data":', data]
+    for key, value in fields.items():
+        parts.append(b',' + dumps(key) + b':' + dumps(value))
+    parts.append(b'}')
+    return b''.join(parts)
+
+
+class SnapshotCache:
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: Dict[Hashable, Tuple[Hashable, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Hashable, build: Callable[[], Any]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+
+        value = build()
+
+        with self._lock:
+            if len(self._entries) >= self.max_entries and key not in self._entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (version, value)
+
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -19,6 +19,7 @@ class FinancialMonitorLogger:
             
         self.log_dir = log_dir
         self.alert_history = []
+        self.store = None
         self._ensure_log_dir()
         self._setup_logger()
         self._initialized = True
@@ -93,17 +94,25 @@ class FinancialMonitorLogger:
     def log_debug(self, debug_msg):
         self.logger.debug(debug_msg)
     
+    def attach_store(self, store):
+        self.store = store
+    
     def log_alert_triggered(self, alert_type, asset_name, alert_info):
-        alert_record = {
-            'type': alert_type,
-            'asset_name': asset_name,
-            'info': alert_info,
-            'timestamp': datetime.now().isoformat()
-        }
-        self.alert_history.append(alert_record)
+        now = datetime.now()
         
-        if len(self.alert_history) > 1000:
-            self.alert_history = self.alert_history[-1000:]
+        if self.store:
+            self.store.add_alert(now.timestamp(), alert_type, asset_name, alert_info)
+        else:
+            alert_record = {
+                'type': alert_type,
+                'asset_name': asset_name,
+                'info': alert_info,
+                'timestamp': now.isoformat()
+            }
+            self.alert_history.append(alert_record)
+            
+            if len(self.alert_history) > 1000:
+                self.alert_history = self.alert_history[-1000:]
         
         self.logger.warning(f'预警触发 - {alert_type}: {asset_name} - {alert_info}')
     
@@ -111,6 +120,17 @@ class FinancialMonitorLogger:
         from datetime import timedelta
         cutoff_time = datetime.now() - timedelta(hours=hours)
         
+        if self.store:
+            return [
+                {
+                    'type': alert_type,
+                    'asset_name': asset_name,
+                    'info': info,
+                    'timestamp': datetime.fromtimestamp(ts).isoformat()
+                }
+                for ts, alert_type, asset_name, info in self.store.query_alerts(cutoff_time.timestamp())
+            ]
+        
         return [
             record for record in self.alert_history
             if datetime.fromisoformat(record['timestamp']) > cutoff_time
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+from dataclasses import asdict
+from typing import Dict, Iterable, List, Optional, Union
+
+from modules import json_codec
+from modules.data_processor import is_fund_code
+from modules.file_utils import atomic_write
+from modules.quote_models import MetalQuote, FundQuote, FundError
+
+
+FEED_GROUPS = ('metals', 'funds')
+HEARTBEAT_FILE = 'collector.heartbeat'
+REQUESTS_DIR = 'requests'
+DEFAULT_STALE_AFTER = 120.0
+
+
+def default_feed_directory() -> str:
+    # /dev/shm 是内存文件系统，进程间交换快照不经过磁盘
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return os.path.join('/dev/shm', 'financial-monitor')
+    return os.path.join('data', 'feed')
+
+
+def encode_quotes(quotes: Dict[str, Union[MetalQuote, FundQuote, FundError]]) -> Dict[str, Dict]:
+    encoded = {'quotes': {}, 'errors': {}}
+    for key, quote in quotes.items():
+        encoded['errors' if isinstance(quote, FundError) else 'quotes'][key] = asdict(quote)
+    return encoded
+
+
+def decode_quotes(group: str, payload: Dict) -> Dict[str, Union[MetalQuote, FundQuote, FundError]]:
+    model = MetalQuote if group == 'metals' else FundQuote
+    quotes = {key: model(**fields) for key, fields in payload['quotes'].items()}
+    quotes.update((key, FundError(**fields)) for key, fields in payload['errors'].items())
+    return quotes
+
+
+class FeedSnapshot:
+    __slots__ = ('group', 'epoch', 'sequence', 'published_at', 'quotes')
+
+    def __init__(self, group: str, epoch: float, sequence: int, published_at: float, quotes: Dict):
+        self.group = group
+        self.epoch = epoch
+        self.sequence = sequence
+        self.published_at = published_at
+        self.quotes = quotes
+
+
+class FeedPublisher:
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or default_feed_directory()
+        # 采集进程每次启动使用新的纪元，读取方据此判断序号是否连续
+        self.epoch = time.time()
+        self.sequences = {group: 0 for group in FEED_GROUPS}
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, group: str) -> str:
+        return os.path.join(self.directory, f'{group}.json')
+
+    def publish(self, group: str, quotes: Dict) -> int:
+        self.sequences[group] += 1
+        payload = {
+            'group': group,
+            'epoch': self.epoch,
+            'sequence': self.sequences[group],
+            'published_at': time.time(),
+        }
+        payload.update(encode_quotes(quotes))
+        atomic_write(self.path(group), json_codec.dumps(payload), fsync=False)
+        return self.sequences[group]
+
+    def heartbeat(self):
+        atomic_write(os.path.join(self.directory, HEARTBEAT_FILE), str(time.time()), fsync=False)
+
+    def take_requests(self) -> List[str]:
+        directory = os.path.join(self.directory, REQUESTS_DIR)
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return []
+
+        codes = []
+        for name in names:
+            try:
+                os.unlink(os.path.join(directory, name))
+            except FileNotFoundError:
+                continue
+            if is_fund_code(name):
+                codes.append(name)
+        return codes
+
+
+class FeedReader:
+    def __init__(self, directory: Optional[str] = None, stale_after: float = DEFAULT_STALE_AFTER):
+        self.directory = directory or default_feed_directory()
+        self.stale_after = stale_after
+        self._snapshots: Dict[str, tuple] = {}
+
+    def collector_alive(self) -> bool:
+        try:
+            mtime = os.stat(os.path.join(self.directory, HEARTBEAT_FILE)).st_mtime
+        except OSError:
+            return False
+        return time.time() - mtime < self.stale_after
+
+    def request(self, codes: Iterable[str]):
+        # 每个待抓取的基金对应一个空文件，多个 worker 重复请求同一基金只会合并成一次抓取
+        directory = os.path.join(self.directory, REQUESTS_DIR)
+        os.makedirs(directory, exist_ok=True)
+        for code in codes:
+            if is_fund_code(code):
+                with open(os.path.join(directory, code), 'a'):
+                    pass
+
+    def read(self, group: str) -> Optional[FeedSnapshot]:
+        path = os.path.join(self.directory, f'{group}.json')
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        # 快照以 rename 方式整体替换，inode 与修改时间不变就直接复用已解析的结果
+        signature = (stat.st_ino, stat.st_mtime_ns)
+        cached = self._snapshots.get(group)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with open(path, 'rb') as f:
+            payload = json_codec.loads(f.read())
+        snapshot = FeedSnapshot(group, payload['epoch'], payload['sequence'], payload['published_at'],
+                                decode_quotes(group, payload))
+        self._snapshots[group] = (signature, snapshot)
+        return snapshot
+
+
+class FeedConsumer:
+    def __init__(self, reader: Optional[FeedReader], data_processor, logger):
+        self.reader = reader
+        self.data_processor = data_processor
+        self.logger = logger
+        self._applied: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.reader is not None
+
+    def _apply(self, snapshot: FeedSnapshot):
+        if self._applied.get(snapshot.group) == (snapshot.epoch, snapshot.sequence):
+            return
+        with self._lock:
+            applied = self._applied.get(snapshot.group)
+            if applied == (snapshot.epoch, snapshot.sequence):
+                return
+            if applied is None or applied[0] != snapshot.epoch or applied[1] + 1 != snapshot.sequence:
+                # 中间漏掉了快照，只从存储引擎补读内存历史最后一个点之后的数据
+                self.data_processor.backfill_from_store(
+                    snapshot.group, [key for key, quote in snapshot.quotes.items() if not isinstance(quote, FundError)]
+                )
+            self.data_processor.ingest_published(snapshot.group, snapshot.quotes)
+            self._applied[snapshot.group] = (snapshot.epoch, snapshot.sequence)
+
+    def latest(self, group: str) -> Optional[Dict]:
+        if self.reader is None or not self.reader.collector_alive():
+            return None
+        try:
+            snapshot = self.reader.read(group)
+        except Exception as e:
+            self.logger.log_error(f'读取采集进程快照失败: {str(e)}')
+            return None
+        if snapshot is None:
+            return None
+        self._apply(snapshot)
+        return snapshot.quotes
+
+    def request(self, codes: Iterable[str]):
+        if self.reader is not None:
+            self.reader.request(codes)
+
+    def sync(self):
+        for group in FEED_GROUPS:
+            self.latest(group)
+
+    def after_fork(self):
+        self._applied = {}
+        self._lock = threading.Lock()
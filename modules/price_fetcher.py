@@ -1,24 +1,107 @@
 import requests
 import json
-import re
-from typing import Dict, List, Optional
+import threading
+import time
+from dataclasses import replace
+from typing import Dict, List, Optional, Union
 from datetime import datetime
 
+from modules.coalescer import RequestCoalescer
+from modules.fund_cache import FundQuoteCache, DEFAULT_TRADING_TTL
+from modules.trading_calendar import PollScheduler
+from modules.quote_models import MetalQuote, FundQuote, FundError
+from modules.quote_parser import parse_sina_symbol, parse_fund_payload, parse_percent
+
+
+def _copy_quotes(quotes: Dict[str, MetalQuote]) -> Dict[str, MetalQuote]:
+    return {metal: replace(quote) for metal, quote in quotes.items()}
+
 
 class PriceFetcher:
-    def __init__(self, config):
+    SINA_HEADERS = {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+        'Referer': 'https://finance.sina.com.cn/',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+        'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
+    }
+    
+    def __init__(self, config, governor=None):
         self.gold_api_url = config.get('api', 'gold_api_url', fallback=None)
         self.gold_api_key = config.get('api', 'gold_api_key', fallback=None)
         self.fund_api_url = config.get('api', 'fund_api_url', fallback=None)
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        self.scheduler = PollScheduler.from_config(config)
+        self.fund_cache = FundQuoteCache(
+            self.scheduler.calendars['funds'],
+            config.getfloat('fund', 'quote_cache_ttl', fallback=DEFAULT_TRADING_TTL)
+        )
+        self._closed_metals = None
+        self._session = None
+        self._session_lock = threading.Lock()
+        self.governor = governor
+        self.coalescer = RequestCoalescer()
         self.use_sina_api = not self.gold_api_key
         self.sina_gold_url = 'https://hq.sinajs.cn/list=hf_GC'
         self.sina_silver_url = 'https://hq.sinajs.cn/list=hf_SI'
     
-    def fetch_gold_silver_prices(self) -> Dict[str, Dict]:
+    def apply_config(self, config, changed=None):
+        if changed is None or 'api' in changed:
+            self.gold_api_url = config.get('api', 'gold_api_url', fallback=None)
+            self.gold_api_key = config.get('api', 'gold_api_key', fallback=None)
+            self.fund_api_url = config.get('api', 'fund_api_url', fallback=None)
+            self.use_sina_api = not self.gold_api_key
+        if changed is None or changed & {'gold', 'fund', 'schedule'}:
+            # 轮询间隔或休市日历变化后整体替换调度器，休市缓存按新日历重新计算
+            scheduler = PollScheduler.from_config(config)
+            self.fund_cache.calendar = scheduler.calendars['funds']
+            self.fund_cache.trading_ttl = config.getfloat('fund', 'quote_cache_ttl', fallback=DEFAULT_TRADING_TTL)
+            self.scheduler = scheduler
+            self._closed_metals = None
+    
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    session.headers.update({
+                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+                    })
+                    self._session = session
+        return self._session
+    
+    def _get(self, url: str, **kwargs) -> requests.Response:
+        if self.governor:
+            return self.governor.get(self.session, url, **kwargs)
+        return self.session.get(url, **kwargs)
+    
+    def reset_session(self):
+        # fork 后子进程不能复用父进程的连接池，直接丢弃而不关闭共享的套接字
+        self._session = None
+        self._session_lock = threading.Lock()
+        self.fund_cache.after_fork()
+        self.coalescer.after_fork()
+    
+    def fetch_gold_silver_prices(self) -> Dict[str, MetalQuote]:
+        # COMEX 休市期间行情不会变化，沿用休市后抓取的一份报价直到下次开盘
+        closed = self._closed_metals
+        if closed is not None and time.time() < closed[0]:
+            return _copy_quotes(closed[1])
+        
+        # 并发请求同一组行情时只向上游发起一次，其余调用共享结果的副本
+        return self.coalescer.do('metals', self._refresh_gold_silver_prices, _copy_quotes)
+    
+    def _refresh_gold_silver_prices(self) -> Dict[str, MetalQuote]:
+        result = self._fetch_gold_silver_prices()
+        
+        now = time.time()
+        if result and self.scheduler.poll_interval('metals', now) is None:
+            self._closed_metals = (self.scheduler.next_poll_at('metals', now) or now, result)
+            result = _copy_quotes(result)
+        else:
+            self._closed_metals = None
+        return result
+    
+    def _fetch_gold_silver_prices(self) -> Dict[str, MetalQuote]:
         if self.use_sina_api:
             return self._fetch_from_sina()
         
@@ -27,7 +110,7 @@ class PriceFetcher:
             if self.gold_api_key:
                 params['appkey'] = self.gold_api_key
             
-            response = self.session.get(
+            response = self._get(
                 self.gold_api_url,
                 params=params,
                 timeout=10
@@ -44,27 +127,9 @@ class PriceFetcher:
             for item in data.get('result', []):
                 typename = item.get('typename', '')
                 if '黄金' in typename:
-                    result['gold'] = {
-                        'name': typename,
-                        'price': float(item.get('price', 0)),
-                        'open_price': float(item.get('openingprice', 0)),
-                        'high_price': float(item.get('maxprice', 0)),
-                        'low_price': float(item.get('minprice', 0)),
-                        'change_percent': item.get('changepercent', '0%'),
-                        'update_time': item.get('updatetime', ''),
-                        'type': item.get('type', '')
-                    }
+                    result['gold'] = self._build_api_quote(item)
                 elif '白银' in typename:
-                    result['silver'] = {
-                        'name': typename,
-                        'price': float(item.get('price', 0)),
-                        'open_price': float(item.get('openingprice', 0)),
-                        'high_price': float(item.get('maxprice', 0)),
-                        'low_price': float(item.get('minprice', 0)),
-                        'change_percent': item.get('changepercent', '0%'),
-                        'update_time': item.get('updatetime', ''),
-                        'type': item.get('type', '')
-                    }
+                    result['silver'] = self._build_api_quote(item)
             
             return result
             
@@ -82,118 +147,57 @@ class PriceFetcher:
             print(f'将尝试使用新浪财经公共 API...')
             return self._fetch_from_sina()
     
-    def _fetch_from_sina(self) -> Dict[str, Dict]:
+    @staticmethod
+    def _build_api_quote(item: Dict) -> MetalQuote:
+        return MetalQuote(
+            item.get('typename', ''),
+            float(item.get('price', 0)),
+            float(item.get('openingprice', 0)),
+            float(item.get('maxprice', 0)),
+            float(item.get('minprice', 0)),
+            parse_percent(item.get('changepercent', '0%')),
+            item.get('updatetime', ''),
+            item.get('type', '')
+        )
+    
+    def _fetch_from_sina(self) -> Dict[str, MetalQuote]:
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Referer': 'https://finance.sina.com.cn/',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
-            }
-            
-            gold_response = self.session.get(self.sina_gold_url, headers=headers, timeout=10)
-            gold_response.raise_for_status()
-            
-            gold_text = gold_response.text
+            result = {}
             
-            gold_match = re.search(r'var hq_str_hf_GC="([^"]+)"', gold_text)
+            gold_response = self._get(self.sina_gold_url, headers=self.SINA_HEADERS, timeout=10)
+            gold_response.raise_for_status()
             
-            result = {}
+            gold = parse_sina_symbol(gold_response.content, 'hf_GC', '国际黄金')
+            if gold:
+                result['gold'] = gold
             
-            if gold_match:
-                gold_data = gold_match.group(1).split(',')
-                
-                if len(gold_data) >= 14:
-                            try:
-                                current_price = float(gold_data[0]) if gold_data[0] else 0
-                                open_price = float(gold_data[2]) if gold_data[2] else 0
-                                high_price = float(gold_data[3]) if gold_data[3] else 0
-                                low_price = float(gold_data[4]) if gold_data[4] else 0
-                                change_percent = ((current_price - open_price) / open_price * 100) if open_price > 0 else 0
-                                
-                                result['gold'] = {
-                                    'name': gold_data[13] if gold_data[13] else '国际黄金',
-                                    'price': current_price,
-                                    'open_price': open_price,
-                                    'high_price': high_price,
-                                    'low_price': low_price,
-                                    'change_percent': f'{change_percent:.2f}%',
-                                    'update_time': f"{gold_data[12]} {gold_data[6]}" if len(gold_data) >= 13 else datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                                    'type': 'sina',
-                                    'source': '新浪财经公共API'
-                                }
-                            except (ValueError, IndexError) as e:
-                                pass
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-                'Referer': 'https://finance.sina.com.cn/',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8'
-            }
-            
-            silver_response = self.session.get(self.sina_silver_url, headers=headers, timeout=10)
+            silver_response = self._get(self.sina_silver_url, headers=self.SINA_HEADERS, timeout=10)
             silver_response.raise_for_status()
             
-            silver_text = silver_response.text
-            
-            silver_match = re.search(r'var hq_str_hf_SI="([^"]+)"', silver_text)
-            
-            if silver_match:
-                silver_data = silver_match.group(1).split(',')
-                
-                if len(silver_data) >= 14:
-                            try:
-                                current_price = float(silver_data[0]) if silver_data[0] else 0
-                                open_price = float(silver_data[2]) if silver_data[2] else 0
-                                high_price = float(silver_data[3]) if silver_data[3] else 0
-                                low_price = float(silver_data[4]) if silver_data[4] else 0
-                                change_percent = ((current_price - open_price) / open_price * 100) if open_price > 0 else 0
-                                
-                                result['silver'] = {
-                                    'name': silver_data[13] if silver_data[13] else '国际白银',
-                                    'price': current_price,
-                                    'open_price': open_price,
-                                    'high_price': high_price,
-                                    'low_price': low_price,
-                                    'change_percent': f'{change_percent:.2f}%',
-                                    'update_time': f"{silver_data[12]} {silver_data[6]}" if len(silver_data) >= 13 else datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                                    'type': 'sina',
-                                    'source': '新浪财经公共API'
-                                }
-                            except (ValueError, IndexError) as e:
-                                pass
+            silver = parse_sina_symbol(silver_response.content, 'hf_SI', '国际白银')
+            if silver:
+                result['silver'] = silver
             
             return result
             
         except Exception as e:
             raise Exception(f'所有 API 均获取失败: {str(e)}')
     
-    def fetch_fund_data(self, fund_code: str) -> Optional[Dict]:
+    def fetch_fund_data(self, fund_code: str) -> Optional[FundQuote]:
+        cached = self.fund_cache.get(fund_code)
+        if cached is not None:
+            return cached
+        
+        return self.coalescer.do(('fund', fund_code), lambda: self._download_fund_data(fund_code), replace)
+    
+    def _download_fund_data(self, fund_code: str) -> FundQuote:
         try:
             url = f'{self.fund_api_url}/{fund_code}.js?rt={int(datetime.now().timestamp() * 1000)}'
             
-            response = self.session.get(url, timeout=10)
+            response = self._get(url, timeout=10)
             response.raise_for_status()
             
-            content = response.text
-            match = re.search(r'jsonpgz\((.*)\)', content)
-            
-            if not match:
-                raise Exception('无法解析基金数据')
-            
-            data = json.loads(match.group(1))
-            
-            result = {
-                'code': data.get('fundcode', ''),
-                'name': data.get('name', ''),
-                'net_value': float(data.get('dwjz', 0)),
-                'estimated_value': float(data.get('gsz', 0)),
-                'change_percent': float(data.get('gszzl', 0)),
-                'update_time': data.get('gztime', '')
-            }
-            
-            return result
+            return self.fund_cache.put(fund_code, parse_fund_payload(response.content))
             
         except requests.exceptions.Timeout:
             raise Exception(f'请求超时: 基金代码 {fund_code}')
@@ -204,7 +208,7 @@ class PriceFetcher:
         except Exception as e:
             raise Exception(f'获取基金数据失败 {fund_code}: {str(e)}')
     
-    def fetch_multiple_funds(self, fund_codes: List[str]) -> Dict[str, Dict]:
+    def fetch_multiple_funds(self, fund_codes: List[str]) -> Dict[str, Union[FundQuote, FundError]]:
         results = {}
         
         for fund_code in fund_codes:
@@ -213,12 +217,11 @@ class PriceFetcher:
                 if fund_data:
                     results[fund_code] = fund_data
             except Exception as e:
-                results[fund_code] = {
-                    'error': str(e),
-                    'code': fund_code
-                }
+                results[fund_code] = FundError(fund_code, str(e))
         
         return results
     
     def close(self):
-        self.session.close()
+        if self._session is not None:
+            self._session.close()
+            self._session = None
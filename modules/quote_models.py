@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict
+
+
+def format_timestamp(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+
+@dataclass(slots=True)
+class MetalQuote:
+    name: str
+    price: float
+    open_price: float
+    high_price: float
+    low_price: float
+    change_percent: float
+    update_time: str
+    type: str = ''
+    source: str = ''
+    timestamp: float = 0.0
+
+    @property
+    def change_percent_str(self) -> str:
+        return f'{self.change_percent:.2f}%'
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'current_price': self.price,
+            'open_price': self.open_price,
+            'high_price': self.high_price,
+            'low_price': self.low_price,
+            'change_percent_str': self.change_percent_str,
+            'change_percent': self.change_percent,
+            'update_time': self.update_time,
+            'timestamp': format_timestamp(self.timestamp)
+        }
+
+
+@dataclass(slots=True)
+class FundQuote:
+    code: str
+    name: str
+    net_value: float
+    estimated_value: float
+    change_percent: float
+    update_time: str
+    timestamp: float = 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            'code': self.code,
+            'name': self.name,
+            'net_value': self.net_value,
+            'estimated_value': self.estimated_value,
+            'change_percent': self.change_percent,
+            'update_time': self.update_time,
+            'timestamp': format_timestamp(self.timestamp)
+        }
+
+
+@dataclass(slots=True)
+class FundError:
+    code: str
+    error: str
+
+    def to_dict(self) -> Dict:
+        return {
+            'error': self.error,
+            'code': self.code
+        }
+
+
+@dataclass(slots=True, frozen=True)
+class HistoryPoint:
+    timestamp: float
+    value: float
+    change_percent: float
+
+    def to_dict(self, value_key: str) -> Dict:
+        return {
+            value_key: self.value,
+            'change_percent': self.change_percent,
+            'timestamp': format_timestamp(self.timestamp)
+        }
+
+    @classmethod
+    def from_dict(cls, entry: Dict, value_key: str) -> 'HistoryPoint':
+        return cls(
+            datetime.fromisoformat(entry['timestamp']).timestamp(),
+            float(entry[value_key]),
+            float(entry.get('change_percent', 0.0))
+        )
+
+
+def records_to_dict(records: Dict) -> Dict[str, Dict]:
+    return {key: record.to_dict() for key, record in records.items()}
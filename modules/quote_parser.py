@@ -0,0 +1,94 @@
+from typing import Optional
+
+from modules import json_codec
+from modules.quote_models import MetalQuote, FundQuote
+
+
+SINA_ENCODING = 'gbk'
+SINA_SOURCE_NAME = '新浪财经公共API'
+SINA_MIN_FIELDS = 14
+
+_JSONP_PREFIX = b'jsonpgz('
+
+
+class QuoteParseError(ValueError):
+    pass
+
+
+def _to_float(field: bytes) -> float:
+    return float(field) if field else 0
+
+
+def parse_percent(value) -> float:
+    try:
+        return float(str(value).replace('%', ''))
+    except (ValueError, AttributeError):
+        return 0.0
+
+
+def parse_sina_quote(body: bytes, default_name: str) -> Optional[MetalQuote]:
+    fields = body.split(b',')
+    if len(fields) < SINA_MIN_FIELDS:
+        return None
+
+    try:
+        current_price = _to_float(fields[0])
+        open_price = _to_float(fields[2])
+        high_price = _to_float(fields[3])
+        low_price = _to_float(fields[4])
+    except ValueError:
+        return None
+
+    change_percent = ((current_price - open_price) / open_price * 100) if open_price > 0 else 0
+    name = fields[13].decode(SINA_ENCODING, errors='replace') if fields[13] else default_name
+
+    return MetalQuote(
+        name,
+        current_price,
+        open_price,
+        high_price,
+        low_price,
+        round(change_percent, 2),
+        f"{fields[12].decode('ascii', errors='replace')} {fields[6].decode('ascii', errors='replace')}",
+        'sina',
+        SINA_SOURCE_NAME
+    )
+
+
+def parse_sina_symbol(raw: bytes, symbol: str, default_name: str) -> Optional[MetalQuote]:
+    # 只取一个品种时直接定位 hq_str_<symbol>=" 所在行，不为整段响应构建字典
+    marker = b'hq_str_' + symbol.encode('ascii') + b'="'
+    start = raw.find(marker)
+    if start < 0:
+        return None
+    start += len(marker)
+    end = raw.find(b'"', start)
+    if end < 0:
+        return None
+    return parse_sina_quote(raw[start:end], default_name)
+
+
+def extract_jsonp_body(raw: bytes) -> bytes:
+    start = raw.find(_JSONP_PREFIX)
+    end = raw.rfind(b')')
+    if start < 0 or end < start:
+        raise QuoteParseError('无法解析基金数据')
+    return raw[start + len(_JSONP_PREFIX):end]
+
+
+def parse_fund_payload(raw: bytes) -> FundQuote:
+    try:
+        data = json_codec.loads(extract_jsonp_body(raw))
+        return FundQuote(
+            data.get('fundcode', ''),
+            data.get('name', ''),
+            float(data.get('dwjz', 0)),
+            float(data.get('gsz', 0)),
+            float(data.get('gszzl', 0)),
+            data.get('gztime', '')
+        )
+    except QuoteParseError:
+        raise
+    except (ValueError, TypeError, AttributeError) as e:
+        # 截断或被篡改的响应统一报告为格式错误，调用方只需处理一种异常
+        raise QuoteParseError(f'基金数据格式错误: {str(e)}')
@@ -0,0 +1,52 @@
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+from modules import json_codec
+from modules.file_utils import FileLock, atomic_write
+
+
+class RateCache:
+    def __init__(self, path: str, logger=None):
+        self.path = path
+        self.logger = logger
+        # 刷新锁：同一时刻只有一个 worker 请求汇率接口，其余 worker 读取它写入的缓存文件
+        self.lock = FileLock(path + '.lock')
+        self._signature: Optional[Tuple[int, int]] = None
+        self._data: Dict = {}
+        self._read_lock = threading.Lock()
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def read(self) -> Dict:
+        # 缓存文件以 rename 整体替换，签名不变时直接返回上次解析的内容，只花一次 stat
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return self._data
+        with self._read_lock:
+            if signature == self._signature:
+                return self._data
+            try:
+                with open(self.path, 'rb') as f:
+                    data = json_codec.loads(f.read())
+                if isinstance(data, dict):
+                    self._data = data
+            except Exception as e:
+                if self.logger:
+                    self.logger.log_warning(f'加载汇率缓存失败: {str(e)}')
+            self._signature = signature
+            return self._data
+
+    def write(self, data: Dict):
+        atomic_write(self.path, json_codec.dumps(data))
+        self._data = data
+        self._signature = self._stat()
+
+    def after_fork(self):
+        self.lock.after_fork()
+        self._read_lock = threading.Lock()
@@ -0,0 +1,186 @@
+import os
+import re
+import struct
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from modules.file_utils import FileLock
+
+
+# 每个上游主机一个状态文件: 剩余令牌, 更新时间, 累计放行, 累计拒绝
+BUCKET_STATE = struct.Struct('<ddQQ')
+
+DEFAULT_DIRECTORY = os.path.join('data', 'ratelimit')
+DEFAULT_LIMIT = (1.0, 5)
+DEFAULT_MAX_WAIT = 2.0
+PENALTY_SECONDS = 60
+THROTTLED_STATUS_CODES = (403, 429, 456)
+
+DEFAULT_LIMITS = {
+    'hq.sinajs.cn': (2.0, 4),
+    'fundgz.1234567.com.cn': (5.0, 10),
+}
+
+_RESERVED_OPTIONS = ('directory', 'max_wait', 'default')
+_UNSAFE_CHARS = re.compile(r'[^0-9A-Za-z_.-]')
+
+
+class RateLimitExceeded(Exception):
+    pass
+
+
+def parse_limit(value: str) -> Tuple[float, int]:
+    rate, _, burst = value.partition('/')
+    try:
+        rate = float(rate)
+        burst = int(burst) if burst.strip() else max(1, int(rate))
+    except ValueError:
+        raise Exception(f'限流配置格式错误: {value}，应为 每秒请求数/突发上限')
+    if rate <= 0 or burst < 1:
+        raise Exception(f'限流配置必须为正数: {value}')
+    return rate, burst
+
+
+class HostBucket:
+    def __init__(self, host: str, rate: float, burst: int, path: str):
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.lock = FileLock(path)
+        self.waited_seconds = 0.0
+        self.waits = 0
+
+    def _read(self, fd: int, now: float):
+        os.lseek(fd, 0, os.SEEK_SET)
+        data = os.read(fd, BUCKET_STATE.size)
+        if len(data) < BUCKET_STATE.size:
+            return [float(self.burst), now, 0, 0]
+        return list(BUCKET_STATE.unpack(data))
+
+    def _write(self, fd: int, state):
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, BUCKET_STATE.pack(*state))
+
+    def try_acquire(self, now: float) -> float:
+        with self.lock:
+            fd = self.lock.fd
+            tokens, updated, granted, shed = self._read(fd, now)
+            tokens = min(float(self.burst), tokens + max(0.0, now - updated) * self.rate)
+            if tokens >= 1:
+                self._write(fd, (tokens - 1, now, granted + 1, shed))
+                return 0.0
+            self._write(fd, (tokens, now, granted, shed))
+            return (1 - tokens) / self.rate
+
+    def record_shed(self):
+        with self.lock:
+            tokens, updated, granted, shed = self._read(self.lock.fd, time.time())
+            self._write(self.lock.fd, (tokens, updated, granted, shed + 1))
+
+    def penalize(self, seconds: float):
+        # 上游已经开始限流，清空令牌并透支一段时间，所有进程一起退避
+        with self.lock:
+            now = time.time()
+            tokens, updated, granted, shed = self._read(self.lock.fd, now)
+            self._write(self.lock.fd, (min(tokens, -seconds * self.rate), now, granted, shed))
+
+    def usage(self) -> Dict:
+        now = time.time()
+        with self.lock:
+            tokens, updated, granted, shed = self._read(self.lock.fd, now)
+        tokens = min(float(self.burst), tokens + max(0.0, now - updated) * self.rate)
+        return {
+            'rate_per_second': self.rate,
+            'burst': self.burst,
+            'tokens_available': round(tokens, 3),
+            'budget_used_percent': round((1 - max(tokens, 0.0) / self.burst) * 100, 1),
+            'granted': granted,
+            'shed': shed,
+            'local_waits': self.waits,
+            'local_wait_seconds': round(self.waited_seconds, 3)
+        }
+
+
+class RateGovernor:
+    def __init__(self, directory: str = DEFAULT_DIRECTORY, limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 default_limit: Tuple[float, int] = DEFAULT_LIMIT, max_wait: float = DEFAULT_MAX_WAIT, logger=None):
+        self.directory = directory
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.default_limit = default_limit
+        self.max_wait = max_wait
+        self.logger = logger
+        self._buckets: Dict[str, HostBucket] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config, logger=None) -> 'RateGovernor':
+        limits = {}
+        if config.has_section('ratelimit'):
+            for host, value in config.items('ratelimit'):
+                if host not in _RESERVED_OPTIONS:
+                    limits[host] = parse_limit(value)
+        default = config.get('ratelimit', 'default', fallback=None)
+        return cls(
+            config.get('ratelimit', 'directory', fallback=DEFAULT_DIRECTORY),
+            limits,
+            parse_limit(default) if default else DEFAULT_LIMIT,
+            config.getfloat('ratelimit', 'max_wait', fallback=DEFAULT_MAX_WAIT),
+            logger
+        )
+
+    def bucket(self, host: str) -> HostBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.get(host)
+                if bucket is None:
+                    rate, burst = self.limits.get(host, self.default_limit)
+                    path = os.path.join(self.directory, _UNSAFE_CHARS.sub('_', host) + '.bucket')
+                    bucket = HostBucket(host, rate, burst, path)
+                    self._buckets[host] = bucket
+        return bucket
+
+    def acquire(self, host: str, max_wait: Optional[float] = None) -> float:
+        bucket = self.bucket(host)
+        max_wait = self.max_wait if max_wait is None else max_wait
+        started = time.monotonic()
+        queued = False
+
+        while True:
+            wait = bucket.try_acquire(time.time())
+            if wait == 0:
+                waited = time.monotonic() - started if queued else 0.0
+                if queued:
+                    bucket.waits += 1
+                    bucket.waited_seconds += waited
+                return waited
+
+            # 排队等待不超过 max_wait，超过则直接拒绝，保证请求延迟可预期
+            if time.monotonic() - started + wait > max_wait:
+                bucket.record_shed()
+                raise RateLimitExceeded(f'上游请求过于频繁，已限流: {host}')
+            queued = True
+            time.sleep(wait)
+
+    def get(self, client, url: str, **kwargs):
+        host = (urlsplit(url).hostname or '').lower()
+        self.acquire(host)
+        response = client.get(url, **kwargs)
+        if response.status_code in THROTTLED_STATUS_CODES:
+            self.bucket(host).penalize(PENALTY_SECONDS)
+            if self.logger:
+                self.logger.log_warning(f'上游 {host} 返回 {response.status_code}，暂停请求 {PENALTY_SECONDS} 秒')
+        return response
+
+    def usage(self) -> Dict[str, Dict]:
+        hosts = set(self.limits) | set(self._buckets)
+        return {host: self.bucket(host).usage() for host in sorted(hosts)}
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+        for bucket in self._buckets.values():
+            bucket.lock.after_fork()
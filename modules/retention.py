@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from modules.file_utils import FileLock
+
+
+RAW_RESOLUTION = 0
+DEFAULT_TIERS = 'raw:48h, 5m:90d, 1d:forever'
+DEFAULT_COMPACTION_INTERVAL = 300
+
+_DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+
+def parse_duration(value: str) -> int:
+    value = value.strip().lower()
+    if not value:
+        raise Exception('时长不能为空')
+    unit = _DURATION_UNITS.get(value[-1])
+    try:
+        if unit is None:
+            return int(value)
+        return int(float(value[:-1]) * unit)
+    except ValueError:
+        raise Exception(f'无法解析时长: {value}')
+
+
+@dataclass(frozen=True)
+class RetentionTier:
+    resolution: int
+    max_age: Optional[int]
+
+    @property
+    def name(self) -> str:
+        return 'raw' if self.resolution == RAW_RESOLUTION else f'{self.resolution}s'
+
+
+class RetentionPolicy:
+    def __init__(self, tiers: List[RetentionTier], compaction_interval: int = DEFAULT_COMPACTION_INTERVAL):
+        if not tiers or tiers[0].resolution != RAW_RESOLUTION:
+            raise Exception('保留策略的第一层必须是原始数据 (raw)')
+
+        for previous, tier in zip(tiers, tiers[1:]):
+            if previous.max_age is None:
+                raise Exception('只有最后一层可以永久保留')
+            if tier.resolution <= previous.resolution:
+                raise Exception('保留策略各层的粒度必须逐层变粗')
+            if previous.resolution and tier.resolution % previous.resolution:
+                raise Exception(f'粒度 {tier.resolution}s 必须是 {previous.resolution}s 的整数倍')
+            if tier.max_age is not None and tier.max_age <= previous.max_age:
+                raise Exception('保留策略各层的保留时长必须逐层变长')
+
+        self.tiers = tiers
+        self.compaction_interval = compaction_interval
+
+    @classmethod
+    def parse(cls, spec: str, compaction_interval: int = DEFAULT_COMPACTION_INTERVAL) -> 'RetentionPolicy':
+        tiers = []
+        for part in spec.split(','):
+            if not part.strip():
+                continue
+            resolution, _, max_age = part.partition(':')
+            resolution = resolution.strip().lower()
+            max_age = max_age.strip().lower()
+            tiers.append(RetentionTier(
+                RAW_RESOLUTION if resolution == 'raw' else parse_duration(resolution),
+                None if max_age in ('', 'forever') else parse_duration(max_age)
+            ))
+        return cls(tiers, compaction_interval)
+
+    @classmethod
+    def from_config(cls, config) -> 'RetentionPolicy':
+        return cls.parse(
+            config.get('retention', 'tiers', fallback=DEFAULT_TIERS),
+            config.getint('retention', 'compaction_interval', fallback=DEFAULT_COMPACTION_INTERVAL)
+        )
+
+    @property
+    def raw_window(self) -> Optional[int]:
+        return self.tiers[0].max_age
+
+    def cutoffs(self, now: float) -> List[Tuple[RetentionTier, Optional[RetentionTier], float]]:
+        steps = []
+        for index, tier in enumerate(self.tiers):
+            if tier.max_age is None:
+                break
+            target = self.tiers[index + 1] if index + 1 < len(self.tiers) else None
+            cutoff = now - tier.max_age
+            if target is not None:
+                # 只下采样已经完整结束的桶，避免同一个桶被拆成多次汇总
+                cutoff -= cutoff % target.resolution
+            steps.append((tier, target, cutoff))
+        return steps
+
+
+class RetentionEngine:
+    def __init__(self, store, policy: RetentionPolicy, columnar=None, logger=None, lock_path: Optional[str] = None):
+        self.store = store
+        self.policy = policy
+        self.columnar = columnar
+        self.logger = logger
+        self.last_run = 0.0
+        # 多个 worker 与采集进程共用一把文件锁，锁文件的内容记录最近一次执行的时间
+        self._file_lock = FileLock(lock_path or f'{store.db_path}.retention.lock')
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def _shared_last_run(self) -> float:
+        # 只在持有锁时调用；新建的空锁文件表示从未执行过
+        try:
+            return float(os.pread(self._file_lock.fd, 64, 0) or 0)
+        except (OSError, TypeError, ValueError):
+            return 0.0
+
+    def maybe_run(self, now: Optional[float] = None) -> Optional[Dict[str, int]]:
+        now = now or time.time()
+        if now - self.last_run < self.policy.compaction_interval:
+            return None
+        if not self._file_lock.try_acquire():
+            return None
+        try:
+            # 其他进程刚执行过时跳过，同一个间隔内只降采样一次
+            self.last_run = max(self.last_run, self._shared_last_run())
+            if now - self.last_run < self.policy.compaction_interval:
+                return None
+            return self._run(now)
+        finally:
+            self._file_lock.release()
+
+    def run(self, now: Optional[float] = None) -> Dict[str, int]:
+        with self._file_lock:
+            return self._run(now or time.time())
+
+    def _run(self, now: float) -> Dict[str, int]:
+        self.last_run = now
+        try:
+            os.ftruncate(self._file_lock.fd, 0)
+            os.pwrite(self._file_lock.fd, repr(now).encode('ascii'), 0)
+        except OSError:
+            pass
+
+        stats = {}
+        # 资产 -> 列式文件中需要替换的 [起点, 终点) 区间
+        ranges: Dict[str, Tuple[float, float]] = {}
+        try:
+            for tier, target, cutoff in self.policy.cutoffs(now):
+                if target is None:
+                    assets = self.store.list_assets() if self.columnar else ()
+                    expired = self.store.expire(tier.resolution, cutoff)
+                    stats[tier.name] = expired
+                    if expired and self.columnar:
+                        self.columnar.drop_before(assets, cutoff)
+                    continue
+                changed = self.store.compact(tier.resolution, target.resolution, cutoff)
+                stats[tier.name] = len(changed)
+                for asset, bucket in changed.items():
+                    start, end = ranges.get(asset, (bucket, cutoff))
+                    ranges[asset] = (min(start, bucket), max(end, cutoff))
+
+            if self.columnar and ranges:
+                self.columnar.splice_from_store(self.store, ranges)
+        except Exception as e:
+            if self.logger:
+                self.logger.log_error(f'历史数据降采样失败: {str(e)}')
+            return stats
+
+        if ranges and self.logger:
+            self.logger.log_info(f'历史数据降采样完成: {len(ranges)} 个资产, 各层处理情况 {stats}')
+        return stats
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name='retention', daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.maybe_run()
+            except Exception as e:
+                if self.logger:
+                    self.logger.log_error(f'历史数据降采样失败: {str(e)}')
+            if self._stop.wait(self.policy.compaction_interval):
+                return
+
+    def stop(self):
+        self._stop.set()
+
+    def after_fork(self):
+        # 线程不会随 fork 复制到子进程，降采样继续由启动它的进程执行
+        self._thread = None
+        self._stop = threading.Event()
+        self._file_lock.after_fork()
@@ -0,0 +1,129 @@
+import hashlib
+import mimetypes
+import os
+import re
+from typing import Dict, Optional
+
+from modules.compression import CachedPayload, STATIC_LEVELS
+
+
+MAX_CACHED_FILE_SIZE = 5 * 1024 * 1024
+HASH_LENGTH = 12
+
+FINGERPRINT_PREFIXES = ('js/', 'css/', 'assets/')
+ENTRY_POINTS = ('index.html', 'sw.js', 'manifest.json')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+MIMETYPE_OVERRIDES = {
+    'manifest.json': 'application/manifest+json',
+}
+
+EXTENSION_MIMETYPES = {
+    '.js': 'application/javascript',
+    '.css': 'text/css',
+    '.html': 'text/html',
+    '.json': 'application/json',
+    '.svg': 'image/svg+xml',
+    '.png': 'image/png',
+}
+
+_SW_STATIC_FILES_PATTERN = re.compile(r'(const STATIC_FILES = \[)(.*?)(\];)', re.DOTALL)
+_SW_STATIC_CACHE_PATTERN = re.compile(r"(const STATIC_CACHE = '[^']*?)(?:-v[^'-]*)?'")
+
+
+def guess_mimetype(relative_path: str) -> str:
+    if relative_path in MIMETYPE_OVERRIDES:
+        return MIMETYPE_OVERRIDES[relative_path]
+    extension = os.path.splitext(relative_path)[1].lower()
+    if extension in EXTENSION_MIMETYPES:
+        return EXTENSION_MIMETYPES[extension]
+    return mimetypes.guess_type(relative_path)[0] or 'application/octet-stream'
+
+
+def content_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()[:HASH_LENGTH]
+
+
+def fingerprinted_path(relative_path: str, digest: str) -> str:
+    stem, extension = os.path.splitext(relative_path)
+    return f'{stem}.{digest}{extension}'
+
+
+class StaticAsset:
+    __slots__ = ('payload', 'etag', 'cache_control')
+
+    def __init__(self, payload: CachedPayload, etag: str, cache_control: str):
+        self.payload = payload
+        self.etag = etag
+        self.cache_control = cache_control
+
+
+class StaticAssetStore:
+    def __init__(self, root: str, logger=None):
+        self.root = root
+        self.logger = logger
+        self.assets: Dict[str, StaticAsset] = {}
+        self.urls: Dict[str, str] = {}
+        self.build_hash = ''
+
+    def _read_files(self) -> Dict[str, bytes]:
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                full_path = os.path.join(dirpath, filename)
+                if os.path.getsize(full_path) > MAX_CACHED_FILE_SIZE:
+                    continue
+
+                relative_path = os.path.relpath(full_path, self.root).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    files[relative_path] = f.read()
+        return files
+
+    def _rewrite_references(self, text: str) -> str:
+        for relative_path in sorted(self.urls, key=len, reverse=True):
+            hashed = self.urls[relative_path]
+            for quote in ('"', "'"):
+                text = text.replace(f'{quote}{relative_path}{quote}', f'{quote}{hashed}{quote}')
+                text = text.replace(f'{quote}/{relative_path}{quote}', f'{quote}/{hashed}{quote}')
+        return text
+
+    def _rewrite_service_worker(self, text: str) -> str:
+        text = _SW_STATIC_FILES_PATTERN.sub(
+            lambda match: match.group(1) + self._rewrite_references(match.group(2)) + match.group(3),
+            text
+        )
+        return _SW_STATIC_CACHE_PATTERN.sub(lambda match: f"{match.group(1)}-v{self.build_hash}'", text)
+
+    def load(self) -> 'StaticAssetStore':
+        files = self._read_files()
+
+        urls = {}
+        for relative_path, body in files.items():
+            if relative_path.startswith(FINGERPRINT_PREFIXES) and relative_path not in ENTRY_POINTS:
+                urls[relative_path] = fingerprinted_path(relative_path, content_hash(body))
+        self.urls = urls
+        self.build_hash = content_hash(''.join(sorted(urls.values())).encode('utf-8'))
+
+        assets = {}
+        for relative_path, body in files.items():
+            if relative_path == 'sw.js':
+                body = self._rewrite_service_worker(body.decode('utf-8')).encode('utf-8')
+            elif relative_path in ENTRY_POINTS:
+                body = self._rewrite_references(body.decode('utf-8')).encode('utf-8')
+
+            payload = CachedPayload(body, guess_mimetype(relative_path), STATIC_LEVELS).precompress()
+            digest = content_hash(body)
+
+            assets[relative_path] = StaticAsset(payload, digest, REVALIDATE_CACHE_CONTROL)
+            if relative_path in urls:
+                assets[urls[relative_path]] = StaticAsset(payload, digest, IMMUTABLE_CACHE_CONTROL)
+
+        self.assets = assets
+        if self.logger:
+            self.logger.log_info(f'静态资源已加载: {len(files)} 个文件, {len(urls)} 个带指纹, 版本 {self.build_hash}')
+        return self
+
+    def get(self, relative_path: str) -> Optional[StaticAsset]:
+        return self.assets.get(relative_path)
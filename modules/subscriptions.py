@@ -0,0 +1,168 @@
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from modules.data_processor import is_fund_code
+from modules.watchlist_store import WatchlistStore
+
+
+DEFAULT_WATCHLIST_DIR = os.path.join('data', 'watchlists')
+DEFAULT_REFRESH_INTERVAL = 5.0
+WATCHLIST_HEADER = '# 用户自选基金\n# 每行一个基金代码，以#开头的行为注释\n'
+WATCHLIST_SUFFIX = '.txt'
+
+_USER_ID = re.compile(r'^[0-9A-Za-z_.@-]{1,64}$')
+
+
+def normalize_user(user_id: Optional[str]) -> str:
+    user_id = (user_id or '').strip()
+    if not _USER_ID.match(user_id) or user_id.startswith('.'):
+        raise ValueError(f'用户标识不合法: {user_id}')
+    return user_id
+
+
+class SubscriptionIndex:
+    def __init__(self):
+        self._subscribers: Dict[str, Set[str]] = {}
+        self._codes: Tuple[str, ...] = ()
+        self._lock = threading.Lock()
+
+    def apply(self, user: str, added: Iterable[str] = (), removed: Iterable[str] = ()):
+        with self._lock:
+            changed = False
+            for code in added:
+                subscribers = self._subscribers.setdefault(code, set())
+                if user not in subscribers:
+                    subscribers.add(user)
+                    changed = changed or len(subscribers) == 1
+            for code in removed:
+                subscribers = self._subscribers.get(code)
+                if subscribers and user in subscribers:
+                    subscribers.discard(user)
+                    if not subscribers:
+                        # 最后一个关注者取消后，该基金退出轮询集合
+                        del self._subscribers[code]
+                        changed = True
+            if changed:
+                self._codes = tuple(sorted(self._subscribers))
+
+    def codes(self) -> Tuple[str, ...]:
+        return self._codes
+
+    def subscriber_count(self, code: str) -> int:
+        return len(self._subscribers.get(code, ()))
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {code: len(users) for code, users in self._subscribers.items()}
+
+    def after_fork(self):
+        self._lock = threading.Lock()
+
+
+class UserWatchlists:
+    def __init__(self, directory: str = DEFAULT_WATCHLIST_DIR, logger=None,
+                 refresh_interval: float = DEFAULT_REFRESH_INTERVAL):
+        self.directory = directory
+        self.logger = logger
+        self.refresh_interval = refresh_interval
+        self.index = SubscriptionIndex()
+        self._stores: Dict[str, WatchlistStore] = {}
+        self._entries: Dict[str, Tuple[str, ...]] = {}
+        self._refreshed_at = 0.0
+        self._lock = threading.RLock()
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config, logger=None) -> 'UserWatchlists':
+        return cls(
+            config.get('watchlist', 'directory', fallback=DEFAULT_WATCHLIST_DIR),
+            logger,
+            config.getfloat('watchlist', 'refresh_interval', fallback=DEFAULT_REFRESH_INTERVAL)
+        )
+
+    def _store(self, user: str) -> WatchlistStore:
+        store = self._stores.get(user)
+        if store is None:
+            with self._lock:
+                store = self._stores.get(user)
+                if store is None:
+                    # 自选基金进入共享的轮询集合，与全局列表一样只接受 6 位数字代码
+                    store = WatchlistStore(os.path.join(self.directory, user + WATCHLIST_SUFFIX), WATCHLIST_HEADER,
+                                           is_fund_code)
+                    self._stores[user] = store
+        return store
+
+    def _sync(self, user: str, store: WatchlistStore):
+        with self._lock:
+            previous = set(self._entries.get(user, ()))
+            current = tuple(store.entries)
+            self._entries[user] = current
+            self.index.apply(user, set(current) - previous, previous - set(current))
+
+    def _load(self, user: str) -> WatchlistStore:
+        store = self._store(user)
+        # 文件签名未变时不会重新解析，其他 worker 修改过才会重新读取并更新索引
+        if os.path.exists(store.path) and store.load():
+            self._sync(user, store)
+        return store
+
+    def get(self, user_id: str) -> List[str]:
+        user = normalize_user(user_id)
+        self._load(user)
+        return list(self._entries.get(user, ()))
+
+    def update(self, user_id: str, add: Iterable[str] = (), remove: Iterable[str] = ()) -> Tuple[List[str], List[str]]:
+        user = normalize_user(user_id)
+        store = self._store(user)
+        added, removed = store.update(add, remove)
+        self._sync(user, store)
+        if self.logger and (added or removed):
+            self.logger.log_info(f'用户 {user} 自选基金变更: 新增 {added}, 移除 {removed}')
+        return added, removed
+
+    def refresh(self):
+        users = set()
+        for entry in os.scandir(self.directory):
+            name = entry.name
+            if entry.is_file() and name.endswith(WATCHLIST_SUFFIX) and not name.startswith('.'):
+                users.add(name[:-len(WATCHLIST_SUFFIX)])
+
+        for user in users:
+            self._load(user)
+        with self._lock:
+            for user in set(self._entries) - users:
+                # 自选文件被删除，视为该用户取消全部关注
+                self.index.apply(user, removed=self._entries.pop(user))
+                self._stores.pop(user, None)
+        self._refreshed_at = time.monotonic()
+
+    def maybe_refresh(self):
+        if time.monotonic() - self._refreshed_at >= self.refresh_interval:
+            try:
+                self.refresh()
+            except Exception as e:
+                if self.logger:
+                    self.logger.log_error(f'刷新用户自选列表失败: {str(e)}')
+
+    def poll_codes(self) -> Tuple[str, ...]:
+        self.maybe_refresh()
+        return self.index.codes()
+
+    def stats(self) -> Dict:
+        self.maybe_refresh()
+        counts = self.index.counts()
+        return {
+            'users': len(self._entries),
+            'distinct_funds': len(counts),
+            'subscriptions': sum(counts.values()),
+            'top_funds': dict(sorted(counts.items(), key=lambda item: -item[1])[:20])
+        }
+
+    def after_fork(self):
+        self._lock = threading.RLock()
+        self.index.after_fork()
+        for store in self._stores.values():
+            store.after_fork()
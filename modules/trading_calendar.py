@@ -0,0 +1,228 @@
+import bisect
+import os
+import random
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from modules.logger import logger_instance
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:
+    ZoneInfo = None
+    ZoneInfoNotFoundError = Exception
+
+
+CN_TIMEZONE = timezone(timedelta(hours=8))
+
+# 每个交易日的交易时段，按当地时间距零点的分钟数表示，键为 weekday()
+CN_FUND_SESSIONS = {day: ((9 * 60 + 30, 11 * 60 + 30), (13 * 60, 15 * 60)) for day in range(5)}
+COMEX_SESSIONS = {
+    0: ((0, 17 * 60), (18 * 60, 24 * 60)),
+    1: ((0, 17 * 60), (18 * 60, 24 * 60)),
+    2: ((0, 17 * 60), (18 * 60, 24 * 60)),
+    3: ((0, 17 * 60), (18 * 60, 24 * 60)),
+    4: ((0, 17 * 60),),
+    6: ((18 * 60, 24 * 60),),
+}
+
+CALENDAR_WINDOW_DAYS = 40
+DEFAULT_HOLIDAYS_FILE = os.path.join('config', 'holidays.txt')
+DEFAULT_EDGE_WINDOW = 900
+DEFAULT_EDGE_INTERVAL = 60
+DEFAULT_JITTER = 0.1
+
+
+def _new_york_timezone():
+    if ZoneInfo is not None:
+        try:
+            return ZoneInfo('America/New_York')
+        except ZoneInfoNotFoundError:
+            pass
+    return timezone(timedelta(hours=-5))
+
+
+def _parse_holiday_line(line: str) -> Tuple[str, date, date]:
+    parts = line.split()
+    if len(parts) != 2:
+        raise ValueError('应为 "市场 日期" 或 "市场 起始~结束"')
+    first, _, last = parts[1].partition('~')
+    start = date.fromisoformat(first)
+    end = date.fromisoformat(last) if last else start
+    if end < start:
+        raise ValueError('结束日期早于起始日期')
+    return parts[0].lower(), start, end
+
+
+def load_holidays(path: str, logger=None) -> Dict[str, Set[date]]:
+    logger = logger or logger_instance
+    holidays: Dict[str, Set[date]] = {}
+    if not path or not os.path.exists(path):
+        return holidays
+
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+    except (OSError, UnicodeDecodeError) as e:
+        # 休市文件不可读时只按工作日交易时段轮询，不影响行情抓取
+        logger.log_error(f'读取休市日期文件失败 {path}: {str(e)}')
+        return holidays
+
+    for number, line in enumerate(lines, 1):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        try:
+            market, day, end = _parse_holiday_line(line)
+        except ValueError as e:
+            # 单行格式错误只跳过该行
+            logger.log_error(f'休市日期格式错误 {path} 第 {number} 行: {line} ({str(e)})')
+            continue
+        while day <= end:
+            holidays.setdefault(market, set()).add(day)
+            day += timedelta(days=1)
+    return holidays
+
+
+class TradingCalendar:
+    def __init__(self, name: str, tz, weekly_sessions: Dict[int, Tuple[Tuple[int, int], ...]],
+                 holidays: Optional[Set[date]] = None):
+        self.name = name
+        self.tz = tz
+        self.weekly_sessions = weekly_sessions
+        self.holidays = holidays or set()
+        self._windows: Dict[date, Tuple[List[float], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def _day_sessions(self, day: date) -> List[Tuple[float, float]]:
+        if day in self.holidays:
+            return []
+        midnight = datetime(day.year, day.month, day.day, tzinfo=self.tz)
+        return [
+            ((midnight + timedelta(minutes=start)).timestamp(), (midnight + timedelta(minutes=end)).timestamp())
+            for start, end in self.weekly_sessions.get(day.weekday(), ())
+        ]
+
+    def _window(self, ts: float) -> Tuple[List[float], List[float]]:
+        anchor = datetime.fromtimestamp(ts, self.tz).date()
+        window = self._windows.get(anchor)
+        if window is not None:
+            return window
+
+        starts: List[float] = []
+        ends: List[float] = []
+        day = anchor - timedelta(days=CALENDAR_WINDOW_DAYS)
+        while day <= anchor + timedelta(days=CALENDAR_WINDOW_DAYS):
+            for start, end in self._day_sessions(day):
+                # 跨零点的连续时段合并为一个交易时段
+                if ends and ends[-1] == start:
+                    ends[-1] = end
+                else:
+                    starts.append(start)
+                    ends.append(end)
+            day += timedelta(days=1)
+
+        with self._lock:
+            if len(self._windows) >= 8:
+                self._windows.clear()
+            self._windows[anchor] = (starts, ends)
+        return starts, ends
+
+    def current_session(self, ts: float) -> Optional[Tuple[float, float]]:
+        starts, ends = self._window(ts)
+        index = bisect.bisect_right(starts, ts) - 1
+        if index >= 0 and ts < ends[index]:
+            return starts[index], ends[index]
+        return None
+
+    def is_open(self, ts: float) -> bool:
+        return self.current_session(ts) is not None
+
+    def next_open(self, ts: float) -> Optional[float]:
+        starts, ends = self._window(ts)
+        index = bisect.bisect_right(starts, ts)
+        return starts[index] if index < len(starts) else None
+
+    def last_close(self, ts: float) -> Optional[float]:
+        starts, ends = self._window(ts)
+        index = bisect.bisect_right(ends, ts) - 1
+        return ends[index] if index >= 0 else None
+
+
+def build_calendars(holidays: Dict[str, Set[date]]) -> Dict[str, TradingCalendar]:
+    return {
+        'funds': TradingCalendar('cn', CN_TIMEZONE, CN_FUND_SESSIONS, holidays.get('cn')),
+        'metals': TradingCalendar('comex', _new_york_timezone(), COMEX_SESSIONS, holidays.get('comex')),
+    }
+
+
+class PollScheduler:
+    def __init__(self, calendars: Dict[str, TradingCalendar], intervals: Dict[str, float],
+                 edge_intervals: Optional[Dict[str, float]] = None, edge_window: float = DEFAULT_EDGE_WINDOW,
+                 jitter: float = DEFAULT_JITTER):
+        self.calendars = calendars
+        self.intervals = intervals
+        self.edge_intervals = edge_intervals or {}
+        self.edge_window = edge_window
+        self.jitter = jitter
+
+    @classmethod
+    def from_config(cls, config) -> 'PollScheduler':
+        holidays = load_holidays(config.get('schedule', 'holidays_file', fallback=DEFAULT_HOLIDAYS_FILE))
+        return cls(
+            build_calendars(holidays),
+            {
+                'metals': config.getfloat('gold', 'update_interval', fallback=60),
+                'funds': config.getfloat('fund', 'update_interval', fallback=3600),
+            },
+            {
+                'metals': config.getfloat('gold', 'edge_interval', fallback=DEFAULT_EDGE_INTERVAL),
+                'funds': config.getfloat('fund', 'edge_interval', fallback=DEFAULT_EDGE_INTERVAL),
+            },
+            config.getfloat('schedule', 'edge_window', fallback=DEFAULT_EDGE_WINDOW),
+            config.getfloat('schedule', 'jitter', fallback=DEFAULT_JITTER)
+        )
+
+    def poll_interval(self, group: str, now: Optional[float] = None) -> Optional[float]:
+        now = now or time.time()
+        session = self.calendars[group].current_session(now)
+        if session is None:
+            return None
+
+        interval = self.intervals[group]
+        start, end = session
+        if now - start < self.edge_window or end - now < self.edge_window:
+            # 开盘和收盘附近行情变化最快，加密轮询
+            interval = min(interval, self.edge_intervals.get(group, DEFAULT_EDGE_INTERVAL))
+        else:
+            interval = min(interval, end - self.edge_window - now)
+        return max(min(interval, end - now), 1.0)
+
+    def next_poll_at(self, group: str, now: Optional[float] = None) -> Optional[float]:
+        now = now or time.time()
+        interval = self.poll_interval(group, now)
+        if interval is not None:
+            return now + interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+        next_open = self.calendars[group].next_open(now)
+        if next_open is None:
+            return None
+        # 休市期间不轮询，开盘后随机错开各个进程的首次刷新
+        return next_open + random.uniform(0, self.edge_intervals.get(group, DEFAULT_EDGE_INTERVAL) * self.jitter)
+
+    def status(self, now: Optional[float] = None) -> Dict[str, Dict]:
+        now = now or time.time()
+        result = {}
+        for group, calendar in self.calendars.items():
+            next_open = calendar.next_open(now)
+            session = calendar.current_session(now)
+            result[group] = {
+                'market': calendar.name,
+                'is_open': session is not None,
+                'session_end': datetime.fromtimestamp(session[1]).isoformat() if session else None,
+                'next_open': datetime.fromtimestamp(next_open).isoformat() if next_open else None,
+                'poll_interval': self.poll_interval(group, now)
+            }
+        return result
@@ -0,0 +1,111 @@
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from modules.file_utils import FileLock, atomic_write
+
+
+def _signature(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class WatchlistStore:
+    def __init__(self, path: str, header: str, validate: Optional[Callable[[str], bool]] = None):
+        self.path = path
+        self.header = header
+        self.validate = validate or (lambda entry: True)
+        # dict 保留文件中的顺序，同时提供 O(1) 的成员判断
+        self._entries: Dict[str, None] = {}
+        self._signature = ()
+        self._lock = FileLock(path + '.lock')
+        self._thread_lock = threading.Lock()
+
+    @property
+    def entries(self) -> List[str]:
+        return list(self._entries)
+
+    def __contains__(self, entry: str) -> bool:
+        return entry in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _read(self) -> Dict[str, None]:
+        entries: Dict[str, None] = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and self.validate(line):
+                    entries[line] = None
+        return entries
+
+    def is_stale(self) -> bool:
+        return _signature(self.path) != self._signature
+
+    def load(self, force: bool = False) -> bool:
+        # 文件签名与上次读写时一致说明是自己写入的，监控线程收到事件后不必重新解析
+        with self._thread_lock:
+            if not force and not self.is_stale():
+                return False
+            if not os.path.exists(self.path):
+                atomic_write(self.path, self.header)
+            self._entries = self._read()
+            self._signature = _signature(self.path)
+            return True
+
+    def _append(self, entries: List[str]):
+        with open(self.path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            needs_newline = False
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+            data = ('\n' if needs_newline else '') + ''.join(f'{entry}\n' for entry in entries)
+            f.write(data.encode('utf-8'))
+
+    def _rewrite(self):
+        atomic_write(self.path, self.header + ''.join(f'{entry}\n' for entry in self._entries))
+
+    def update(self, add: Iterable[str] = (), remove: Iterable[str] = ()) -> Tuple[List[str], List[str]]:
+        if isinstance(add, str):
+            add = [add]
+        if isinstance(remove, str):
+            remove = [remove]
+        add = [entry.strip() for entry in add if entry and entry.strip()]
+        remove = {entry.strip() for entry in remove if entry and entry.strip()}
+
+        invalid = [entry for entry in add if not self.validate(entry)]
+        if invalid:
+            raise ValueError(f'格式不正确: {", ".join(invalid)}')
+
+        with self._thread_lock, self._lock:
+            # 其他 worker 可能刚写过文件，持锁后以磁盘上的最新内容为准再合并
+            if self.is_stale():
+                if not os.path.exists(self.path):
+                    atomic_write(self.path, self.header)
+                self._entries = self._read()
+
+            removed = [entry for entry in remove if entry in self._entries]
+            added = []
+            for entry in add:
+                if entry not in self._entries and entry not in remove:
+                    self._entries[entry] = None
+                    added.append(entry)
+            for entry in removed:
+                del self._entries[entry]
+
+            if removed:
+                self._rewrite()
+            elif added:
+                # 只新增时直接追加到文件末尾，不需要重写整个列表
+                self._append(added)
+            self._signature = _signature(self.path)
+            return added, removed
+
+    def after_fork(self):
+        self._lock.after_fork()
+        self._thread_lock = threading.Lock()
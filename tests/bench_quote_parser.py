@@ -0,0 +1,47 @@
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.quote_parser import QuoteParseError, parse_fund_payload, parse_sina_symbol
+
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+ROUNDS = 5
+NUMBER = 20000
+
+
+def read_corpus(name: str) -> bytes:
+    with open(os.path.join(CORPUS_DIR, name), 'rb') as f:
+        return f.read()
+
+
+def parse_fund_or_error(raw: bytes):
+    try:
+        return parse_fund_payload(raw)
+    except QuoteParseError:
+        return None
+
+
+def bench(label: str, func) -> None:
+    best = min(timeit.repeat(func, repeat=ROUNDS, number=NUMBER))
+    print(f'{label:<40} {best / NUMBER * 1e6:8.2f} us/次')
+
+
+def main() -> None:
+    multi = read_corpus('sina_multi.txt')
+    gold = read_corpus('sina_gold.txt')
+    truncated = read_corpus('sina_truncated.txt')
+    fund = read_corpus('fund_valid.txt')
+    fund_truncated = read_corpus('fund_truncated.txt')
+
+    bench('sina 单品种 (hf_GC)', lambda: parse_sina_symbol(gold, 'hf_GC', '国际黄金'))
+    bench('sina 多品种取一个 (hf_SI)', lambda: parse_sina_symbol(multi, 'hf_SI', '国际白银'))
+    bench('sina 截断响应', lambda: parse_sina_symbol(truncated, 'hf_GC', '国际黄金'))
+    bench('基金估值', lambda: parse_fund_payload(fund))
+    bench('基金截断响应', lambda: parse_fund_or_error(fund_truncated))
+
+
+if __name__ == '__main__':
+    main()
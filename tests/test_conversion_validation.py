@@ -0,0 +1,50 @@
+from decimal import Decimal
+
+import pytest
+
+from modules import exchange_rate_manager
+from modules.conversion_validation import (ConversionValidator, DEFAULT_RATES, OUNCE_TO_GRAM, TO_CNY, TO_USD,
+                                           decimal_reference, main, pinned, tie_prices)
+
+
+SAMPLES = 500
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def report(request, monkeypatch):
+    if request.param == 'python':
+        monkeypatch.setattr(exchange_rate_manager, 'numpy', None)
+    elif exchange_rate_manager.numpy is None:
+        pytest.skip('numpy 未安装')
+    return ConversionValidator(DEFAULT_RATES, SAMPLES, seed=1).run()
+
+
+def test_validator_suite_passes(report):
+    failed = [detail for detail in report['details'] if not detail['passed']]
+    assert failed == []
+    assert report['passed'] == report['total_tests']
+
+
+def test_tie_prices_land_exactly_on_half_cent():
+    checked = 0
+    # 多数汇率在 MAX_TIE_PRICE 以内不存在恰好五厘的价格，只校验找到的那些
+    for rate in DEFAULT_RATES:
+        manager = pinned(rate)
+        for direction in (TO_CNY, TO_USD):
+            factor = Decimal(repr(rate)) / OUNCE_TO_GRAM if direction == TO_CNY else OUNCE_TO_GRAM / Decimal(repr(rate))
+            for price in tie_prices(rate, direction, count=5):
+                exact = Decimal(repr(price)) * factor * 1000
+                assert abs(exact - exact.to_integral_value()) < Decimal('1e-12')
+                assert exact.to_integral_value() % 10 == 5
+
+                scalar = (manager.convert_usd_oz_to_cny_gram(price) if direction == TO_CNY
+                          else manager.convert_cny_gram_to_usd_oz(price))
+                assert manager.convert_many([price], direction) == [scalar]
+                assert abs(scalar - decimal_reference(price, rate, direction)) <= 0.01 + 1e-9
+                checked += 1
+    assert checked > 0
+
+
+def test_cli_exit_code(capsys):
+    assert main(['--samples', '50', '--benchmark', '0']) == 0
+    assert '"failed": 0' in capsys.readouterr().out
@@ -0,0 +1,132 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from modules import exchange_rate_manager
+from modules.exchange_rate_manager import ExchangeRateManager
+from modules.history_store import HistoryStore
+
+
+RATES = {'USD': 1.0, 'CNY': 7.2, 'EUR': 0.9, 'JPY': 150.0}
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+
+def write_cache(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError('缓存仍然新鲜时不应请求汇率接口')
+    monkeypatch.setattr('modules.exchange_rate_manager.requests.get', fail)
+
+
+@pytest.fixture
+def cached_manager(tmp_path, offline):
+    cache_file = tmp_path / 'exchange_rate_cache.json'
+    write_cache(cache_file, {'rate': RATES['CNY'], 'rates': RATES, 'last_update': datetime.now().isoformat(),
+                             'source': 'test'})
+    return ExchangeRateManager(cache_file=str(cache_file))
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def vector_backend(request, monkeypatch):
+    if request.param == 'python':
+        monkeypatch.setattr(exchange_rate_manager, 'numpy', None)
+    elif exchange_rate_manager.numpy is None:
+        pytest.skip('numpy 未安装')
+    return request.param
+
+
+def test_legacy_cache_without_rates_supports_cross_rate(tmp_path, offline):
+    cache_file = tmp_path / 'exchange_rate_cache.json'
+    write_cache(cache_file, {'rate': 7.1, 'last_update': datetime.now().isoformat(), 'source': 'legacy'})
+
+    manager = ExchangeRateManager(cache_file=str(cache_file))
+
+    assert manager.get_rates() == {'USD': 1.0, 'CNY': 7.1}
+    assert manager.cross_rate('CNY', 'USD') == pytest.approx(1 / 7.1)
+    with pytest.raises(ValueError):
+        manager.cross_rate('USD', 'EUR')
+
+
+def test_cross_rate_is_derived_from_usd_table(cached_manager):
+    assert cached_manager.cross_rate('usd', 'cny') == 7.2
+    assert cached_manager.cross_rate('EUR', 'CNY') == pytest.approx(8.0)
+    assert cached_manager.cross_rate('JPY', 'JPY') == 1.0
+    assert cached_manager.convert_amount(100, 'EUR', 'JPY') == round(100 * 150.0 / 0.9, 2)
+    with pytest.raises(ValueError, match='XXX'):
+        cached_manager.cross_rate('XXX', 'CNY')
+
+
+def test_refresh_parses_table_and_records_history(tmp_path, monkeypatch):
+    payload = {'rates': {'cny': 7.25, 'EUR': {'value': 0.92}, 'JPY': 149.5, 'BAD': -1, 'NAN': 'x'}}
+    calls = []
+
+    def fake_get(url, timeout=None):
+        calls.append(url)
+        return FakeResponse(payload)
+
+    monkeypatch.setattr('modules.exchange_rate_manager.requests.get', fake_get)
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    cache_file = str(tmp_path / 'exchange_rate_cache.json')
+    manager = ExchangeRateManager(store=store, history_currencies=('CNY', 'EUR'), cache_file=cache_file)
+
+    assert manager.get_rates() == {'USD': 1.0, 'CNY': 7.25, 'EUR': 0.92, 'JPY': 149.5}
+    assert len(calls) == 1
+    assert [row[1] for row in store.query_fx_rates('USD/EUR')] == [0.92]
+    assert store.query_fx_rates('USD/JPY') == []
+
+    # 另一个 worker 直接读取共享缓存，不再请求上游
+    other = ExchangeRateManager(cache_file=cache_file)
+    assert other.cross_rate('EUR', 'JPY') == pytest.approx(149.5 / 0.92)
+    assert len(calls) == 1
+    store.close()
+
+
+def test_convert_series_uses_rate_in_effect_at_each_point(tmp_path, offline, vector_backend):
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    store.add_fx_rates([('USD/CNY', 1000.0, 7.0, 'test'), ('USD/CNY', 2000.0, 7.5, 'test')])
+    cache_file = tmp_path / 'exchange_rate_cache.json'
+    write_cache(cache_file, {'rate': 7.2, 'rates': RATES, 'last_update': datetime.now().isoformat()})
+    manager = ExchangeRateManager(store=store, cache_file=str(cache_file))
+
+    timestamps = [1500.0, 1999.0, 2000.0, 2500.0]
+    prices, rates = manager.convert_series(timestamps, [2000.0] * 4)
+
+    assert rates == [7.0, 7.0, 7.5, 7.5]
+    assert prices == [round(2000.0 * rate / ExchangeRateManager.OUNCE_TO_GRAM, 2) for rate in rates]
+    store.close()
+
+
+def test_convert_series_before_first_rate_uses_first_record(tmp_path, offline, vector_backend):
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    store.add_fx_rates([('USD/CNY', 1000.0, 7.0, 'test'), ('USD/CNY', 2000.0, 7.5, 'test')])
+    manager = ExchangeRateManager(store=store, cache_file=str(tmp_path / 'missing.json'))
+
+    _, rates = manager.convert_series([500.0, 1500.0], [1.0, 1.0])
+
+    assert rates == [7.0, 7.0]
+    store.close()
+
+
+def test_convert_series_falls_back_to_current_rate(cached_manager, vector_backend):
+    prices, rates = cached_manager.convert_series([1.0, 2.0], [3110.34768, 311.034768], 'EUR')
+
+    assert rates == [0.9, 0.9]
+    assert prices == cached_manager.convert_many([3110.34768, 311.034768], currency='EUR')
+    assert cached_manager.convert_series([], []) == ([], [])
+    with pytest.raises(ValueError):
+        cached_manager.convert_series([1.0], [1.0, 2.0])
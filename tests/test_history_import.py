@@ -0,0 +1,149 @@
+import json
+import shutil
+import time
+
+import pytest
+
+from modules.history_import import HistoryImporter, ImportJobs, normalize_asset, parse_timestamp
+from modules.history_store import HistoryStore
+
+
+CSV_ROWS = [
+    'asset,timestamp,price,change_percent',
+    'gold,1700000000,2000.5,0.1',
+    'gold,1700000060,2001.5,0.2',
+    'gold,1700000060,2001.5,0.2',
+    'silver,1700000000000,24.1,',
+    '110007,2023-11-15T00:02:00,1.234,0.3',
+    'gold,1700000120,-1,0',
+    'copper,1700000120,1,0',
+]
+
+
+def write_lines(path, lines):
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return str(path)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    yield store
+    store.close()
+
+
+def test_normalize_asset():
+    assert normalize_asset('gold') == 'gold'
+    assert normalize_asset('110007') == normalize_asset(' 110007 ')
+    with pytest.raises(ValueError):
+        normalize_asset('copper')
+
+
+def test_parse_timestamp_accepts_milliseconds_and_iso():
+    assert parse_timestamp('1700000000000') == 1700000000.0
+    assert parse_timestamp(1700000000) == 1700000000.0
+    with pytest.raises(ValueError):
+        parse_timestamp('0')
+
+
+def test_csv_import_dedups_and_counts_invalid_rows(tmp_path, store):
+    path = write_lines(tmp_path / 'quotes.csv', CSV_ROWS)
+    importer = HistoryImporter(store)
+
+    stats = importer.import_file(path, checkpoint_dir=str(tmp_path / 'checkpoints'))
+
+    assert stats['rows'] == 5
+    assert stats['imported'] == 4
+    assert stats['duplicates'] == 1
+    assert stats['invalid'] == 2
+    assert len(stats['errors']) == 2
+    assert stats['assets'] == sorted(['gold', 'silver', normalize_asset('110007')])
+    assert store.query_quotes('gold') == [(1700000000.0, 2000.5, 0.1), (1700000060.0, 2001.5, 0.2)]
+    assert store.query_quotes('silver') == [(1700000000.0, 24.1, 0.0)]
+
+    again = importer.import_file(path, resume=False, checkpoint_dir=str(tmp_path / 'checkpoints'))
+    assert again['imported'] == 0
+    assert again['duplicates'] == 5
+
+
+def test_ndjson_import_with_default_asset(tmp_path, store):
+    path = write_lines(tmp_path / 'quotes.ndjson', [
+        json.dumps({'ts': 1700000000, 'value': 2000}),
+        json.dumps({'time': 1700000060, 'price': 2001, 'change_percent': 0.5}),
+        '[1, 2]',
+        'not json',
+    ])
+    stats = HistoryImporter(store).import_file(path, asset='gold')
+
+    assert (stats['imported'], stats['invalid']) == (2, 2)
+    assert store.query_quotes('gold') == [(1700000000.0, 2000.0, 0.0), (1700000060.0, 2001.0, 0.5)]
+
+
+def test_checkpoint_resumes_by_content_hash(tmp_path, store, monkeypatch):
+    lines = ['asset,timestamp,price'] + [f'gold,{1700000000 + i * 60},{2000 + i}' for i in range(10)]
+    original = write_lines(tmp_path / 'upload_a.csv', lines)
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+    importer = HistoryImporter(store, chunk_size=3)
+
+    insert_quotes = store.insert_quotes
+    calls = []
+
+    def flaky_insert(rows):
+        calls.append(len(rows))
+        if len(calls) == 2:
+            raise OSError('磁盘已满')
+        return insert_quotes(rows)
+
+    monkeypatch.setattr(store, 'insert_quotes', flaky_insert)
+    with pytest.raises(OSError):
+        importer.import_file(original, checkpoint_dir=checkpoint_dir)
+    monkeypatch.setattr(store, 'insert_quotes', insert_quotes)
+
+    # 同一内容以新的文件名再次上传时从断点继续
+    renamed = str(tmp_path / 'upload_b.csv')
+    shutil.copy(original, renamed)
+    stats = importer.import_file(renamed, checkpoint_dir=checkpoint_dir)
+
+    assert stats['resumed'] is True
+    assert stats['rows'] == 10
+    assert stats['imported'] == 10
+    assert len(store.query_quotes('gold')) == 10
+
+
+def wait_for(jobs, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = jobs.get(job_id)
+        if job['status'] in ('completed', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'任务 {job_id} 未在 {timeout} 秒内结束')
+
+
+def test_import_jobs_report_progress_and_failures(tmp_path):
+    jobs = ImportJobs(str(tmp_path / 'jobs'))
+    progress_stats = {'rows': 1, 'imported': 1, 'duplicates': 0, 'invalid': 0, 'offset': 10, 'total_bytes': 10, 'line': 2}
+
+    def task(progress):
+        progress(progress_stats)
+        return {'imported': 1}
+
+    def failing(progress):
+        raise ValueError('CSV 缺少时间列')
+
+    try:
+        job = jobs.submit('quotes.csv', task)
+        assert job['status'] == 'queued'
+        done = wait_for(jobs, job['id'])
+        assert done['status'] == 'completed'
+        assert done['result'] == {'imported': 1}
+        assert 'line' not in done['progress']
+
+        failed = wait_for(jobs, jobs.submit('bad.csv', failing)['id'])
+        assert failed['status'] == 'failed'
+        assert failed['error'] == 'CSV 缺少时间列'
+
+        assert jobs.get('../../etc/passwd') is None
+        assert jobs.get('0' * 32) is None
+    finally:
+        jobs.shutdown()
@@ -0,0 +1,88 @@
+import json
+import os
+import random
+from dataclasses import asdict
+
+import pytest
+
+from modules.quote_models import MetalQuote
+from modules.quote_parser import QuoteParseError, parse_fund_payload, parse_sina_symbol
+
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+FUZZ_SEED = 20240102
+FUZZ_MUTATIONS = 300
+
+with open(os.path.join(CORPUS_DIR, 'expected.json'), 'r', encoding='utf-8') as f:
+    EXPECTED = json.load(f)
+
+
+def read_corpus(name: str) -> bytes:
+    with open(os.path.join(CORPUS_DIR, name), 'rb') as f:
+        return f.read()
+
+
+def quote_fields(quote) -> dict:
+    fields = asdict(quote)
+    fields.pop('timestamp')
+    return fields
+
+
+def mutations(raw: bytes):
+    # 每个截断前缀，加上固定种子的随机字节替换、删除和插入
+    for end in range(len(raw)):
+        yield raw[:end]
+    rng = random.Random(FUZZ_SEED)
+    for _ in range(FUZZ_MUTATIONS):
+        data = bytearray(raw)
+        for _ in range(rng.randint(1, 4)):
+            op = rng.randrange(3)
+            pos = rng.randrange(len(data) + 1)
+            if op == 0 and pos < len(data):
+                data[pos] = rng.randrange(256)
+            elif op == 1 and pos < len(data):
+                del data[pos]
+            else:
+                data.insert(pos, rng.choice(b'",;(){}:.-0123456789\xff\n'))
+        yield bytes(data)
+
+
+@pytest.mark.parametrize('case', EXPECTED['sina'], ids=lambda case: f"{case['file']}:{case['symbol']}")
+def test_sina_golden(case):
+    quote = parse_sina_symbol(read_corpus(case['file']), case['symbol'], case['default_name'])
+    if case['quote'] is None:
+        assert quote is None
+    else:
+        assert quote_fields(quote) == case['quote']
+
+
+@pytest.mark.parametrize('case', EXPECTED['fund'], ids=lambda case: case['file'])
+def test_fund_golden(case):
+    raw = read_corpus(case['file'])
+    if case['quote'] is None:
+        with pytest.raises(QuoteParseError):
+            parse_fund_payload(raw)
+    else:
+        assert quote_fields(parse_fund_payload(raw)) == case['quote']
+
+
+def test_sina_symbol_does_not_match_prefix_of_other_symbol():
+    raw = read_corpus('sina_multi.txt')
+    assert parse_sina_symbol(raw, 'hf_G', '') is None
+    assert parse_sina_symbol(raw, 'GC', '') is None
+
+
+@pytest.mark.parametrize('name', ['sina_gold.txt', 'sina_multi.txt'])
+def test_sina_fuzz_never_raises(name):
+    for data in mutations(read_corpus(name)):
+        for symbol in ('hf_GC', 'hf_SI'):
+            quote = parse_sina_symbol(data, symbol, '国际黄金')
+            assert quote is None or isinstance(quote, MetalQuote)
+
+
+def test_fund_fuzz_raises_only_parse_error():
+    for data in mutations(read_corpus('fund_valid.txt')):
+        try:
+            parse_fund_payload(data)
+        except QuoteParseError:
+            pass
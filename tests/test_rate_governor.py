@@ -0,0 +1,81 @@
+import pytest
+
+from modules.rate_governor import RateGovernor, RateLimitExceeded, parse_limit
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeClient:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.urls = []
+
+    def get(self, url, **kwargs):
+        self.urls.append(url)
+        return FakeResponse(self.status_code)
+
+
+@pytest.mark.parametrize('value, expected', [('2/4', (2.0, 4)), ('0.5/1', (0.5, 1)), ('3', (3.0, 3)), ('0.2', (0.2, 1))])
+def test_parse_limit(value, expected):
+    assert parse_limit(value) == expected
+
+
+@pytest.mark.parametrize('value', ['fast', '0/1', '1/0', '-1/2'])
+def test_parse_limit_rejects_invalid(value):
+    with pytest.raises(Exception):
+        parse_limit(value)
+
+
+def test_bucket_allows_burst_then_refills(tmp_path):
+    bucket = RateGovernor(str(tmp_path), {'example.com': (2.0, 3)}).bucket('example.com')
+    now = 1000.0
+
+    assert [bucket.try_acquire(now) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire(now) == pytest.approx(0.5)
+    assert bucket.try_acquire(now + 0.5) == 0.0
+    # 空闲再久也只能补满到突发上限
+    assert [bucket.try_acquire(now + 100) for _ in range(4)][-1] > 0
+
+
+def test_buckets_are_shared_through_state_files(tmp_path):
+    first = RateGovernor(str(tmp_path), {'example.com': (1.0, 2)}).bucket('example.com')
+    second = RateGovernor(str(tmp_path), {'example.com': (1.0, 2)}).bucket('example.com')
+    now = 1000.0
+
+    assert first.try_acquire(now) == 0.0
+    assert second.try_acquire(now) == 0.0
+    assert first.try_acquire(now) > 0
+    assert second.try_acquire(now) > 0
+
+
+def test_acquire_sheds_when_wait_exceeds_limit(tmp_path):
+    governor = RateGovernor(str(tmp_path), {'example.com': (0.1, 1)}, max_wait=0.05)
+
+    assert governor.acquire('example.com') == 0.0
+    with pytest.raises(RateLimitExceeded):
+        governor.acquire('example.com')
+
+    usage = governor.usage()['example.com']
+    assert (usage['granted'], usage['shed']) == (1, 1)
+
+
+def test_throttled_response_penalizes_host(tmp_path):
+    governor = RateGovernor(str(tmp_path), {'example.com': (10.0, 10)}, max_wait=0.05)
+    client = FakeClient(429)
+
+    assert governor.get(client, 'https://EXAMPLE.com/quote').status_code == 429
+    assert client.urls == ['https://EXAMPLE.com/quote']
+    with pytest.raises(RateLimitExceeded):
+        governor.get(client, 'https://example.com/quote')
+    assert len(client.urls) == 1
+    assert governor.usage()['example.com']['tokens_available'] < 0
+
+
+def test_unknown_hosts_use_default_limit(tmp_path):
+    governor = RateGovernor(str(tmp_path), default_limit=(3.0, 6))
+    bucket = governor.bucket('other.example')
+    assert (bucket.rate, bucket.burst) == (3.0, 6)
+    assert 'hq.sinajs.cn' in governor.usage()
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from modules.columnar_history import ColumnarHistory
+from modules.history_store import HistoryStore
+from modules.retention import RAW_RESOLUTION, RetentionEngine, RetentionPolicy, RetentionTier, parse_duration
+
+
+@pytest.mark.parametrize('value, expected', [('90', 90), ('5m', 300), ('48h', 172800), ('1.5d', 129600), ('2w', 1209600)])
+def test_parse_duration(value, expected):
+    assert parse_duration(value) == expected
+
+
+@pytest.mark.parametrize('value', ['', 'abc', '5x'])
+def test_parse_duration_rejects_garbage(value):
+    with pytest.raises(Exception):
+        parse_duration(value)
+
+
+def test_parse_default_style_spec():
+    policy = RetentionPolicy.parse(' raw:48h, 5m:90d ,, 1d:forever', compaction_interval=60)
+    assert policy.tiers == [
+        RetentionTier(RAW_RESOLUTION, 172800),
+        RetentionTier(300, 7776000),
+        RetentionTier(86400, None),
+    ]
+    assert policy.raw_window == 172800
+    assert policy.compaction_interval == 60
+
+
+def test_parse_blank_max_age_keeps_forever():
+    assert RetentionPolicy.parse('raw:1h, 1h:').tiers[-1].max_age is None
+
+
+@pytest.mark.parametrize('spec', [
+    '5m:1d',
+    'raw, 5m:1d',
+    'raw:1d, 5m:1d',
+    'raw:1h, 5m:1d, 1m:30d',
+    'raw:1h, 5m:1d, 7m:30d',
+    'raw:1h, 5m:1d, 1h:12h',
+])
+def test_parse_rejects_invalid_tiers(spec):
+    with pytest.raises(Exception):
+        RetentionPolicy.parse(spec)
+
+
+def test_cutoffs_align_to_target_buckets():
+    policy = RetentionPolicy.parse('raw:1h, 5m:1d, 1h:forever')
+    now = 1700000123.0
+    steps = policy.cutoffs(now)
+    assert [(tier.resolution, target.resolution) for tier, target, _ in steps] == [(0, 300), (300, 3600)]
+    assert steps[0][2] == (now - 3600) - (now - 3600) % 300
+    assert steps[1][2] == (now - 86400) - (now - 86400) % 3600
+
+
+def build_engine(tmp_path, spec='raw:1h, 5m:1d, 1h:forever', interval=300):
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    columnar = ColumnarHistory(str(tmp_path / 'columnar'))
+    return RetentionEngine(store, RetentionPolicy.parse(spec, interval), columnar), store, columnar
+
+
+def test_run_compacts_store_and_keeps_columnar_in_sync(tmp_path):
+    engine, store, columnar = build_engine(tmp_path)
+    now = 1700000000.0
+    rows = [('gold', now - 3 * 3600 + i * 60, 2000.0 + i, 0.5) for i in range(180)]
+    store.insert_quotes(rows)
+    columnar.append_rows(rows)
+
+    stats = engine.run(now)
+
+    assert stats['raw'] == 1
+    cutoff = engine.policy.cutoffs(now)[0][2]
+    assert all(ts >= cutoff for ts, _, _ in store.query_quotes('gold'))
+    assert list(columnar.series('gold').iter_points()) == store.query_series('gold')
+
+    # 再次执行时没有新的过期数据，列式文件保持不变
+    engine.run(now + 60)
+    assert list(columnar.series('gold').iter_points()) == store.query_series('gold')
+
+
+def test_maybe_run_respects_interval_shared_between_engines(tmp_path):
+    first, store, _ = build_engine(tmp_path)
+    second = RetentionEngine(store, first.policy)
+    now = time.time()
+
+    assert first.maybe_run(now) is not None
+    assert second.maybe_run(now + 1) is None
+    assert first.maybe_run(now + 1) is None
+    assert second.maybe_run(now + first.policy.compaction_interval + 1) is not None
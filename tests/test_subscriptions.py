@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from modules.subscriptions import SubscriptionIndex, UserWatchlists, normalize_user
+
+
+def test_index_counts_subscribers_per_code():
+    index = SubscriptionIndex()
+    index.apply('alice', ['110007', '000001'])
+    index.apply('bob', ['110007'])
+    index.apply('bob', ['110007'])
+
+    assert index.codes() == ('000001', '110007')
+    assert index.subscriber_count('110007') == 2
+    assert index.counts() == {'110007': 2, '000001': 1}
+
+
+def test_index_drops_code_after_last_subscriber():
+    index = SubscriptionIndex()
+    index.apply('alice', ['110007'])
+    index.apply('bob', ['110007'])
+
+    index.apply('alice', removed=['110007'])
+    assert index.codes() == ('110007',)
+    index.apply('alice', removed=['110007'])
+    assert index.subscriber_count('110007') == 1
+    index.apply('bob', removed=['110007', '000001'])
+    assert index.codes() == ()
+
+
+@pytest.mark.parametrize('user_id', ['', None, '..', '.hidden', 'a/b', 'x' * 65])
+def test_normalize_user_rejects_unsafe_ids(user_id):
+    with pytest.raises(ValueError):
+        normalize_user(user_id)
+
+
+def test_watchlists_update_index_and_reject_bad_codes(tmp_path):
+    watchlists = UserWatchlists(str(tmp_path))
+
+    assert watchlists.update('alice', ['110007', '000001']) == (['110007', '000001'], [])
+    watchlists.update('bob', ['110007'])
+    with pytest.raises(ValueError):
+        watchlists.update('bob', ['1100'])
+
+    assert watchlists.get('alice') == ['110007', '000001']
+    assert watchlists.poll_codes() == ('000001', '110007')
+    assert watchlists.stats()['subscriptions'] == 3
+
+
+def test_refresh_picks_up_other_workers_and_deleted_files(tmp_path):
+    writer = UserWatchlists(str(tmp_path))
+    reader = UserWatchlists(str(tmp_path), refresh_interval=0)
+    writer.update('alice', ['110007'])
+    writer.update('bob', ['000001'])
+
+    assert reader.poll_codes() == ('000001', '110007')
+
+    os.remove(os.path.join(str(tmp_path), 'bob.txt'))
+    assert reader.poll_codes() == ('110007',)
+    assert reader.stats()['users'] == 1
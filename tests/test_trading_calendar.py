@@ -0,0 +1,84 @@
+from datetime import date, datetime
+
+import pytest
+
+from modules.trading_calendar import PollScheduler, build_calendars, load_holidays
+
+
+class RecordingLogger:
+    def __init__(self):
+        self.errors = []
+
+    def log_error(self, message):
+        self.errors.append(message)
+
+
+def at(calendar, *args) -> float:
+    return datetime(*args, tzinfo=calendar.tz).timestamp()
+
+
+@pytest.fixture
+def calendars():
+    # 2024-01-08 为周一
+    return build_calendars({'cn': {date(2024, 1, 10)}})
+
+
+def test_cn_sessions_and_lunch_break(calendars):
+    funds = calendars['funds']
+    assert funds.current_session(at(funds, 2024, 1, 8, 10, 0)) == (at(funds, 2024, 1, 8, 9, 30), at(funds, 2024, 1, 8, 11, 30))
+    assert not funds.is_open(at(funds, 2024, 1, 8, 12, 0))
+    assert funds.next_open(at(funds, 2024, 1, 8, 12, 0)) == at(funds, 2024, 1, 8, 13, 0)
+    assert funds.last_close(at(funds, 2024, 1, 8, 12, 0)) == at(funds, 2024, 1, 8, 11, 30)
+
+
+def test_holidays_and_weekends_are_closed(calendars):
+    funds = calendars['funds']
+    assert not funds.is_open(at(funds, 2024, 1, 10, 10, 0))
+    assert funds.next_open(at(funds, 2024, 1, 9, 16, 0)) == at(funds, 2024, 1, 11, 9, 30)
+    assert funds.next_open(at(funds, 2024, 1, 13, 10, 0)) == at(funds, 2024, 1, 15, 9, 30)
+
+
+def test_comex_sessions_merge_across_midnight(calendars):
+    metals = calendars['metals']
+    assert metals.current_session(at(metals, 2024, 1, 8, 23, 0)) == (at(metals, 2024, 1, 8, 18, 0), at(metals, 2024, 1, 9, 17, 0))
+    assert not metals.is_open(at(metals, 2024, 1, 9, 17, 30))
+    assert not metals.is_open(at(metals, 2024, 1, 13, 12, 0))
+    assert metals.next_open(at(metals, 2024, 1, 13, 12, 0)) == at(metals, 2024, 1, 14, 18, 0)
+
+
+def test_load_holidays_expands_ranges_and_skips_bad_lines(tmp_path):
+    path = tmp_path / 'holidays.txt'
+    path.write_text('\n'.join([
+        '# 春节',
+        'CN 2024-02-09~2024-02-12  # 含周末',
+        'comex 2024-01-15',
+        'cn 2024-13-01',
+        'cn 2024-05-05~2024-05-01',
+        'only-one-field',
+    ]), encoding='utf-8')
+    logger = RecordingLogger()
+
+    holidays = load_holidays(str(path), logger)
+
+    assert holidays == {
+        'cn': {date(2024, 2, 9), date(2024, 2, 10), date(2024, 2, 11), date(2024, 2, 12)},
+        'comex': {date(2024, 1, 15)},
+    }
+    assert len(logger.errors) == 3
+    assert '第 4 行' in logger.errors[0]
+
+
+def test_load_holidays_missing_file(tmp_path):
+    assert load_holidays(str(tmp_path / 'missing.txt'), RecordingLogger()) == {}
+
+
+def test_poll_scheduler_tightens_near_edges_and_sleeps_when_closed(calendars):
+    scheduler = PollScheduler(calendars, {'metals': 60, 'funds': 3600}, {'funds': 30}, edge_window=900, jitter=0)
+    funds = calendars['funds']
+
+    assert scheduler.poll_interval('funds', at(funds, 2024, 1, 8, 9, 35)) == 30
+    # 盘中的长间隔不会越过收盘前的加密窗口
+    assert scheduler.poll_interval('funds', at(funds, 2024, 1, 8, 10, 0)) == 3600
+    assert scheduler.poll_interval('funds', at(funds, 2024, 1, 8, 10, 30)) == 45 * 60
+    assert scheduler.poll_interval('funds', at(funds, 2024, 1, 8, 12, 0)) is None
+    assert scheduler.next_poll_at('funds', at(funds, 2024, 1, 8, 12, 0)) == at(funds, 2024, 1, 8, 13, 0)
@@ -0,0 +1,65 @@
+import pytest
+
+from modules.data_processor import is_fund_code
+from modules.watchlist_store import WatchlistStore
+
+
+HEADER = '# 基金代码列表\n'
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = WatchlistStore(str(tmp_path / 'fund_list.txt'), HEADER, is_fund_code)
+    store.load()
+    return store
+
+
+def read_lines(store):
+    with open(store.path, 'r', encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def test_load_creates_file_with_header(store):
+    assert read_lines(store) == ['# 基金代码列表']
+    assert store.entries == []
+
+
+def test_update_appends_and_rewrites(store):
+    assert store.update(['110007', ' 000001 ', '110007']) == (['110007', '000001'], [])
+    assert read_lines(store) == ['# 基金代码列表', '110007', '000001']
+    assert '000001' in store and len(store) == 2
+
+    assert store.update('161725', remove=['110007', '999999']) == (['161725'], ['110007'])
+    assert read_lines(store) == ['# 基金代码列表', '000001', '161725']
+
+
+def test_update_rejects_invalid_codes_without_writing(store):
+    with pytest.raises(ValueError):
+        store.update(['110007', '12345', 'abcdef'])
+    assert store.entries == []
+    assert read_lines(store) == ['# 基金代码列表']
+
+
+def test_load_skips_comments_and_invalid_lines(tmp_path):
+    path = tmp_path / 'fund_list.txt'
+    path.write_text('# 注释\n110007\n\nbad-code\n1100071\n000001\n110007\n', encoding='utf-8')
+    store = WatchlistStore(str(path), HEADER, is_fund_code)
+
+    assert store.load() is True
+    assert store.entries == ['110007', '000001']
+    assert store.load() is False
+
+
+def test_update_merges_changes_from_other_writers(tmp_path):
+    path = str(tmp_path / 'fund_list.txt')
+    first = WatchlistStore(path, HEADER, is_fund_code)
+    second = WatchlistStore(path, HEADER, is_fund_code)
+    first.load()
+    second.load()
+
+    first.update(['110007'])
+    second.update(['000001'])
+
+    assert second.entries == ['110007', '000001']
+    assert first.load() is True
+    assert first.entries == ['110007', '000001']